@@ -12,7 +12,8 @@ load("conda")
 local rocoto_path="/Users/username/rocoto"
 prepend_path("PATH", pathJoin(rocoto_path,"bin"))
 
--- add fake slurm commands
+-- add fake slurm commands, which run jobs through ush/local_batch.py
+-- on at most LOCAL_BATCH_CORES cores (all cores if not set)
 local srw_path="/Users/username/ufs-srweather-app"
 prepend_path("PATH", pathJoin(srw_path, "ush/rocoto_fake_slurm"))
 
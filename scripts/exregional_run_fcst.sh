@@ -587,7 +587,14 @@ fi
 #
 #-----------------------------------------------------------------------
 #
-if ([ "$STOCH" == "TRUE" ] && [ $(boolify "${DO_ENSEMBLE}") = "TRUE" ]); then
+# If the namelists of all members were pregenerated along with the
+# experiment, only copy this member's namelist.
+#
+ens_stoch_nml_fp="${EXPTDIR}/ens_stoch_nml/${FV3_NML_FN}.${CDATE}.mem${ENSMEM_INDX}"
+if ([ "$STOCH" == "TRUE" ] && [ $(boolify "${DO_ENSEMBLE}") = "TRUE" ] && \
+    [ -f "${ens_stoch_nml_fp}" ]); then
+  cp ${ens_stoch_nml_fp} ${DATA}/${FV3_NML_FN}
+elif ([ "$STOCH" == "TRUE" ] && [ $(boolify "${DO_ENSEMBLE}") = "TRUE" ]); then
   python3 $USHdir/set_fv3nml_ens_stoch_seeds.py \
       --path-to-defns ${GLOBAL_VAR_DEFNS_FP} \
       --cdate "$CDATE" || print_err_msg_exit "\
@@ -761,9 +768,16 @@ fi
 #
 #-----------------------------------------------------------------------
 #
-python3 $USHdir/create_diag_table_file.py \
-  --path-to-defns ${GLOBAL_VAR_DEFNS_FP} \
-  --run-dir "${DATA}"
+# Copy the file if it was rendered when the experiment was generated.
+#
+prerendered_fp="${EXPTDIR}/prerendered/${CDATE}/${DIAG_TABLE_FN}"
+if [ -f "${prerendered_fp}" ]; then
+  cp "${prerendered_fp}" "${DATA}/${DIAG_TABLE_FN}"
+else
+  python3 $USHdir/create_diag_table_file.py \
+    --path-to-defns ${GLOBAL_VAR_DEFNS_FP} \
+    --run-dir "${DATA}"
+fi
 export err=$?
 if [ $err -ne 0 ]; then
   message_txt="Call to function to create a diag table file for the current 
@@ -795,9 +809,16 @@ fi
 #
 #-----------------------------------------------------------------------
 #
-python3 $USHdir/create_ufs_configure_file.py \
-  --path-to-defns ${GLOBAL_VAR_DEFNS_FP} \
-  --run-dir "${DATA}"
+# Copy the file if it was rendered when the experiment was generated.
+#
+prerendered_fp="${EXPTDIR}/prerendered/${UFS_CONFIG_FN}"
+if [ -f "${prerendered_fp}" ]; then
+  cp "${prerendered_fp}" "${DATA}/${UFS_CONFIG_FN}"
+else
+  python3 $USHdir/create_ufs_configure_file.py \
+    --path-to-defns ${GLOBAL_VAR_DEFNS_FP} \
+    --run-dir "${DATA}"
+fi
 export err=$?
 if [ $err -ne 0 ]; then
   message_txt="Call to function to create a NEMS configuration file for 
@@ -1,16 +1,17 @@
 #!/usr/bin/env python3
 
+import os
 import sys
 import argparse
 import logging
 
 sys.path.append("../../ush")
 
-from python_utils import load_config_file
-
 from check_python_version import check_python_version
+from runtime_history import DEFAULT_HISTORY_DB, WE2E_HISTORY_DB, RuntimeHistory, record_experiment
 
-from utils import calculate_core_hours, create_expts_dict, print_WE2E_summary, write_monitor_file
+from utils import calculate_core_hours, create_expts_dict, print_WE2E_summary, write_monitor_file,\
+                  load_monitor_file
 
 def setup_logging(debug: bool = False) -> None:
     """
@@ -48,6 +49,11 @@ if __name__ == "__main__":
                           'subdirectories with UFS SRW App experiments in them')
     parser.add_argument('-d', '--debug', action='store_true',
                         help='Script will be run in debug mode with more verbose output')
+    parser.add_argument('--history_db', type=str, nargs='?', const=DEFAULT_HISTORY_DB,
+                        default=WE2E_HISTORY_DB,
+                        help='Record the jobs of the experiments in this runtime history '\
+                             f'database ({DEFAULT_HISTORY_DB} if no path is given); by default, '\
+                             'no history is kept unless SRW_RUNTIME_HISTORY_DB is set')
 
     args = parser.parse_args()
 
@@ -59,7 +65,7 @@ if __name__ == "__main__":
     if args.expt_dir:
         yaml_file, expts_dict = create_expts_dict(args.expt_dir)
     elif args.yaml_file:
-        expts_dict = load_config_file(args.yaml_file)
+        expts_dict = load_monitor_file(args.yaml_file)
     else:
         raise ValueError(f'Bad arguments; run {__file__} -h for more information')
 
@@ -67,5 +73,19 @@ if __name__ == "__main__":
     expts_dict = calculate_core_hours(expts_dict)
     write_monitor_file(yaml_file,expts_dict)
 
+    # Record the jobs of the experiments in the runtime history
+    if args.history_db:
+        with RuntimeHistory(args.history_db) as history:
+            for expt, info in expts_dict.items():
+                if info["status"] == "ERROR":
+                    continue
+                try:
+                    record_experiment(history, info['expt_dir'],
+                                      test=os.path.basename(info['expt_dir']),
+                                      status=info["status"])
+                except Exception as e:
+                    logging.warning(f"Could not record experiment {expt} in the runtime "\
+                                    f"history: {e}")
+
     #Call function to print summary
     print_WE2E_summary(expts_dict, args.debug)
@@ -1,23 +1,28 @@
 #!/usr/bin/env python3
 
+import os
 import sys
+import sqlite3
 import argparse
 import logging
 import time
 from textwrap import dedent
 from datetime import datetime
+from multiprocessing import Pool
 
 sys.path.append("../../ush")
 
-from python_utils import load_config_file
-
 from check_python_version import check_python_version
+from runtime_history import DEFAULT_HISTORY_DB, WE2E_HISTORY_DB, RuntimeHistory, record_experiment
 
-from utils import calculate_core_hours, write_monitor_file, update_expt_status,\
-                  update_expt_status_parallel, print_WE2E_summary
+from utils import calculate_core_hours, write_monitor_file, load_monitor_file, update_expt_status,\
+                  update_expt_status_parallel, print_WE2E_summary, PollScheduler, MonitorStore,\
+                  AdmissionScheduler, estimate_expt_demand, QueueWaitTracker
 
 def monitor_jobs(expts_dict: dict, monitor_file: str = '', procs: int = 1,
-                 mode: str = 'continuous', debug: bool = False) -> str:
+                 mode: str = 'continuous', debug: bool = False, poll_interval: float = 5,
+                 max_poll_interval: float = 120, max_nodes: int = None,
+                 max_core_hours: float = None, history_db: str = '') -> str:
     """Function to monitor and run jobs for the specified experiment using Rocoto
 
     Args:
@@ -28,6 +33,16 @@ def monitor_jobs(expts_dict: dict, monitor_file: str = '', procs: int = 1,
                             continuous (default): monitor jobs continuously until complete
                             advance: increment jobs once, then quit
         debug       (bool): [optional] Enable extra output for debugging
+        poll_interval     (float): [optional] Shortest time between updates of an experiment,
+                                   in seconds
+        max_poll_interval (float): [optional] Longest time between updates of an experiment
+                                   whose jobs are not changing state, in seconds
+        max_nodes           (int): [optional] Budget of nodes for the running experiments;
+                                   further experiments are started as running ones finish
+        max_core_hours    (float): [optional] Budget of estimated core-hours for the running
+                                   experiments
+        history_db          (str): [optional] Runtime history database in which finished
+                                   experiments are recorded; no history is kept if empty
 
     Returns:
         str: The name of the file used for job monitoring (when script is finished, this
@@ -40,7 +55,9 @@ def monitor_jobs(expts_dict: dict, monitor_file: str = '', procs: int = 1,
         monitor_file = f'WE2E_tests_{monitor_start_string}.yaml'
     logging.info(f"Writing information for all experiments to {monitor_file}")
 
-    write_monitor_file(monitor_file,expts_dict)
+    # Between full writes of monitor_file, changes are appended to a journal next to it
+    store = MonitorStore(monitor_file)
+    store.compact(expts_dict)
 
     # Perform initial setup for each experiment
     logging.info("Checking tests available for monitoring...")
@@ -55,76 +72,155 @@ def monitor_jobs(expts_dict: dict, monitor_file: str = '', procs: int = 1,
          else:
              dirlist.append(expts_dict[expt]['expt_dir'])
 
-    if procs > 1:
-        print(f'Starting experiments in parallel with {procs} processes')
-        expts_dict = update_expt_status_parallel(expts_dict, procs, True, debug)
+    # The runtimes of the jobs of finished experiments are kept in the runtime history
+    history = None
+    if history_db:
+        try:
+            history = RuntimeHistory(history_db)
+        except (sqlite3.Error, OSError) as e:
+            logging.warning(f"Could not open runtime history {history_db}: {e}")
+    queue_waits = QueueWaitTracker()
+
+    def record_history(expt):
+        if history is None or expts_dict[expt]["status"] == "ERROR":
+            return
+        try:
+            record_experiment(history, expts_dict[expt]['expt_dir'],
+                              test=os.path.basename(expts_dict[expt]['expt_dir']),
+                              status=expts_dict[expt]["status"],
+                              queue_waits=queue_waits.queue_waits(expt, expts_dict[expt]))
+        except Exception as e:
+            logging.warning(f"Could not record experiment {expt} in the runtime history: {e}")
+
+    # With a budget, experiments are started as their estimated demand fits, longest first;
+    # experiments that were started by an earlier run of this script count against the budget
+    admission = None
+    if max_nodes or max_core_hours:
+        walltimes = history.experiment_walltimes() if history else {}
+        demands = {expt: estimate_expt_demand(expts_dict[expt]['expt_dir'], walltimes)
+                   for expt in expts_dict}
+        already_started = [expt for expt in expts_dict if expts_dict[expt]['status'] != 'CREATED'
+                           or os.path.exists(f"{expts_dict[expt]['expt_dir']}/FV3LAM_wflow.db")]
+        admission = AdmissionScheduler(demands, max_nodes, max_core_hours, already_started)
+        admission.admit()
+        started = [expt for expt in expts_dict if expt in admission.admitted]
+        logging.info(f'Starting {len(started)} of {len(expts_dict)} experiments; the others will '\
+                     'be started as running experiments finish')
     else:
-        for expt in expts_dict:
-            logging.info(f"Starting experiment {expt} running")
-            expts_dict[expt] = update_expt_status(expts_dict[expt], expt, True, debug)
+        started = list(expts_dict)
 
-    write_monitor_file(monitor_file,expts_dict)
-
-    if mode != 'continuous':
-        logging.debug("All experiments have been updated")
-        return monitor_file
-    else:
-        logging.debug("Continuous mode: will monitor jobs until all are complete")
-
-    logging.info(f'Setup complete; monitoring {len(expts_dict)} experiments')
-    logging.info('Use ctrl-c to pause job submission/monitoring')
-
-    #Make a copy of experiment dictionary; will use this copy to monitor active experiments
-    running_expts = expts_dict.copy()
-
-    i = 0
-    while running_expts:
-        i += 1
-        if procs > 1:
-            expts_dict = update_expt_status_parallel(expts_dict, procs)
+    # Worker processes are kept for the whole monitoring run rather than started for every loop
+    pool = Pool(processes=procs) if procs > 1 else None
+    try:
+        def start_expts(names):
+            for expt in names:
+                queue_waits.observe(expt, expts_dict[expt])
+            if procs > 1:
+                print(f'Starting experiments in parallel with {procs} processes')
+                expts_dict.update(update_expt_status_parallel(
+                    {expt: expts_dict[expt] for expt in names}, procs, True, debug, pool=pool))
+            else:
+                for expt in names:
+                    logging.info(f"Starting experiment {expt} running")
+                    expts_dict[expt] = update_expt_status(expts_dict[expt], expt, True, debug)
+            for expt in names:
+                queue_waits.observe(expt, expts_dict[expt])
+
+        start_expts(started)
+
+        store.update(expts_dict)
+
+        if mode != 'continuous':
+            logging.debug("All experiments have been updated")
+            return monitor_file
         else:
-            for expt in running_expts.copy():
-                expts_dict[expt] = update_expt_status(expts_dict[expt], expt)
-
-        for expt in running_expts.copy():
-            running_expts[expt] = expts_dict[expt]
-            if running_expts[expt]["status"] in ['DEAD','ERROR','COMPLETE']:
-                # If start_time is in dictionary, compute total walltime
-                walltimestr = ''
-                if running_expts[expt].get("start_time",{}) and not running_expts[expt].get("walltime",{}):
-                    end = datetime.now()
-                    start = datetime.strptime(running_expts[expt]["start_time"],'%Y%m%d%H%M%S')
-                    walltime = end - start
-                    walltimestr = f'Took {str(walltime)}; '
-                    running_expts[expt]["walltime"] = str(walltime)
-
-                logging.info(f'Experiment {expt} is {running_expts[expt]["status"]}')
-
-                # If failures, check how many experiments were successful
-                if debug:
-                    if running_expts[expt]["status"] != "COMPLETE":
-                        i=j=0
-                        for task in running_expts[expt]:
-                            # Skip non-task entries
-                            if task in ["expt_dir","status","start_time","walltime"]:
-                                continue
-                            j+=1
-                            if running_expts[expt][task]["status"] == "SUCCEEDED":
-                                i+=1
-                        logging.debug(f'{i} of {j} tasks were successful')
-                logging.info(f'{walltimestr}will no longer monitor.')
-                running_expts.pop(expt)
-                continue
-            logging.debug(f'Experiment {expt} status is {expts_dict[expt]["status"]}')
-
-        write_monitor_file(monitor_file,expts_dict)
-        endtime = datetime.now()
-        total_walltime = endtime - monitor_start
-
-        logging.debug(f"Finished loop {i}")
-        logging.debug(f"Walltime so far is {str(total_walltime)}")
-        #Slow things down just a tad between loops so experiments behave better
-        time.sleep(5)
+            logging.debug("Continuous mode: will monitor jobs until all are complete")
+
+        logging.info(f'Setup complete; monitoring {len(expts_dict)} experiments')
+        logging.info('Use ctrl-c to pause job submission/monitoring')
+
+        #Make a copy of experiment dictionary; will use this copy to monitor active experiments
+        running_expts = {expt: expts_dict[expt] for expt in started}
+
+        # Experiments that are waiting in the queue are polled less often, so that rocotorun is
+        # mostly called for experiments that are making progress
+        scheduler = PollScheduler(poll_interval, max_poll_interval)
+        i = 0
+        while running_expts or (admission and admission.pending):
+            i += 1
+            if admission:
+                admitted = admission.admit()
+                if admitted:
+                    start_expts(admitted)
+                    for expt in admitted:
+                        scheduler.record(expt, expts_dict[expt])
+                        running_expts[expt] = expts_dict[expt]
+                    store.update(expts_dict, admitted)
+            due = scheduler.due(running_expts)
+            if procs > 1 and due:
+                expts_dict.update(update_expt_status_parallel(
+                    {expt: expts_dict[expt] for expt in due}, procs, pool=pool))
+            else:
+                for expt in due:
+                    expts_dict[expt] = update_expt_status(expts_dict[expt], expt)
+
+            for expt in due:
+                scheduler.record(expt, expts_dict[expt])
+                queue_waits.observe(expt, expts_dict[expt])
+                running_expts[expt] = expts_dict[expt]
+                if running_expts[expt]["status"] in ['DEAD','ERROR','COMPLETE']:
+                    # If start_time is in dictionary, compute total walltime
+                    walltimestr = ''
+                    if running_expts[expt].get("start_time",{}) and not running_expts[expt].get("walltime",{}):
+                        end = datetime.now()
+                        start = datetime.strptime(running_expts[expt]["start_time"],'%Y%m%d%H%M%S')
+                        walltime = end - start
+                        walltimestr = f'Took {str(walltime)}; '
+                        running_expts[expt]["walltime"] = str(walltime)
+
+                    logging.info(f'Experiment {expt} is {running_expts[expt]["status"]}')
+
+                    # If failures, check how many experiments were successful
+                    if debug:
+                        if running_expts[expt]["status"] != "COMPLETE":
+                            i=j=0
+                            for task in running_expts[expt]:
+                                # Skip non-task entries
+                                if task in ["expt_dir","status","start_time","walltime"]:
+                                    continue
+                                j+=1
+                                if running_expts[expt][task]["status"] == "SUCCEEDED":
+                                    i+=1
+                            logging.debug(f'{i} of {j} tasks were successful')
+                    logging.info(f'{walltimestr}will no longer monitor.')
+                    running_expts.pop(expt)
+                    record_history(expt)
+                    if admission:
+                        admission.release(expt)
+                    continue
+                logging.debug(f'Experiment {expt} status is {expts_dict[expt]["status"]}')
+
+            store.update(expts_dict, due)
+            endtime = datetime.now()
+            total_walltime = endtime - monitor_start
+
+            logging.debug(f"Finished loop {i}; updated {len(due)} experiments, "\
+                          f"{len(running_expts)} still running"\
+                          f"{f', {len(admission.pending)} waiting' if admission else ''}")
+            logging.debug(f"Walltime so far is {str(total_walltime)}")
+            # Wait until the next experiment is due, but never spin
+            time.sleep(max(scheduler.wait_time(running_expts), 1))
+    except BaseException:
+        # Do not wait for the updates in progress, e.g. on ctrl-c
+        if pool:
+            pool.terminate()
+        raise
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+        if history:
+            history.close()
 
     logging.info(f'All {len(expts_dict)} experiments finished')
     logging.info('Calculating core-hour usage and printing final summary')
@@ -139,6 +235,35 @@ def monitor_jobs(expts_dict: dict, monitor_file: str = '', procs: int = 1,
     return monitor_file
 
 
+def resume_command(yaml_file: str, procs: int = 1, poll_interval: float = 5,
+                   max_poll_interval: float = 120, max_nodes: int = None,
+                   max_core_hours: float = None, history_db: str = WE2E_HISTORY_DB,
+                   script: str = "./monitor_jobs.py") -> str:
+    """The monitor_jobs.py command that resumes monitoring with the same settings, so that a
+    resumed run keeps the node and core-hour budget and the poll intervals in effect
+
+    Args:
+        yaml_file (str): The monitor file
+        script    (str): [optional] How to call this script
+        others:          As for monitor_jobs(); settings left at their default are not given
+
+    Returns:
+        str: The command
+    """
+    cmd = f"{script} -y={yaml_file} -p={procs}"
+    if poll_interval != 5:
+        cmd += f" --poll_interval={poll_interval}"
+    if max_poll_interval != 120:
+        cmd += f" --max_poll_interval={max_poll_interval}"
+    if max_nodes:
+        cmd += f" --max_nodes={max_nodes}"
+    if max_core_hours:
+        cmd += f" --max_core_hours={max_core_hours}"
+    if history_db != WE2E_HISTORY_DB:
+        cmd += f" --history_db='{history_db}'"
+    return cmd
+
+
 def setup_logging(logfile: str = "log.run_WE2E_tests", debug: bool = False) -> None:
     """
     Sets up logging, printing high-priority (INFO and higher) messages to screen, and printing all
@@ -188,13 +313,38 @@ if __name__ == "__main__":
     parser.add_argument('-d', '--debug', action='store_true',
                         help='Script will be run in debug mode with more verbose output. ' +
                              'WARNING: increased verbosity may run very slow on some platforms')
+    parser.add_argument('--poll_interval', type=float, default=5,
+                        help='Shortest time in seconds between updates (calls to rocotorun) of '\
+                             'an experiment')
+    parser.add_argument('--max_poll_interval', type=float, default=120,
+                        help='Longest time in seconds between updates of an experiment whose '\
+                             'jobs are not changing state, e.g. waiting in the queue')
+    parser.add_argument('--max_nodes', type=int,
+                        help='Budget of nodes for running experiments, estimated from the '\
+                             'resources of their tasks; the longest experiments are started '\
+                             'first, and the others as running experiments finish')
+    parser.add_argument('--max_core_hours', type=float,
+                        help='Budget of estimated core-hours for running experiments')
+    parser.add_argument('--history_db', type=str, nargs='?', const=DEFAULT_HISTORY_DB,
+                        default=WE2E_HISTORY_DB,
+                        help='Record the jobs of finished experiments in this runtime history '\
+                             f'database ({DEFAULT_HISTORY_DB} if no path is given); by default, '\
+                             'no history is kept unless SRW_RUNTIME_HISTORY_DB is set')
+    parser.add_argument('-e', '--export', action='store_true',
+                        help='Write the complete yaml file, including the changes recorded in '\
+                             'its journal file, and exit without monitoring')
 
     args = parser.parse_args()
 
     setup_logging(logfile,args.debug)
 
     logging.debug(f"Loading configure file {args.yaml_file}")
-    expts_dict = load_config_file(args.yaml_file)
+    expts_dict = load_monitor_file(args.yaml_file)
+
+    if args.export:
+        write_monitor_file(args.yaml_file,expts_dict)
+        logging.info(f"Wrote {args.yaml_file}")
+        sys.exit(0)
 
     if args.procs < 1:
         raise ValueError('You can not have less than one parallel process; select a valid value for --procs')
@@ -203,10 +353,14 @@ if __name__ == "__main__":
 
     try:
         monitor_jobs(expts_dict=expts_dict,monitor_file=args.yaml_file,procs=args.procs,
-                     mode=args.mode,debug=args.debug)
+                     mode=args.mode,debug=args.debug,poll_interval=args.poll_interval,
+                     max_poll_interval=args.max_poll_interval,max_nodes=args.max_nodes,
+                     max_core_hours=args.max_core_hours,history_db=args.history_db)
     except KeyboardInterrupt:
         logging.info("\n\nUser interrupted monitor script; to resume monitoring jobs run:\n")
-        logging.info(f"{__file__} -y={args.yaml_file} -p={args.procs}\n")
+        logging.info(resume_command(args.yaml_file, args.procs, args.poll_interval,
+                                    args.max_poll_interval, args.max_nodes, args.max_core_hours,
+                                    args.history_db, script=__file__) + "\n")
     except:
         logging.exception(
             dedent(
@@ -7,6 +7,7 @@ import argparse
 import logging
 from textwrap import dedent
 from datetime import datetime
+from multiprocessing import Pool
 
 sys.path.insert(1, "../../ush")
 
@@ -17,8 +18,10 @@ from python_utils import (
 )
 
 from check_python_version import check_python_version
+from check_param_vals import check_config_files
 
-from monitor_jobs import monitor_jobs, write_monitor_file
+from monitor_jobs import monitor_jobs, resume_command, write_monitor_file
+from runtime_history import DEFAULT_HISTORY_DB, WE2E_HISTORY_DB
 from utils import print_test_info
 
 def run_we2e_tests(homedir, args) -> None:
@@ -141,6 +144,14 @@ def run_we2e_tests(homedir, args) -> None:
     pretty_list = "\n".join(str(x) for x in tests_to_run)
     logging.info(f'Will run {len(tests_to_run)} tests:\n{pretty_list}')
 
+    # Catch invalid parameter values in all tests before generating any experiment
+    logging.info("Checking parameter values of all tests")
+    invalid_tests = check_config_files(tests_to_run, procs=args.procs)
+    if invalid_tests:
+        for test, msg in invalid_tests.items():
+            logging.error(f"Invalid parameter values in test file {test}:{msg}\n")
+        raise ValueError(f"{len(invalid_tests)} test(s) have invalid parameter values")
+
 
     config_default_file = os.path.join(ushdir,'config_defaults.yaml')
     logging.debug(f"Loading config defaults file {config_default_file}")
@@ -150,105 +161,58 @@ def run_we2e_tests(homedir, args) -> None:
     logging.debug(f"Loading machine defaults file {machine_file}")
     machine_defaults = load_config_file(machine_file)
 
-    # Set up dictionary for job monitoring yaml
-    if args.launch != "cron":
-        monitor_yaml = dict()
-
+    # Starting with each test yaml template, fill in user-specified and machine- and
+    # test-specific options to get the complete config for every test
+    test_cfgs = {}
     for test in tests_to_run:
-        #Starting with test yaml template, fill in user-specified and machine- and
-        # test-specific options, then write resulting complete config.yaml
-        starttime = datetime.now()
-        starttime_string = starttime.strftime("%Y%m%d%H%M%S")
         test_name = os.path.basename(test).split('.')[1]
-        logging.debug(f"For test {test_name}, constructing config.yaml")
-        test_cfg = load_config_file(test)
-
-        if test_cfg.get('user') is None:
-            test_cfg['user'] = {}
-        test_cfg['user'].update({"MACHINE": machine})
-        test_cfg['user'].update({"ACCOUNT": args.account})
-        if run_envir:
-            test_cfg['user'].update({"RUN_ENVIR": run_envir})
-        # if platform section was not in input config, initialize as empty dict
-        if 'platform' not in test_cfg:
-            test_cfg['platform'] = dict()
-        test_cfg['platform'].update({"BUILD_MOD_FN": args.modulefile})
-        test_cfg['workflow'].update({"COMPILER": args.compiler})
-        if args.expt_basedir:
-            test_cfg['workflow'].update({"EXPT_BASEDIR": args.expt_basedir})
-        test_cfg['workflow'].update({"EXPT_SUBDIR": test_name})
-        if args.exec_subdir:
-            test_cfg['workflow'].update({"EXEC_SUBDIR": args.exec_subdir})
-        if args.launch == "cron":
-            test_cfg['workflow'].update({"USE_CRON_TO_RELAUNCH": True})
-        if args.cron_relaunch_intvl_mnts:
-            test_cfg['workflow'].update({"CRON_RELAUNCH_INTVL_MNTS": args.cron_relaunch_intvl_mnts})
-        if args.debug_tests:
-            test_cfg['workflow'].update({"DEBUG": args.debug_tests})
-        if args.verbose_tests:
-            test_cfg['workflow'].update({"VERBOSE": args.verbose_tests})
-
-        logging.debug(f"Overwriting WE2E-test-specific settings for test \n{test_name}\n")
-
-        if 'task_get_extrn_ics' in test_cfg:
-            test_cfg['task_get_extrn_ics'] = check_task_get_extrn_bcs(test_cfg,machine_defaults,
-                                                                      config_defaults,"ics")
-        if 'task_get_extrn_lbcs' in test_cfg:
-            test_cfg['task_get_extrn_lbcs'] = check_task_get_extrn_bcs(test_cfg,machine_defaults,
-                                                                       config_defaults,"lbcs")
-
-        if 'verification' in test_cfg:
-            # This section checks if we are doing verification on a machine with staged verification
-            # obs. If so, and if the config file does not explicitly set the observation locations,
-            # fill these in with defaults from the machine files
-            obs_vars = ['CCPA_OBS_DIR','MRMS_OBS_DIR','NDAS_OBS_DIR','NOHRSC_OBS_DIR']
-            if 'platform' not in test_cfg:
-                test_cfg['platform'] = {}
-            for obvar in obs_vars:
-                mach_path = machine_defaults['platform'].get('TEST_'+obvar)
-                if not test_cfg['platform'].get(obvar) and mach_path:
-                    logging.debug(f'Setting {obvar} = {mach_path} from machine file')
-                    test_cfg['platform'][obvar] = mach_path
-
-        if args.compiler == "gnu":
-            # 2D decomposition doesn't work with GNU compilers.  Deactivate 2D decomposition for GNU
-            if 'task_run_post' in test_cfg:
-                test_cfg['task_run_post'].update({"NUMX": 1})
-                logging.info(f"NUMX has been reset to 1 due to issues encountered with GNU compilers")
-            if 'task_run_fcst' in test_cfg:
-                test_cfg['task_run_fcst'].update({"ITASKS": 1})
-                logging.info(f"ITASKS has been reset to 1 due to issues encountered with GNU compilers")
-
-        logging.debug(f"Writing updated config.yaml for test {test_name}\n"\
-                       "based on specified command-line arguments:\n")
-        logging.debug(cfg_to_yaml_str(test_cfg))
-        with open(os.path.join(ushdir,"config.yaml"),"w", encoding="utf-8") as f:
-            f.writelines(cfg_to_yaml_str(test_cfg))
-
-        logging.info(f"Calling workflow generation function for test {test_name}\n")
-        if args.quiet:
-            console_handler = logging.getLogger().handlers[1]
-            console_handler.setLevel(logging.WARNING)
-        expt_dir = generate_FV3LAM_wflow(ushdir,logfile=f"{ushdir}/log.generate_FV3LAM_wflow",
-                                         debug=args.debug)
-        if args.quiet:
-            if args.debug:
-                console_handler.setLevel(logging.DEBUG)
-            else:
-                console_handler.setLevel(logging.INFO)
-        logging.info(f"Workflow for test {test_name} successfully generated in\n{expt_dir}\n")
-        # If this job is not using crontab, we need to add an entry to monitor.yaml
-        if 'USE_CRON_TO_RELAUNCH' not in test_cfg['workflow']:
-            test_cfg['workflow'].update({"USE_CRON_TO_RELAUNCH": False})
-        if not test_cfg['workflow']['USE_CRON_TO_RELAUNCH']:
-            logging.debug(f'Creating entry for job {test_name} in job monitoring dict')
-            workflow_id = f'{test_name}_{starttime_string}'
-            monitor_yaml[workflow_id] = dict()
-            monitor_yaml[workflow_id].update({"expt_dir": expt_dir})
-            monitor_yaml[workflow_id].update({"status": "CREATED"})
-            monitor_yaml[workflow_id].update({"start_time": starttime_string})
-            # Make WORKFLOW_ID actually mean something
-            test_cfg['workflow'].update({"WORKFLOW_ID": workflow_id})
+        test_cfgs[test_name] = build_test_config(test, test_name, args, run_envir, machine,
+                                                 machine_defaults, config_defaults)
+
+    gen_procs = min(args.gen_procs, len(test_cfgs))
+    if gen_procs > 1 and args.launch == "cron":
+        logging.warning("Experiments launched with cron are generated serially, since each one "\
+                        "edits the user's crontab")
+        gen_procs = 1
+
+    starttime_string = datetime.now().strftime("%Y%m%d%H%M%S")
+    if gen_procs > 1:
+        logging.info(f"Generating {len(test_cfgs)} experiments with {gen_procs} processes")
+        gen_args = [(ushdir, test_name, test_cfg, args.debug, args.quiet)
+                    for test_name, test_cfg in test_cfgs.items()]
+        results = {}
+        with Pool(processes=gen_procs, maxtasksperchild=1) as pool:
+            for result in pool.imap_unordered(generate_test_isolated, gen_args):
+                results[result["test_name"]] = result
+                if result["expt_dir"]:
+                    logging.info(f"Workflow for test {result['test_name']} successfully "\
+                                 f"generated in\n{result['expt_dir']}\n")
+                else:
+                    logging.error(f"Workflow generation for test {result['test_name']} failed; "\
+                                  f"see log file\n{result['logfile']}\n")
+        failed = [test_name for test_name in test_cfgs if not results[test_name]["expt_dir"]]
+        if failed:
+            pretty_list = "\n".join(failed)
+            raise RuntimeError(f"Workflow generation failed for {len(failed)} test(s):\n"\
+                               f"{pretty_list}\nSee the log file of each test for details")
+    else:
+        results = {}
+        for test_name, test_cfg in test_cfgs.items():
+            results[test_name] = generate_test(ushdir, test_name, test_cfg, args)
+
+    # Set up dictionary for job monitoring yaml once all experiments exist
+    if args.launch != "cron":
+        monitor_yaml = dict()
+        for test_name, test_cfg in test_cfgs.items():
+            # If this job is not using crontab, we need to add an entry to monitor.yaml
+            if not test_cfg['workflow'].get('USE_CRON_TO_RELAUNCH', False):
+                logging.debug(f'Creating entry for job {test_name} in job monitoring dict')
+                result = results[test_name]
+                workflow_id = f'{test_name}_{result["start_time"]}'
+                monitor_yaml[workflow_id] = dict()
+                monitor_yaml[workflow_id].update({"expt_dir": result["expt_dir"]})
+                monitor_yaml[workflow_id].update({"status": "CREATED"})
+                monitor_yaml[workflow_id].update({"start_time": result["start_time"]})
 
     if args.launch != "cron":
         monitor_file = f'WE2E_tests_{starttime_string}.yaml'
@@ -260,18 +224,182 @@ def run_we2e_tests(homedir, args) -> None:
             logging.debug("calling function that monitors jobs, prints summary")
             try:
                 monitor_file = monitor_jobs(monitor_yaml, monitor_file=monitor_file, procs=args.procs,
-                                            debug=args.debug)
+                                            debug=args.debug, max_nodes=args.max_nodes,
+                                            max_core_hours=args.max_core_hours,
+                                            history_db=args.history_db)
             except KeyboardInterrupt:
                 logging.info("\n\nUser interrupted monitor script; to resume monitoring jobs run:\n")
-                logging.info(f"./monitor_jobs.py -y={monitor_file} -p={args.procs}\n")
+                logging.info(resume_command(monitor_file, args.procs, max_nodes=args.max_nodes,
+                                            max_core_hours=args.max_core_hours,
+                                            history_db=args.history_db) + "\n")
         else:
             logging.info("To automatically run and monitor experiments, use:\n")
-            logging.info(f"./monitor_jobs.py -y={monitor_file}\n")
+            logging.info(resume_command(monitor_file, max_nodes=args.max_nodes,
+                                        max_core_hours=args.max_core_hours,
+                                        history_db=args.history_db) + "\n")
     else:
         logging.info("All experiments have been generated; using cron to submit workflows")
         logging.info("To view running experiments in cron try `crontab -l`")
 
 
+def build_test_config(test: str, test_name: str, args, run_envir: str, machine: str,
+                      machine_defaults: dict, config_defaults: dict) -> dict:
+    """
+    Function for constructing the complete user config of a test from its test config
+    file and the command-line arguments
+
+    Args:
+        test             (str): Full path of the test config file
+        test_name        (str): Name of the test
+        args             (obj): The argparse.Namespace object containing command-line arguments
+        run_envir        (str): Overrides RUN_ENVIR for the test if set
+        machine          (str): Name of the machine (lowercase)
+        machine_defaults (dict): Dictionary loaded from machine settings file
+        config_defaults  (dict): Dictionary loaded from default config file
+
+    Returns:
+        dict: The user config for generating the test experiment
+    """
+    logging.debug(f"For test {test_name}, constructing config.yaml")
+    test_cfg = load_config_file(test)
+
+    if test_cfg.get('user') is None:
+        test_cfg['user'] = {}
+    test_cfg['user'].update({"MACHINE": machine})
+    test_cfg['user'].update({"ACCOUNT": args.account})
+    if run_envir:
+        test_cfg['user'].update({"RUN_ENVIR": run_envir})
+    # if platform section was not in input config, initialize as empty dict
+    if 'platform' not in test_cfg:
+        test_cfg['platform'] = dict()
+    test_cfg['platform'].update({"BUILD_MOD_FN": args.modulefile})
+    test_cfg['workflow'].update({"COMPILER": args.compiler})
+    if args.expt_basedir:
+        test_cfg['workflow'].update({"EXPT_BASEDIR": args.expt_basedir})
+    test_cfg['workflow'].update({"EXPT_SUBDIR": test_name})
+    if args.exec_subdir:
+        test_cfg['workflow'].update({"EXEC_SUBDIR": args.exec_subdir})
+    if args.launch == "cron":
+        test_cfg['workflow'].update({"USE_CRON_TO_RELAUNCH": True})
+    if args.cron_relaunch_intvl_mnts:
+        test_cfg['workflow'].update({"CRON_RELAUNCH_INTVL_MNTS": args.cron_relaunch_intvl_mnts})
+    if args.debug_tests:
+        test_cfg['workflow'].update({"DEBUG": args.debug_tests})
+    if args.verbose_tests:
+        test_cfg['workflow'].update({"VERBOSE": args.verbose_tests})
+
+    logging.debug(f"Overwriting WE2E-test-specific settings for test \n{test_name}\n")
+
+    if 'task_get_extrn_ics' in test_cfg:
+        test_cfg['task_get_extrn_ics'] = check_task_get_extrn_bcs(test_cfg,machine_defaults,
+                                                                  config_defaults,"ics")
+    if 'task_get_extrn_lbcs' in test_cfg:
+        test_cfg['task_get_extrn_lbcs'] = check_task_get_extrn_bcs(test_cfg,machine_defaults,
+                                                                   config_defaults,"lbcs")
+
+    if 'verification' in test_cfg:
+        # This section checks if we are doing verification on a machine with staged verification
+        # obs. If so, and if the config file does not explicitly set the observation locations,
+        # fill these in with defaults from the machine files
+        obs_vars = ['CCPA_OBS_DIR','MRMS_OBS_DIR','NDAS_OBS_DIR','NOHRSC_OBS_DIR']
+        if 'platform' not in test_cfg:
+            test_cfg['platform'] = {}
+        for obvar in obs_vars:
+            mach_path = machine_defaults['platform'].get('TEST_'+obvar)
+            if not test_cfg['platform'].get(obvar) and mach_path:
+                logging.debug(f'Setting {obvar} = {mach_path} from machine file')
+                test_cfg['platform'][obvar] = mach_path
+
+    if args.compiler == "gnu":
+        # 2D decomposition doesn't work with GNU compilers.  Deactivate 2D decomposition for GNU
+        if 'task_run_post' in test_cfg:
+            test_cfg['task_run_post'].update({"NUMX": 1})
+            logging.info(f"NUMX has been reset to 1 due to issues encountered with GNU compilers")
+        if 'task_run_fcst' in test_cfg:
+            test_cfg['task_run_fcst'].update({"ITASKS": 1})
+            logging.info(f"ITASKS has been reset to 1 due to issues encountered with GNU compilers")
+
+    logging.debug(f"Complete config for test {test_name}\n"\
+                   "based on specified command-line arguments:\n")
+    logging.debug(cfg_to_yaml_str(test_cfg))
+    return test_cfg
+
+
+def generate_test(ushdir: str, test_name: str, test_cfg: dict, args) -> dict:
+    """
+    Function for generating the experiment of a single test in the current process
+
+    Args:
+        ushdir    (str): The full path of the ush/ directory
+        test_name (str): Name of the test
+        test_cfg (dict): The complete user config of the test
+        args      (obj): The argparse.Namespace object containing command-line arguments
+
+    Returns:
+        dict: The test name, experiment directory, generation start time and log file
+    """
+    starttime_string = datetime.now().strftime("%Y%m%d%H%M%S")
+    logfile = f"{ushdir}/log.generate_FV3LAM_wflow"
+
+    logging.info(f"Calling workflow generation function for test {test_name}\n")
+    if args.quiet:
+        console_handler = logging.getLogger().handlers[1]
+        console_handler.setLevel(logging.WARNING)
+    expt_dir = generate_FV3LAM_wflow(ushdir, logfile=logfile, debug=args.debug,
+                                     user_config=test_cfg)
+    if args.quiet:
+        if args.debug:
+            console_handler.setLevel(logging.DEBUG)
+        else:
+            console_handler.setLevel(logging.INFO)
+    logging.info(f"Workflow for test {test_name} successfully generated in\n{expt_dir}\n")
+    return {"test_name": test_name, "expt_dir": expt_dir, "start_time": starttime_string,
+            "logfile": os.path.join(expt_dir, os.path.basename(logfile))}
+
+
+def generate_test_isolated(gen_args: tuple) -> dict:
+    """
+    Function for generating the experiment of a single test in a worker process of a
+    process pool. Each test logs to its own file, and its console output is prefixed
+    with the test name; with the quiet flag only warnings and errors are printed to
+    screen. Errors are returned rather than raised so that the remaining tests are
+    still generated.
+
+    Args:
+        gen_args (tuple): The ush/ directory, test name, complete user config of the
+                          test, and debug and quiet flags
+
+    Returns:
+        dict: The test name, experiment directory (empty if generation failed),
+              generation start time and log file
+    """
+    ushdir, test_name, test_cfg, debug, quiet = gen_args
+    starttime_string = datetime.now().strftime("%Y%m%d%H%M%S")
+    logfile = f"{ushdir}/log.generate_FV3LAM_wflow.{test_name}"
+
+    # Replace the handlers inherited from the parent process
+    root_logger = logging.getLogger()
+    for handler in root_logger.handlers.copy():
+        root_logger.removeHandler(handler)
+    console = logging.StreamHandler()
+    if quiet:
+        console.setLevel(logging.WARNING)
+    else:
+        console.setLevel(logging.DEBUG if debug else logging.INFO)
+    console.setFormatter(logging.Formatter(f"{test_name}: %(levelname)s %(message)s"))
+    root_logger.addHandler(console)
+
+    expt_dir = ""
+    try:
+        expt_dir = generate_FV3LAM_wflow(ushdir, logfile=logfile, debug=debug,
+                                         user_config=test_cfg)
+        logfile = os.path.join(expt_dir, os.path.basename(logfile))
+    except Exception: # pylint: disable=broad-exception-caught
+        logging.exception(f"Experiment generation failed for test {test_name}")
+    return {"test_name": test_name, "expt_dir": expt_dir, "start_time": starttime_string,
+            "logfile": logfile}
+
+
 def check_tests(tests: list) -> list:
     """
     Function for checking that all tests in a provided list of tests are valid
@@ -495,12 +623,28 @@ if __name__ == "__main__":
     ap.add_argument('-p', '--procs', type=int,
                     help='Run resource-heavy tasks (such as calls to rocotorun) in parallel, '\
                          'with provided number of parallel tasks', default=1)
+    ap.add_argument('--gen_procs', type=int,
+                    help='Generate experiments in parallel with provided number of processes; '\
+                         'each experiment is then logged to its own file in the ush directory',
+                    default=1)
     ap.add_argument('-l', '--launch', type=str, choices=['python', 'cron', 'none'],
                     help='Method for launching jobs. Valid values are:\n'\
                          ' python: [default] Monitor and launch experiments using monitor_jobs.py\n'
                          ' cron:   Launch expts using ush/launch_FV3LAM_wflow.sh from crontab\n'\
                          ' none:   Do not launch experiments; only create experiment directories',
                          default="python")
+    ap.add_argument('--max_nodes', type=int,
+                    help='With --launch=python, budget of nodes for running experiments, '\
+                         'estimated from the resources of their tasks; the longest experiments '\
+                         'are started first, and the others as running experiments finish')
+    ap.add_argument('--max_core_hours', type=float,
+                    help='With --launch=python, budget of estimated core-hours for running '\
+                         'experiments')
+    ap.add_argument('--history_db', type=str, nargs='?', const=DEFAULT_HISTORY_DB,
+                    default=WE2E_HISTORY_DB,
+                    help='With --launch=python, record the jobs of finished experiments in this '\
+                         f'runtime history database ({DEFAULT_HISTORY_DB} if no path is given); '\
+                         'by default, no history is kept unless SRW_RUNTIME_HISTORY_DB is set')
 
 
     ap.add_argument('--modulefile', type=str, help='Modulefile used for building the app')
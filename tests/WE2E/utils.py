@@ -9,14 +9,22 @@ import logging
 import subprocess
 import sqlite3
 import glob
+import json
+import time
 from textwrap import dedent
 from datetime import datetime
-from contextlib import closing
+from collections import Counter, OrderedDict
+from contextlib import closing, suppress
+from functools import lru_cache
+from itertools import count
 from multiprocessing import Pool
+from xml.etree.ElementTree import ParseError
 
 sys.path.append("../../ush")
 
-from calculate_cost import calculate_cost
+from calculate_cost import calculate_cost, calculate_costs
+from rocoto_xml import expected_tasks
+from set_cycle_dates import all_cycle_dates
 from python_utils import (
     cfg_to_yaml_str,
     flatten_dict,
@@ -187,23 +195,242 @@ def calculate_core_hours(expts_dict: dict) -> dict:
     return expts_dict
 
 
+# Suffix of the journal of changes kept next to a monitor file
+MONITOR_JOURNAL_SUFFIX = ".journal"
+# The journal is compacted into the monitor file once it is larger than the monitor file
+# itself, but not before it reaches this size
+MONITOR_JOURNAL_MIN_BYTES = 1024 * 1024
+
 def write_monitor_file(monitor_file: str, expts_dict: dict):
+    """Writes the complete monitor file and discards its journal. The new file replaces the
+    old one only once it has been fully written, so an interruption or failure at any point
+    leaves a valid monitor file (and journal) behind.
+
+    Args:
+        monitor_file (str): The monitor file
+        expts_dict  (dict): A dictionary containing the information needed to run
+                            one or more experiments. See example file WE2E_tests.yaml
+
+    Returns:
+        None
+    """
+    tmp_file = f"{monitor_file}.tmp"
     try:
-        with open(monitor_file,"w", encoding="utf-8") as f:
+        with open(tmp_file,"w", encoding="utf-8") as f:
             f.write("### WARNING ###\n")
             f.write("### THIS FILE IS AUTO_GENERATED AND REGULARLY OVER-WRITTEN BY WORKFLOW SCRIPTS\n")
             f.write("### EDITS MAY RESULT IN MISBEHAVIOR OF EXPERIMENTS RUNNING\n")
             f.writelines(cfg_to_yaml_str(expts_dict))
-    except KeyboardInterrupt:
-        logging.warning("\nRefusing to interrupt during file write; try again\n")
-        write_monitor_file(monitor_file,expts_dict)
-    except:
-        logging.fatal("\n********************************\n")
-        logging.fatal(f"WARNING WARNING WARNING\n")
-        logging.fatal("Failure occurred while writing monitor file {monitor_file}")
-        logging.fatal("File may be corrupt or invalid for re-run!!")
-        logging.fatal("\n********************************\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, monitor_file)
+    except BaseException as e:
+        with suppress(FileNotFoundError):
+            os.remove(tmp_file)
+        if not isinstance(e, KeyboardInterrupt):
+            logging.fatal("\n********************************\n")
+            logging.fatal(f"Failure occurred while writing monitor file {monitor_file}")
+            logging.fatal("The previous version of the file has been left in place")
+            logging.fatal("\n********************************\n")
         raise
+    # Every change in the journal is now in the monitor file
+    with suppress(FileNotFoundError):
+        os.remove(monitor_file + MONITOR_JOURNAL_SUFFIX)
+
+
+def load_monitor_file(monitor_file: str) -> dict:
+    """Reads a monitor file and applies the changes recorded in its journal since the file
+    was last written
+
+    Args:
+        monitor_file (str): The monitor file
+
+    Returns:
+        dict: The experiments dictionary
+    """
+    expts_dict = load_config_file(monitor_file)
+    journal_file = monitor_file + MONITOR_JOURNAL_SUFFIX
+    if not os.path.exists(journal_file):
+        return expts_dict
+    with open(journal_file, encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A record cut short by a crash; nothing was written after it
+                logging.warning(f"Skipping incomplete record {lineno} of {journal_file}")
+                continue
+            expt = expts_dict.setdefault(record["expt"], {})
+            for key, value in record["set"].items():
+                if isinstance(value, dict) and isinstance(expt.get(key), dict):
+                    expt[key].update(value)
+                else:
+                    expt[key] = value
+    return expts_dict
+
+
+class MonitorStore:
+    """Keeps a monitor file up to date by appending the changes of each update to a journal
+    next to it, rather than writing the whole file every time. Only the fields that changed
+    are recorded, one line of JSON per experiment. The journal is compacted into the monitor
+    file once it grows larger than the file; load_monitor_file() reads both.
+
+    Args:
+        monitor_file (str): The monitor file
+    """
+
+    def __init__(self, monitor_file: str):
+        self.monitor_file = monitor_file
+        self.journal_file = monitor_file + MONITOR_JOURNAL_SUFFIX
+        self._written = {}
+        self._compact_bytes = MONITOR_JOURNAL_MIN_BYTES
+
+    @staticmethod
+    def _copy(value):
+        return dict(value) if isinstance(value, dict) else value
+
+    def compact(self, expts_dict: dict):
+        """Writes the complete monitor file, which discards the journal"""
+        write_monitor_file(self.monitor_file, expts_dict)
+        self._written = {name: {key: self._copy(value) for key, value in expt.items()}
+                         for name, expt in expts_dict.items()}
+        self._compact_bytes = max(MONITOR_JOURNAL_MIN_BYTES, os.path.getsize(self.monitor_file))
+
+    def _changes(self, name: str, expt: dict) -> dict:
+        """The fields of an experiment that changed since they were last written"""
+        written = self._written.setdefault(name, {})
+        changes = {}
+        for key, value in expt.items():
+            old = written.get(key)
+            if isinstance(value, dict) and isinstance(old, dict):
+                fields = {k: v for k, v in value.items() if k not in old or old[k] != v}
+                if fields:
+                    changes[key] = fields
+            elif key not in written or old != value:
+                changes[key] = value
+            else:
+                continue
+            written[key] = self._copy(value)
+        return changes
+
+    def update(self, expts_dict: dict, names: list = None):
+        """Records the changes of some (by default all) experiments in the journal
+
+        Args:
+            expts_dict (dict): The experiments dictionary
+            names      (list): [optional] The experiments that may have changed
+        """
+        lines = []
+        for name in expts_dict if names is None else names:
+            changes = self._changes(name, expts_dict[name])
+            if changes:
+                lines.append(json.dumps({"expt": name, "set": changes}) + "\n")
+        if not lines:
+            return
+        with open(self.journal_file, "a", encoding="utf-8") as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+            size = f.tell()
+        if size > self._compact_bytes:
+            logging.debug(f"Compacting {self.journal_file} into {self.monitor_file}")
+            self.compact(expts_dict)
+
+
+# Rocoto job states after which the row of a job in the database no longer changes
+FINAL_JOB_STATES = ["SUCCEEDED", "DEAD"]
+# Maximum number of parameters in one SQLite query
+SQLITE_MAX_PARAMS = 500
+# Per rocoto database: a read-only connection and what was read from it by the last poll; the
+# least recently read databases are closed beyond ROCOTO_DB_CACHE_SIZE
+ROCOTO_DB_CACHE_SIZE = 64
+_ROCOTO_DB_CACHE = OrderedDict()
+
+
+@lru_cache(maxsize=None)
+def _cycle_str(cycle: int) -> str:
+    """Cycle of a rocoto job, stored in Unix time (seconds), in human-readable form"""
+    return datetime.utcfromtimestamp(cycle).strftime('%Y%m%d%H%M')
+
+
+def close_rocoto_db(rocoto_db: str):
+    """Closes the cached connection to a rocoto database and forgets what was read from it"""
+    cache = _ROCOTO_DB_CACHE.pop(rocoto_db, None)
+    if cache:
+        cache["connection"].close()
+
+
+def read_rocoto_jobs(expt: dict, rocoto_db: str) -> Counter:
+    """
+    Updates the task entries of an experiment dictionary from the "jobs" table of its rocoto
+    database. The database is opened read-only once per process and kept open. Only the rows
+    added since the last read, and the rows of jobs that had not finished by then, are fetched;
+    rows of finished jobs do not change anymore. If rows were removed (e.g. by rocotorewind),
+    the whole table is read again.
+
+    Each task's info is stored under a dictionary key named TASKNAME_CYCLE.
+
+    Args:
+        expt     (dict): The experiment dictionary, updated in place
+        rocoto_db (str): Path of the rocoto database
+
+    Returns:
+        Counter: Number of tasks of the experiment in each state
+    """
+    cache = _ROCOTO_DB_CACHE.get(rocoto_db)
+    if cache is None:
+        if not os.path.isfile(rocoto_db):
+            raise FileNotFoundError(f"Rocoto database {rocoto_db} does not exist")
+        cache = {"connection": sqlite3.connect(f"file:{rocoto_db}?mode=ro", uri=True),
+                 "rows": 0, "max_id": 0, "open_ids": set(), "tasks": 0, "final": 0}
+        _ROCOTO_DB_CACHE[rocoto_db] = cache
+        while len(_ROCOTO_DB_CACHE) > ROCOTO_DB_CACHE_SIZE:
+            close_rocoto_db(next(iter(_ROCOTO_DB_CACHE)))
+    _ROCOTO_DB_CACHE.move_to_end(rocoto_db)
+
+    # The counts are taken from the dictionary passed in, and kept up to date from the changed
+    # rows. A pool worker gets a copy of the dictionary, which is at least as recent as the last
+    # read in this process; a dictionary with fewer tasks, or fewer finished ones, than were read
+    # (e.g. a new one) needs the whole table.
+    counts = Counter(info["status"] for task, info in expt.items()
+                     if task not in ["expt_dir","status","start_time","walltime"])
+    if (sum(counts.values()) < cache["tasks"]
+            or sum(counts[state] for state in FINAL_JOB_STATES) < cache["final"]):
+        cache.update({"max_id": 0, "open_ids": set()})
+
+    columns = "id,taskname,cycle,state,cores,duration"
+    with closing(cache["connection"].cursor()) as cur:
+        num_rows, max_id = cur.execute("SELECT count(*),coalesce(max(id),0) FROM jobs").fetchone()
+        if num_rows < cache["rows"] or max_id < cache["max_id"]:
+            cache.update({"max_id": 0, "open_ids": set()})
+        rows = cur.execute(f"SELECT {columns} FROM jobs WHERE id > ?",
+                           (cache["max_id"],)).fetchall()
+        open_ids = sorted(cache["open_ids"])
+        for i in range(0, len(open_ids), SQLITE_MAX_PARAMS):
+            chunk = open_ids[i:i + SQLITE_MAX_PARAMS]
+            rows.extend(cur.execute(
+                f"SELECT {columns} FROM jobs WHERE id IN ({','.join('?' * len(chunk))})",
+                chunk).fetchall())
+
+    for job_id, taskname, cycle, state, cores, duration in rows:
+        task = f"{taskname}_{_cycle_str(cycle)}"
+        if task in expt:
+            counts[expt[task]["status"]] -= 1
+        else:
+            expt[task] = dict()
+        expt[task]["status"] = state
+        expt[task]["cores"] = cores
+        expt[task]["walltime"] = duration
+        counts[state] += 1
+        if state in FINAL_JOB_STATES:
+            cache["open_ids"].discard(job_id)
+        else:
+            cache["open_ids"].add(job_id)
+        cache["max_id"] = max(cache["max_id"], job_id)
+
+    cache.update({"rows": num_rows, "tasks": sum(counts.values()),
+                  "final": sum(counts[state] for state in FINAL_JOB_STATES)})
+    return counts
 
 
 def update_expt_status(expt: dict, name: str, refresh: bool = False, debug: bool = False,
@@ -287,12 +514,9 @@ def update_expt_status(expt: dict, name: str, refresh: bool = False, debug: bool
 
     logging.debug(f"Reading database for experiment {name}, updating experiment dictionary")
     try:
-        # This section of code queries the "job" table of the rocoto database, returning a list
-        # of tuples containing the taskname, cycle, and state of each job respectively
-        with closing(sqlite3.connect(rocoto_db)) as connection:
-            with closing(connection.cursor()) as cur:
-                db = cur.execute('SELECT taskname,cycle,state,cores,duration from jobs').fetchall()
+        counts = read_rocoto_jobs(expt, rocoto_db)
     except:
+        close_rocoto_db(rocoto_db)
         # Some platforms (including Hera) can have a problem with rocoto jobs not submitting
         # properly due to build-ups of background processes. This will resolve over time as
         # rocotorun continues to be called, so let's only treat this as an error if we are
@@ -303,43 +527,25 @@ def update_expt_status(expt: dict, name: str, refresh: bool = False, debug: bool
 
         return expt
 
-    for task in db:
-        # For each entry from rocoto database, store that task's info under a dictionary key named
-        # TASKNAME_CYCLE; Cycle comes from the database in Unix Time (seconds), so convert to
-        # human-readable
-        cycle = datetime.utcfromtimestamp(task[1]).strftime('%Y%m%d%H%M')
-        if f"{task[0]}_{cycle}" not in expt:
-            expt[f"{task[0]}_{cycle}"] = dict()
-        expt[f"{task[0]}_{cycle}"]["status"] = task[2]
-        expt[f"{task[0]}_{cycle}"]["cores"] = task[3]
-        expt[f"{task[0]}_{cycle}"]["walltime"] = task[4]
-
-    statuses = list()
-    for task in expt:
-        # Skip non-task entries
-        if task in ["expt_dir","status","start_time","walltime"]:
-            continue
-        statuses.append(expt[task]["status"])
-
-    if "DEAD" in statuses:
+    if counts["DEAD"]:
         still_live = ["RUNNING", "SUBMITTING", "QUEUED", "FAILED"]
-        if any(status in still_live for status in statuses):
+        if any(counts[status] for status in still_live):
             logging.debug(f'DEAD job in experiment {name}; continuing to track until all jobs are '\
                            'complete')
             expt["status"] = "DYING"
         else:
             expt["status"] = "DEAD"
             return expt
-    elif "RUNNING" in statuses:
+    elif counts["RUNNING"]:
         expt["status"] = "RUNNING"
-    elif "QUEUED" in statuses:
+    elif counts["QUEUED"]:
         expt["status"] = "QUEUED"
-    elif "FAILED" in statuses or "SUBMITTING" in statuses:
+    elif counts["FAILED"] or counts["SUBMITTING"]:
         # Job in "FAILED" status means it will be retried
         expt["status"] = "SUBMITTING"
-    elif "SUCCEEDED" in statuses:
+    elif counts["SUCCEEDED"]:
         # If all task statuses are "SUCCEEDED", set the experiment status to "SUCCEEDED". This
-        # will trigger a final check using rocotostat to make sure there are no remaining un-
+        # will trigger a final check against the rocoto XML to make sure there are no remaining un-
         # started tests.
         expt["status"] = "SUCCEEDED"
     elif expt["status"] == "CREATED":
@@ -363,23 +569,65 @@ def update_expt_status(expt: dict, name: str, refresh: bool = False, debug: bool
               f"""Some kind of horrible thing has happened to the experiment status
               for experiment {name}
               status is {expt["status"]}
-              all task statuses are {statuses}"""))
+              task status counts are {dict(+counts)}"""))
 
     # Final check for experiments where all tasks are "SUCCEEDED"; since the rocoto database does
-    # not include info on jobs that have not been submitted yet, use rocotostat to check that
-    # there are no un-submitted jobs remaining.
+    # not include info on jobs that have not been submitted yet, check against the tasks defined
+    # in the rocoto XML that there are no un-submitted jobs remaining.
     if expt["status"] in ["SUCCEEDED","STALLED","STUCK"]:
-        expt = compare_rocotostat(expt,name)
+        expt = check_untracked_tasks(expt,name)
 
     return expt
 
+# In each worker process of update_expt_status_parallel(): experiment name -> (token, dictionary)
+# of the experiments it updated last, so that their task entries are not sent to it again
+_WORKER_EXPTS = {}
+_WORKER_REVISIONS = count(1)
+# In the monitor process: experiment name -> token of the worker copy its dictionary matches
+_EXPT_TOKENS = {}
+
+
+def _update_expt_status_worker(args: tuple) -> tuple:
+    """
+    Worker for update_expt_status_parallel(): updates one experiment and returns only the entries
+    of its dictionary that changed, so that unchanged task entries are not sent back. The worker
+    receives only the top-level fields of the experiment (its directory, status, ...); it keeps
+    its own copy of the task entries if it updated the experiment last, and otherwise reads them
+    all from the rocoto database again.
+
+    Args:
+        args (tuple): The experiment name, its top-level fields, the token of the worker copy the
+                      monitor's dictionary matches (None if unknown), and the refresh and debug
+                      arguments of update_expt_status()
+
+    Returns:
+        tuple: The name of the experiment, a dictionary of its changed entries, and the token of
+               the updated worker copy
+    """
+    name, fields, token, refresh, debug = args
+    cached = _WORKER_EXPTS.pop(name, None)
+    expt = cached[1] if cached and cached[0] == token else {}
+    expt.update(fields)
+    # update_expt_status() updates the dictionary in place, so keep a copy of each entry
+    before = {key: dict(value) if isinstance(value, dict) else value
+              for key, value in expt.items()}
+    expt = update_expt_status(expt, name, refresh, debug)
+    token = (os.getpid(), next(_WORKER_REVISIONS))
+    if expt["status"] not in ['DEAD','ERROR','COMPLETE']:
+        _WORKER_EXPTS[name] = (token, expt)
+    return name, {key: value for key, value in expt.items() if before.get(key) != value}, token
+
+
 def update_expt_status_parallel(expts_dict: dict, procs: int, refresh: bool = False,
-                                debug: bool = False) -> dict:
+                                debug: bool = False, pool: Pool = None) -> dict:
     """
     This function updates an entire set of experiments in parallel, drastically speeding up
     the process if given enough parallel processes. Given a dictionary of experiments, it will
-    pass each individual experiment dictionary to update_expt_status() to be updated, making use
-    of the python multiprocessing starmap functionality to achieve this in parallel
+    update each individual experiment with update_expt_status() in a pool of worker processes.
+    Only the top-level fields of each experiment are sent to the workers, which keep the task
+    entries of the experiments they updated; workers send back only the entries that changed,
+    which are merged into the dictionary as each experiment finishes, so a slow experiment does
+    not hold up the others.
 
     Args:
         expts_dict (dict): A dictionary containing information for all experiments
@@ -388,29 +636,270 @@ def update_expt_status_parallel(expts_dict: dict, procs: int, refresh: bool = Fa
         debug      (bool): Will capture all output from rocotorun. This will allow information such
                            as job cards and job submit messages to appear in the log files, but can
                            slow down the process drastically.
+        pool       (Pool): [optional] A long-lived pool of worker processes to use; if not given,
+                           a pool is created for this call only
 
     Returns:
         dict: The updated dictionary of experiment dictionaries
     """
 
-    args = []
-    # Define a tuple of arguments to pass to starmap
-    for expt in expts_dict:
-        args.append( (expts_dict[expt],expt,refresh,debug) )
-
-    # call update_expt_status() in parallel
-    with Pool(processes=procs) as pool:
-        output = pool.starmap(update_expt_status, args)
+    args = [(name, {key: value for key, value in expt.items() if not isinstance(value, dict)},
+             _EXPT_TOKENS.get(name), refresh, debug) for name, expt in expts_dict.items()]
+    if not args:
+        return expts_dict
 
-    # Update dictionary with output from all calls to update_expt_status()
-    i = 0
-    for expt in expts_dict:
-        expts_dict[expt] = output[i]
-        i += 1
+    own_pool = pool is None
+    if own_pool:
+        pool = Pool(processes=procs)
+    try:
+        for name, changes, token in pool.imap_unordered(_update_expt_status_worker, args):
+            expts_dict[name].update(changes)
+            _EXPT_TOKENS[name] = token
+    finally:
+        if own_pool:
+            pool.close()
+            pool.join()
 
     return expts_dict
 
 
+class PollScheduler:
+    """Decides when each experiment is next updated by the monitor. An experiment whose status
+    and task states did not change since its last update is polled less and less often,
+    up to a maximum interval that depends on its status; any change, or a state from which new
+    jobs are about to be released (submitting or retried jobs, a final check for unsubmitted
+    jobs), brings it back to the minimum interval.
+
+    Args:
+        min_interval (float): Shortest time between two updates of an experiment, in seconds
+        max_interval (float): Longest time between two updates of an experiment, in seconds
+    """
+
+    # Statuses from which new jobs are about to be released; always polled promptly
+    PROMPT_STATUSES = ["CREATED", "SUBMITTING", "SUCCEEDED", "STALLED", "STUCK"]
+    # Task statuses that are released by the next rocotorun
+    PROMPT_TASK_STATUSES = ["SUBMITTING", "FAILED"]
+    # Fraction of the maximum interval allowed for running experiments, whose jobs may finish at
+    # any time; queued experiments may back off all the way
+    STATUS_INTERVAL_FRACTION = {"RUNNING": 0.5, "DYING": 0.5}
+    BACKOFF_FACTOR = 2
+
+    def __init__(self, min_interval: float = 5, max_interval: float = 120):
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self._state = {}
+
+    @staticmethod
+    def signature(expt: dict) -> tuple:
+        """What must change for an experiment to count as active: its status and the state of
+        each of its jobs. The rocoto database is rewritten by every rocotorun, so its modification
+        time tells nothing."""
+        tasks = tuple(sorted((task, info.get("status")) for task, info in expt.items()
+                             if task not in ["expt_dir","status","start_time","walltime"]))
+        return (expt.get("status"), tasks)
+
+    def record(self, name: str, expt: dict, now: float = None) -> float:
+        """Records an update of an experiment and schedules the next one
+
+        Returns:
+            float: The interval until the next update, in seconds
+        """
+        now = time.monotonic() if now is None else now
+        sig = self.signature(expt)
+        state = self._state.get(name)
+        statuses = [info.get("status") for task, info in expt.items()
+                    if task not in ["expt_dir","status","start_time","walltime"]]
+        if (state is None or state["signature"] != sig
+                or expt.get("status") in self.PROMPT_STATUSES
+                or any(status in self.PROMPT_TASK_STATUSES for status in statuses)):
+            interval = self.min_interval
+        else:
+            cap = self.max_interval * self.STATUS_INTERVAL_FRACTION.get(expt.get("status"), 1)
+            interval = min(state["interval"] * self.BACKOFF_FACTOR,
+                           max(cap, self.min_interval))
+        self._state[name] = {"signature": sig, "interval": interval, "next": now + interval}
+        return interval
+
+    def due(self, names, now: float = None) -> list:
+        """The experiments among names that should be updated now"""
+        now = time.monotonic() if now is None else now
+        return [name for name in names
+                if name not in self._state or self._state[name]["next"] <= now]
+
+    def wait_time(self, names, now: float = None) -> float:
+        """Seconds until the next of the named experiments is due"""
+        now = time.monotonic() if now is None else now
+        if not names or any(name not in self._state for name in names):
+            return 0
+        return max(0, min(self._state[name]["next"] for name in names) - now)
+
+
+
+# Runtime of the reference forecast of calculate_cost() (a 6-hour forecast on the RRFS_CONUS_25km
+# grid), which turns the relative cost of a test into an estimated runtime, and the runtime of the
+# tasks of an experiment other than its forecasts; both in seconds
+REFERENCE_FCST_SECONDS = 900
+EXPT_OVERHEAD_SECONDS = 1200
+
+
+class QueueWaitTracker:
+    """Estimates how long the jobs of monitored experiments waited in the queue, from the first
+    update in which each job appeared (it was submitted) and the first in which it had finished:
+    the time in between, less the walltime of the job. The estimate is only as precise as the
+    interval between updates. Jobs that were already in the dictionary of an experiment the first
+    time it was seen (e.g. when monitoring is restarted) have no estimate.
+    """
+
+    def __init__(self):
+        self._submitted = {}
+        self._finished = {}
+
+    def observe(self, name: str, expt: dict, now: float = None):
+        """Records the jobs of an experiment after an update"""
+        now = time.time() if now is None else now
+        first = name not in self._submitted
+        submitted = self._submitted.setdefault(name, {})
+        finished = self._finished.setdefault(name, {})
+        for task, info in expt.items():
+            if task in ["expt_dir","status","start_time","walltime"]:
+                continue
+            if task not in submitted:
+                submitted[task] = None if first else now
+            if info.get("status") in FINAL_JOB_STATES and task not in finished:
+                finished[task] = now
+
+    def queue_waits(self, name: str, expt: dict) -> dict:
+        """Estimated queue wait in seconds of each finished job, by TASKNAME_CYCLE"""
+        waits = {}
+        for task, end in self._finished.get(name, {}).items():
+            start = self._submitted[name].get(task)
+            if start is not None:
+                waits[task] = max(0, end - start - (expt[task].get("walltime") or 0))
+        return waits
+
+
+def _rocoto_peak_resources(tasks: dict) -> tuple:
+    """Largest number of nodes and cores that the (meta)tasks of a rocoto YAML "tasks" section
+    can use at the same time. Each top-level entry is assumed to run on its own, and the members
+    of a metatask all at once."""
+    peak_nodes = peak_cores = 0
+    for key, settings in tasks.items():
+        if not isinstance(settings, dict):
+            continue
+        if key.startswith("task_"):
+            if "nnodes" in settings:
+                nodes = int(settings["nnodes"])
+                cores = nodes * int(settings.get("ppn", 1))
+            else:
+                nodes, cores = 1, int(settings.get("cores", 1))
+        elif key.startswith("metatask_"):
+            nodes, cores = _rocoto_peak_resources(settings)
+            values = [str(value).split() for value in settings.get("var", {}).values()]
+            members = min(len(value) for value in values) if values else 1
+            nodes, cores = members * nodes, members * cores
+        else:
+            continue
+        peak_nodes, peak_cores = max(peak_nodes, nodes), max(peak_cores, cores)
+    return peak_nodes, peak_cores
+
+
+def estimate_expt_demand(expt_dir: str, history: dict = None) -> dict:
+    """
+    Estimates the resources an experiment needs: the nodes and cores its tasks can use at the same
+    time, from its rocoto YAML, and its runtime. The runtime is taken from the runtime history of
+    earlier runs of the test if there is one, and otherwise estimated from the relative cost of its
+    forecasts given by calculate_cost().
+
+    Args:
+        expt_dir (str): The experiment directory
+        history (dict): [optional] Runtimes of earlier runs in seconds, by test name, see
+                        RuntimeHistory.experiment_walltimes()
+
+    Returns:
+        dict: The "nodes", "cores", "seconds" and "core_hours" of the experiment
+    """
+    var_defns_fp = os.path.join(expt_dir, "var_defns.yaml")
+    rocoto_cfg = load_config_file(os.path.join(expt_dir, "rocoto_defns.yaml"))
+    nodes, cores = _rocoto_peak_resources(rocoto_cfg.get("tasks", {}))
+    nodes, cores = max(nodes, 1), max(cores, 1)
+
+    test_name = os.path.basename(os.path.normpath(expt_dir))
+    if history and test_name in history:
+        seconds = history[test_name]
+    else:
+        cfg = load_config_file(var_defns_fp)
+        try:
+            dt_atmos, npts, ref_dt_atmos, ref_npts = calculate_cost(var_defns_fp)
+            relative_cost = (npts / dt_atmos) / (ref_npts / ref_dt_atmos)
+        except Exception as e:
+            logging.debug(f"Could not calculate the cost of {expt_dir}: {e}")
+            relative_cost = 1
+        num_fcsts = len(all_cycle_dates(cfg)) * cfg["workflow"]["FCST_LEN_HRS"] / 6
+        seconds = EXPT_OVERHEAD_SECONDS + relative_cost * num_fcsts * REFERENCE_FCST_SECONDS
+
+    return {"nodes": nodes, "cores": cores, "seconds": seconds,
+            "core_hours": cores * seconds / 3600}
+
+
+class AdmissionScheduler:
+    """Decides when the experiments of a test suite are started, so that the estimated resources
+    of the running experiments stay within a budget of nodes in use and/or core-hours in flight.
+    Waiting experiments are admitted longest-first, so that the longest tests do not end up
+    running alone at the end of the suite; shorter ones fill the remaining budget. An experiment
+    larger than the whole budget is started once nothing else is running.
+
+    Args:
+        demands        (dict): Estimated demand of each experiment, see estimate_expt_demand()
+        max_nodes       (int): [optional] Largest number of nodes used by running experiments
+        max_core_hours (float): [optional] Largest number of core-hours of running experiments
+        admitted       (list): [optional] Experiments that are already running
+    """
+
+    def __init__(self, demands: dict, max_nodes: int = None, max_core_hours: float = None,
+                 admitted: list = ()):
+        self.demands = demands
+        self.max_nodes = max_nodes
+        self.max_core_hours = max_core_hours
+        self.admitted = set(admitted)
+        self.pending = sorted((name for name in demands if name not in self.admitted),
+                              key=lambda name: -demands[name]["seconds"])
+
+    def in_use(self) -> tuple:
+        """Nodes and core-hours of the running experiments"""
+        return (sum(self.demands[name]["nodes"] for name in self.admitted),
+                sum(self.demands[name]["core_hours"] for name in self.admitted))
+
+    def _fits(self, name: str, nodes: int, core_hours: float) -> bool:
+        demand = self.demands[name]
+        if self.max_nodes and nodes + demand["nodes"] > self.max_nodes:
+            return False
+        if self.max_core_hours and core_hours + demand["core_hours"] > self.max_core_hours:
+            return False
+        return True
+
+    def admit(self) -> list:
+        """Admits the waiting experiments that fit in the remaining budget
+
+        Returns:
+            list: The newly admitted experiments, which should be started
+        """
+        nodes, core_hours = self.in_use()
+        admitted = []
+        for name in self.pending:
+            if self._fits(name, nodes, core_hours) or not (self.admitted or admitted):
+                admitted.append(name)
+                nodes += self.demands[name]["nodes"]
+                core_hours += self.demands[name]["core_hours"]
+        for name in admitted:
+            self.pending.remove(name)
+            self.admitted.add(name)
+            logging.debug(f"Admitting experiment {name}: {self.demands[name]}")
+        return admitted
+
+    def release(self, name: str):
+        """Returns the resources of a finished experiment to the budget"""
+        self.admitted.discard(name)
+
 
 def print_test_info(txtfile: str = "WE2E_test_info.txt") -> None:
     """Prints a pipe ( | ) delimited text file containing summaries of each test defined by a
@@ -421,11 +910,11 @@ def print_test_info(txtfile: str = "WE2E_test_info.txt") -> None:
     """
 
     testfiles = glob.glob('test_configs/**/config*.yaml', recursive=True)
+    configs = [load_config_file(testfile) for testfile in testfiles]
     testdict = dict()
     links = dict()
-    for testfile in testfiles:
-        # Calculate relative cost of test based on config settings using legacy script
-        cost_array = calculate_cost(testfile)
+    # Calculate relative cost of each test based on config settings, all at once
+    for testfile, config, cost_array in zip(testfiles, configs, calculate_costs(configs)):
         cost = cost_array[1] / cost_array[3]
         #Decompose full file path into relevant bits
         pathname, filename = os.path.split(testfile)
@@ -441,7 +930,7 @@ def print_test_info(txtfile: str = "WE2E_test_info.txt") -> None:
             targettestname = targetfilename[7:-5]
             links[testname] = (testname, dirname, targettestname)
         else:
-            testdict[testname] = load_config_file(testfile)
+            testdict[testname] = config
             testdict[testname]["directory"] = dirname
             testdict[testname]["cost"] = cost
             #Calculate number of forecasts for a cycling run
@@ -507,44 +996,40 @@ def print_test_info(txtfile: str = "WE2E_test_info.txt") -> None:
             f.write("\n")
 
 
-def compare_rocotostat(expt_dict,name):
-    """Reads the dictionary showing the location of a given experiment, runs a `rocotostat` command
-    to get the full set of tasks for the experiment, and compares the two to see if there are any
-    unsubmitted tasks remaining.
-    """
-
-    # Call rocotostat and store output
-    rocoto_db = f"{expt_dict['expt_dir']}/FV3LAM_wflow.db"
-    rocoto_xml = f"{expt_dict['expt_dir']}/FV3LAM_wflow.xml"
-    rocotorun_cmd = ["rocotostat", f"-w {rocoto_xml}", f"-d {rocoto_db}", "-v 10"]
-    p = subprocess.run(rocotorun_cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
-    rsout = p.stdout
-
-    # Parse each line of rocotostat output, extracting relevant information
-    untracked_tasks = []
-    for line in rsout.split('\n'):
-        # Skip blank lines and dividing lines of '=====...'
-        if not line:
-            continue
-        if line[0] == '=':
-            continue
+def _rocotostat_tasks(rocoto_xml: str, rocoto_db: str) -> list:
+    """Names (TASKNAME_CYCLE) of all tasks listed by `rocotostat`, for workflows whose XML
+    can not be expanded by rocoto_xml.expected_tasks()"""
+    rocotostat_cmd = ["rocotostat", f"-w {rocoto_xml}", f"-d {rocoto_db}", "-v 10"]
+    p = subprocess.run(rocotostat_cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    tasks = []
+    for line in p.stdout.split('\n'):
+        # Lines describing jobs are in the form:
+        # ['cycle','task','jobid','status','exit status','num tries','walltime']; skip the
+        # header, dividing lines and any messages from rocoto itself
         line_array = line.split()
-        # Skip header lines
-        if line_array[0] == 'CYCLE' or line_array[0] == '/apps/rocoto/1.3.3/lib/workflowmgr/launchserver.rb:40:':
+        if len(line_array) < 2 or not re.fullmatch(r'\d{12}', line_array[0]):
             continue
-        # We should now just have lines describing jobs, in the form:
-        # line_array = ['cycle','task','jobid','status','exit status','num tries','walltime']
+        tasks.append(f'{line_array[1]}_{line_array[0]}')
+    return tasks
 
-        # As defined in update_expt_status(), the "task names" in the dictionary are a combination
-        # of the task name and cycle
-        taskname = f'{line_array[1]}_{line_array[0]}'
 
-        # If we're already tracking this task, continue
-        if expt_dict.get(taskname):
-            continue
+def check_untracked_tasks(expt_dict: dict, name: str) -> dict:
+    """Compares the tasks of an experiment dictionary with the full set of tasks of the
+    experiment's workflow to see if there are any unsubmitted tasks remaining, and updates the
+    experiment status accordingly.
+    """
+
+    rocoto_db = f"{expt_dict['expt_dir']}/FV3LAM_wflow.db"
+    rocoto_xml = f"{expt_dict['expt_dir']}/FV3LAM_wflow.xml"
+    try:
+        expected = expected_tasks(rocoto_xml)
+    except (ValueError, ParseError) as e:
+        logging.debug(f"Could not expand the tasks of {rocoto_xml} ({e}); calling rocotostat")
+        expected = _rocotostat_tasks(rocoto_xml, rocoto_db)
 
-        # Otherwise, extract information into dictionary of untracked tasks
-        untracked_tasks.append(taskname)
+    # As defined in update_expt_status(), the "task names" in the dictionary are a combination
+    # of the task name and cycle
+    untracked_tasks = sorted(task for task in expected if not expt_dict.get(task))
 
     if untracked_tasks:
         # We want to give this a couple loops before reporting that it is "stuck"
@@ -553,9 +1038,9 @@ def compare_rocotostat(expt_dict,name):
         elif expt_dict['status'] == 'STALLED':
             expt_dict['status'] = 'STUCK'
         elif expt_dict['status'] == 'STUCK':
-            msg = f"WARNING: For experiment {name}, there are jobs that are not being submitted:"
+            msg = f"WARNING: For experiment {name}, there are jobs that are not being submitted:\n"
             for ut in untracked_tasks:
-                msg += ut
+                msg += f"{ut}\n"
             msg = msg + f"""WARNING: For experiment {name},
                 there are some jobs that are not being submitted.
                 It could be that your jobs are being throttled at the system level, or
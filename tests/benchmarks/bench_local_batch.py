@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark of the throughput of the local batch system with dummy jobs.
+
+A number of jobs that sleep for a moment are submitted to a fresh job table
+and run by the executor within a number of cores; the submission rate, the
+job throughput against the ideal one for the number of cores, and the time of
+squeue and sacct queries with all jobs in the table are reported.
+
+To run it, issue the following command from the top-level directory:
+    PYTHONPATH=$(pwd)/ush python3 tests/benchmarks/bench_local_batch.py
+"""
+
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+import timeit
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "ush"))
+
+# pylint: disable=wrong-import-position
+from local_batch import Executor, LocalBatch, sacct, squeue
+
+
+def main():
+    """Time the dummy jobs and print a summary"""
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-n", "--number", type=int, default=200,
+                        help="Number of jobs to run")
+    parser.add_argument("-c", "--cores", type=int, default=8,
+                        help="Number of cores the jobs may use")
+    parser.add_argument("-s", "--sleep", type=float, default=0.1,
+                        help="Seconds each job sleeps")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir, LocalBatch(tmp_dir) as batch:
+        script = ("#!/bin/bash\n#SBATCH --job-name=dummy\n#SBATCH -t 00:05:00\n"
+                  f"#SBATCH --ntasks=1\nsleep {args.sleep}\n")
+        t0 = time.perf_counter()
+        ids = [batch.submit(script, workdir=tmp_dir) for _ in range(args.number)]
+        t_submit = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        Executor(batch, args.cores).run(idle_exit=0, poll_interval=1)
+        t_run = time.perf_counter() - t0
+        ideal = args.number * args.sleep / args.cores
+        states = {job["state"] for job in batch.jobs(ids)}
+
+        def query(func, argv):
+            with redirect_stdout(io.StringIO()):
+                func(batch, argv)
+
+        job_list = ",".join(str(i) for i in ids[-50:])
+        t_squeue = timeit.timeit(lambda: query(squeue, []), number=20) / 20
+        t_sacct = timeit.timeit(lambda: query(sacct, [f"--jobs={job_list}"]), number=20) / 20
+
+    print(f"{args.number} jobs of {args.sleep} s on {args.cores} cores "
+          f"(states: {', '.join(sorted(states))})")
+    print(f"  submit: {1e3 * t_submit / args.number:8.3f} ms/job")
+    print(f"  run:    {t_run:8.3f} s, {args.number / t_run:8.1f} jobs/s "
+          f"({100 * ideal / t_run:5.1f}% of ideal)")
+    print(f"  squeue: {1e3 * t_squeue:8.3f} ms")
+    print(f"  sacct:  {1e3 * t_sacct:8.3f} ms (50 jobs)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark of updating a few values of parm/input.nml.FV3.
+
+The seed update made by set_fv3nml_ens_stoch_seeds is timed with the in-place
+patcher, once with indexing the file on every call and once with a single
+index reused for all members, and with a full uwtools realize when uwtools is
+installed.
+
+To run it, issue the following command from the top-level directory:
+    PYTHONPATH=$(pwd)/ush python3 tests/benchmarks/bench_nml_patch.py
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "ush"))
+
+# pylint: disable=wrong-import-position
+from nml_patch import NamelistPatcher, patch_nml_file
+
+try:
+    from uwtools.api.config import get_nml_config, realize
+except ImportError:
+    realize = None
+
+NML_FP = os.path.join(os.path.dirname(__file__), "..", "..", "parm", "input.nml.FV3")
+
+
+def seed_settings(member):
+    """Stochastic seeds of one member, as set by set_fv3nml_ens_stoch_seeds"""
+
+    base = 2021010100 * 1000 + member * 10
+    return {
+        "nam_stochy": {"iseed_sppt": base + 1, "iseed_shum": base + 2, "iseed_skeb": base + 3},
+        "nam_sppperts": {"iseed_spp": [base + 4, base + 5, base + 6]},
+        "nam_sfcperts": {"iseed_lndp": [base + 9]},
+    }
+
+
+def main():
+    """Time the namelist updates and print a summary"""
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-n", "--number", type=int, default=200,
+                        help="Number of members to write")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        out_fp = os.path.join(tmp_dir, "input.nml")
+        members = iter(range(10**9))
+
+        def run_patch_file():
+            patch_nml_file(NML_FP, seed_settings(next(members)), out_fp)
+
+        patcher = NamelistPatcher.from_file(NML_FP)
+
+        def run_patch_indexed():
+            with open(out_fp, "w", encoding="utf-8") as f:
+                f.write(patcher.patch(seed_settings(next(members))))
+
+        def run_realize():
+            realize(
+                input_config=NML_FP,
+                input_format="nml",
+                output_file=out_fp,
+                output_format="nml",
+                update_config=get_nml_config(seed_settings(next(members))),
+            )
+
+        with open(NML_FP, encoding="utf-8") as f:
+            num_lines = len(f.readlines())
+        print(f"{NML_FP}: {num_lines} lines, {args.number} members")
+        for name, func in (("patch (index per call)", run_patch_file),
+                           ("patch (shared index)  ", run_patch_indexed),
+                           ("uwtools realize       ", run_realize)):
+            if func is run_realize and realize is None:
+                print(f"  {name}: uwtools is not installed")
+                continue
+            t = timeit.timeit(func, number=args.number)
+            print(f"  {name}: {1e3 * t / args.number:8.3f} ms/member")
+
+
+if __name__ == "__main__":
+    main()
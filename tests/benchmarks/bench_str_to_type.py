@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+"""
+Micro-benchmark for python_utils.str_to_type.
+
+Every value of ush/config_defaults.yaml is converted the way the workflow
+does when it loads shell/ini/xml configs: with the previous try/except
+implementation, with the regex classifier alone (memo cache bypassed) and
+through the cached entry point.
+
+To run it, issue the following command from the top-level directory:
+    PYTHONPATH=$(pwd)/ush python3 tests/benchmarks/bench_str_to_type.py
+"""
+
+import argparse
+import os
+import sys
+import timeit
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "ush"))
+
+# pylint: disable=wrong-import-position,protected-access
+from python_utils import environment, flatten_dict, load_config_file, type_to_str
+
+
+def legacy_str_to_type(s):
+    """The try/except conversion str_to_type used before the classifier"""
+
+    s = s.strip("\"'")
+    if s.lower() in ["true", "yes", "yeah"]:
+        return True
+    if s.lower() in ["false", "no", "nope"]:
+        return False
+    if s in ["None", "null"]:
+        return None
+    formats = {8: "%Y%m%d", 10: "%Y%m%d%H", 12: "%Y%m%d%H%M", 14: "%Y%m%d%H%M%S"}
+    try:
+        return datetime.strptime(s, formats[len(s)])
+    except (KeyError, ValueError):
+        pass
+    try:
+        v = int(s)
+        return s if len(s) > 1 and s[0] == "0" else v
+    except ValueError:
+        pass
+    try:
+        return float(s)
+    except ValueError:
+        pass
+    return s
+
+
+def sample_strings():
+    """Collect the string form of every default config value"""
+
+    ushdir = os.path.join(os.path.dirname(__file__), "..", "..", "ush")
+    cfg = flatten_dict(load_config_file(os.path.join(ushdir, "config_defaults.yaml")))
+    strings = []
+    for v in cfg.values():
+        if isinstance(v, list):
+            strings.extend(type_to_str(i) for i in v)
+        elif not isinstance(v, dict):
+            strings.append(type_to_str(v))
+    return strings
+
+
+def main():
+    """Time the uncached and cached conversions and print a summary"""
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-n", "--number", type=int, default=20,
+                        help="Number of passes over the sample strings")
+    args = parser.parse_args()
+
+    strings = sample_strings()
+    uncached = environment._classify_str.__wrapped__
+
+    def run_legacy():
+        for s in strings:
+            legacy_str_to_type(s)
+
+    def run_uncached():
+        for s in strings:
+            uncached(s.strip("\"'"), 0)
+
+    def run_cached():
+        for s in strings:
+            environment.str_to_type(s)
+
+    t_legacy = timeit.timeit(run_legacy, number=args.number)
+    t_uncached = timeit.timeit(run_uncached, number=args.number)
+    t_cached = timeit.timeit(run_cached, number=args.number)
+    calls = len(strings) * args.number
+    print(f"{len(strings)} config values ({len(set(strings))} distinct), {args.number} passes")
+    print(f"  legacy try/except: {1e6 * t_legacy / calls:8.3f} us/call")
+    print(f"  regex classifier : {1e6 * t_uncached / calls:8.3f} us/call")
+    print(f"  memoized         : {1e6 * t_cached / calls:8.3f} us/call")
+    print(f"  {environment._classify_str.cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
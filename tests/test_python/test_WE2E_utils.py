@@ -0,0 +1,264 @@
+""" Tests for the utilities of the WE2E test scripts """
+
+#pylint: disable=invalid-name
+
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+from contextlib import closing
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "WE2E"))
+
+# pylint: disable=wrong-import-position,import-error
+from monitor_jobs import monitor_jobs, resume_command
+from python_utils import cfg_to_yaml_str
+from utils import (AdmissionScheduler, MonitorStore, PollScheduler, QueueWaitTracker,
+                   _update_expt_status_worker, check_untracked_tasks, close_rocoto_db,
+                   estimate_expt_demand, load_monitor_file, read_rocoto_jobs,
+                   update_expt_status, update_expt_status_parallel)
+
+WORKFLOW_XML = """<?xml version="1.0"?>
+<workflow realtime="F" scheduler="slurm">
+  <cycledef group="forecast">202101010000 202101010000 06:00:00</cycledef>
+  <task name="make_grid" cycledefs="forecast"><cores>1</cores></task>
+  <task name="run_fcst" cycledefs="forecast"><cores>4</cores></task>
+</workflow>
+"""
+
+
+class Testing(unittest.TestCase):
+    """ Define the tests """
+
+    def test_read_rocoto_jobs(self):
+        """ Each fresh experiment dictionary gets the current states of the
+        jobs, whatever was read into another one before """
+        self.write_rocoto_db([(1, "make_grid", "SUCCEEDED"), (2, "run_fcst", "RUNNING")])
+        first = self.new_expt()
+        self.assertEqual(update_expt_status(first, "expt", submit=False)["status"], "RUNNING")
+
+        self.write_rocoto_db([(1, "make_grid", "SUCCEEDED"), (2, "run_fcst", "DEAD")])
+        expt = update_expt_status(self.new_expt(), "expt", submit=False)
+        self.assertEqual(expt["status"], "DEAD")
+        self.assertEqual(expt["run_fcst_202101010000"]["status"], "DEAD")
+
+        # An older copy, with as many tasks as were read
+        stale = {key: dict(value) if isinstance(value, dict) else value
+                 for key, value in first.items()}
+        counts = read_rocoto_jobs(stale, self.rocoto_db)
+        self.assertEqual(dict(+counts), {"SUCCEEDED": 1, "DEAD": 1})
+
+    def test_poll_scheduler(self):
+        """ An experiment is polled less often while nothing changes, even as
+        its rocoto database is rewritten, and promptly again once a job
+        changes state """
+        self.write_rocoto_db([(1, "run_fcst", "QUEUED")])
+        expt = {**self.new_expt(), "status": "QUEUED",
+                "run_fcst_202101010000": {"status": "QUEUED"}}
+        scheduler = PollScheduler(min_interval=5, max_interval=30)
+        intervals = []
+        for now in range(6):
+            self.write_rocoto_db([(1, "run_fcst", "QUEUED")])
+            intervals.append(scheduler.record("expt", expt, now=now * 100))
+        self.assertEqual(intervals, [5, 10, 20, 30, 30, 30])
+        self.assertEqual(scheduler.due(["expt"], now=520), [])
+        self.assertEqual(scheduler.due(["expt"], now=530), ["expt"])
+
+        expt.update(status="RUNNING", run_fcst_202101010000={"status": "RUNNING"})
+        self.assertEqual(scheduler.record("expt", expt, now=600), 5)
+        # Running experiments back off to half the maximum interval
+        self.assertEqual([scheduler.record("expt", expt, now=now) for now in [700, 800, 900]],
+                         [10, 15, 15])
+
+    def test_admission_scheduler(self):
+        """ Experiments are started longest first within the node and
+        core-hour budgets, and the rest as running ones finish """
+        demands = {
+            "long": {"nodes": 4, "seconds": 7200, "core_hours": 100},
+            "medium": {"nodes": 3, "seconds": 3600, "core_hours": 40},
+            "short": {"nodes": 1, "seconds": 600, "core_hours": 5},
+            "huge": {"nodes": 20, "seconds": 10, "core_hours": 1},
+        }
+        scheduler = AdmissionScheduler(demands, max_nodes=6)
+        self.assertEqual(scheduler.admit(), ["long", "short"])
+        self.assertEqual(scheduler.in_use(), (5, 105))
+        self.assertEqual(scheduler.admit(), [])
+        scheduler.release("long")
+        self.assertEqual(scheduler.admit(), ["medium"])
+        # An experiment larger than the budget starts once nothing else runs
+        scheduler.release("medium")
+        scheduler.release("short")
+        self.assertEqual(scheduler.admit(), ["huge"])
+
+        scheduler = AdmissionScheduler(demands, max_core_hours=50, admitted=["short"])
+        self.assertEqual(scheduler.admit(), ["medium", "huge"])
+        self.assertEqual(scheduler.pending, ["long"])
+
+    def test_estimate_expt_demand(self):
+        """ The runtime of an experiment comes from the history if it has
+        one, and from the relative cost of its forecasts otherwise """
+        expt_dir = os.path.join(self.tmp_dir.name, "grid_RRFS_CONUS_25km")
+        os.makedirs(expt_dir)
+        with open(os.path.join(expt_dir, "rocoto_defns.yaml"), "w", encoding="utf-8") as f:
+            f.write(cfg_to_yaml_str({"tasks": {
+                "task_make_grid": {"nnodes": 1, "ppn": 24},
+                "metatask_run_ensemble": {
+                    "var": {"mem": "001 002"},
+                    "task_run_fcst_mem#mem#": {"nnodes": 2, "ppn": 40},
+                },
+            }}))
+        with open(os.path.join(expt_dir, "var_defns.yaml"), "w", encoding="utf-8") as f:
+            f.write(cfg_to_yaml_str({"workflow": {
+                "PREDEF_GRID_NAME": "RRFS_CONUS_25km", "DATE_FIRST_CYCL": "2019061500",
+                "DATE_LAST_CYCL": "2019061512", "INCR_CYCL_FREQ": 12, "FCST_LEN_HRS": 12,
+            }}))
+
+        demand = estimate_expt_demand(expt_dir)
+        self.assertEqual((demand["nodes"], demand["cores"]), (4, 160))
+        # Two 12-hour forecasts on the reference grid, and the other tasks
+        self.assertEqual(demand["seconds"], 1200 + 4 * 900)
+        self.assertEqual(demand["core_hours"], 160 * 4800 / 3600)
+
+        demand = estimate_expt_demand(expt_dir, {"grid_RRFS_CONUS_25km": 1800})
+        self.assertEqual((demand["seconds"], demand["core_hours"]), (1800, 80))
+
+    def test_resume_command(self):
+        """ The command to resume monitoring keeps the budget in effect """
+        self.assertEqual(resume_command("tests.yaml", 4),
+                         "./monitor_jobs.py -y=tests.yaml -p=4")
+        self.assertEqual(resume_command("tests.yaml", max_nodes=10, max_core_hours=500.0,
+                                        history_db="history.db", max_poll_interval=60),
+                         "./monitor_jobs.py -y=tests.yaml -p=1 --max_poll_interval=60 "
+                         "--max_nodes=10 --max_core_hours=500.0 --history_db='history.db'")
+
+    @mock.patch.dict("utils._EXPT_TOKENS")
+    @mock.patch.dict("utils._WORKER_EXPTS")
+    def test_update_expt_status_parallel(self):
+        """ Workers get only the top-level fields of the experiments, keep
+        their task entries, and send back only the entries that changed,
+        which are merged into the experiments """
+        self.write_rocoto_db([(1, "make_grid", "SUCCEEDED"), (2, "run_fcst", "QUEUED")])
+        fields = self.new_expt()
+        with mock.patch("utils.subprocess.run") as rocotorun:
+            # Without a copy of the experiment, the worker reads all of its tasks
+            name, changes, token = _update_expt_status_worker(("expt", fields, None, False, False))
+            self.assertEqual(name, "expt")
+            self.assertEqual(sorted(changes),
+                             ["make_grid_202101010000", "run_fcst_202101010000", "status"])
+            self.assertEqual(rocotorun.call_count, 2)
+            _, changes, token = _update_expt_status_worker(
+                ("expt", {**fields, "status": "QUEUED"}, token, False, False))
+            self.assertEqual(changes, {})
+            self.write_rocoto_db([(1, "make_grid", "SUCCEEDED"), (2, "run_fcst", "RUNNING")])
+            _, changes, token = _update_expt_status_worker(
+                ("expt", {**fields, "status": "QUEUED"}, token, False, False))
+            self.assertEqual(sorted(changes), ["run_fcst_202101010000", "status"])
+
+            other_dir = os.path.join(self.tmp_dir.name, "other")
+            os.makedirs(other_dir)
+            expts = {"expt": {**fields, "make_grid_202101010000":
+                              {"status": "SUCCEEDED", "cores": 4, "walltime": 60.0}},
+                     "other": {**self.new_expt(), "expt_dir": other_dir}}
+            pool = mock.Mock()
+            pool.imap_unordered.side_effect = map
+            update_expt_status_parallel(expts, 2, pool=pool)
+            for args in pool.imap_unordered.call_args[0][1]:
+                self.assertFalse(any(isinstance(value, dict) for value in args[1].values()))
+            self.assertEqual(expts["expt"]["run_fcst_202101010000"]["status"], "RUNNING")
+
+            # Forked workers inherit the patched rocotorun
+            expts["expt"]["status"] = "CREATED"
+            with multiprocessing.get_context("fork").Pool(2) as fork_pool:
+                update_expt_status_parallel(expts, 2, pool=fork_pool)
+        self.assertEqual(expts["expt"]["status"], "RUNNING")
+        self.assertEqual(expts["expt"]["make_grid_202101010000"]["status"], "SUCCEEDED")
+        self.assertEqual(expts["expt"]["run_fcst_202101010000"]["status"], "RUNNING")
+        self.assertEqual(expts["other"]["status"], "ERROR")
+
+    def test_monitor_store(self):
+        """ Only the changed fields are journaled, and the journal is read
+        back with the monitor file and compacted into it """
+        monitor_file = os.path.join(self.tmp_dir.name, "WE2E_tests.yaml")
+        expts = {"a": {**self.new_expt(), "run_fcst_202101010000": {"status": "QUEUED"}},
+                 "b": self.new_expt()}
+        store = MonitorStore(monitor_file)
+        store.compact(expts)
+        expts["a"]["status"] = "RUNNING"
+        expts["a"]["run_fcst_202101010000"]["status"] = "RUNNING"
+        store.update(expts, ["a", "b"])
+        with open(store.journal_file, encoding="utf-8") as f:
+            self.assertEqual(f.read().count("\n"), 1)
+        self.assertEqual(load_monitor_file(monitor_file), expts)
+
+        # Nothing is written when nothing changed
+        size = os.path.getsize(store.journal_file)
+        store.update(expts)
+        self.assertEqual(os.path.getsize(store.journal_file), size)
+        store._compact_bytes = 0  # pylint: disable=protected-access
+        expts["b"]["status"] = "DEAD"
+        store.update(expts, ["b"])
+        self.assertFalse(os.path.exists(store.journal_file))
+        self.assertEqual(load_monitor_file(monitor_file), expts)
+
+    def test_check_untracked_tasks(self):
+        """ An experiment whose tasks all succeeded is complete only once
+        every task of its workflow has run """
+        with open(os.path.join(self.tmp_dir.name, "FV3LAM_wflow.xml"), "w",
+                  encoding="utf-8") as f:
+            f.write(WORKFLOW_XML)
+        expt = {**self.new_expt(), "status": "SUCCEEDED",
+                "make_grid_202101010000": {"status": "SUCCEEDED"}}
+        statuses = [check_untracked_tasks(expt, "expt")["status"] for _ in range(3)]
+        self.assertEqual(statuses, ["STALLED", "STUCK", "STUCK"])
+        expt["run_fcst_202101010000"] = {"status": "SUCCEEDED"}
+        self.assertEqual(check_untracked_tasks(expt, "expt")["status"], "COMPLETE")
+
+    def test_queue_wait_tracker(self):
+        """ The queue wait of a job is the time from its first update to the
+        first in which it finished, less its walltime """
+        tracker = QueueWaitTracker()
+        expt = {**self.new_expt(), "make_grid_202101010000": {"status": "RUNNING"}}
+        tracker.observe("expt", expt, now=0)
+        expt["run_fcst_202101010000"] = {"status": "QUEUED"}
+        tracker.observe("expt", expt, now=10)
+        expt["make_grid_202101010000"] = {"status": "SUCCEEDED", "walltime": 5.0}
+        expt["run_fcst_202101010000"] = {"status": "SUCCEEDED", "walltime": 30.0}
+        tracker.observe("expt", expt, now=100)
+        tracker.observe("expt", expt, now=200)
+        self.assertEqual(tracker.queue_waits("expt", expt), {"run_fcst_202101010000": 60.0})
+
+    @mock.patch("monitor_jobs.update_expt_status_parallel", side_effect=KeyboardInterrupt)
+    @mock.patch("monitor_jobs.Pool")
+    def test_monitor_jobs_pool(self, pool_class, _):
+        """ The worker pool of the monitor is stopped when it is interrupted """
+        monitor_file = os.path.join(self.tmp_dir.name, "WE2E_tests.yaml")
+        with self.assertRaises(KeyboardInterrupt):
+            monitor_jobs({"expt": self.new_expt()}, monitor_file, procs=2)
+        pool_class.return_value.terminate.assert_called_once()
+        pool_class.return_value.join.assert_called_once()
+
+    def new_expt(self):
+        """ A dictionary of the experiment as first created by the monitor """
+        return {"expt_dir": self.tmp_dir.name, "status": "CREATED", "start_time": 0}
+
+    def write_rocoto_db(self, jobs):
+        """ A rocoto database with the given (id, task, state) jobs """
+        with closing(sqlite3.connect(self.rocoto_db)) as db:
+            with db:
+                db.execute("CREATE TABLE IF NOT EXISTS jobs (id INTEGER PRIMARY KEY, "
+                           "taskname VARCHAR(64), cycle DATETIME, cores INTEGER, "
+                           "state VARCHAR(64), duration REAL)")
+                db.execute("DELETE FROM jobs")
+                db.executemany("INSERT INTO jobs VALUES (?, ?, 1609459200, 4, ?, 60.0)", jobs)
+
+    def setUp(self):
+        # pylint: disable=consider-using-with
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.rocoto_db = os.path.join(self.tmp_dir.name, "FV3LAM_wflow.db")
+
+    def tearDown(self):
+        close_rocoto_db(self.rocoto_db)
+        self.tmp_dir.cleanup()
@@ -4,7 +4,7 @@
 import os
 import unittest
 
-from calculate_cost import calculate_cost
+from calculate_cost import calculate_cost, calculate_costs, predef_grids
 
 class Testing(unittest.TestCase):
     """ Define the tests"""
@@ -15,3 +15,25 @@ class Testing(unittest.TestCase):
         USHdir = os.path.join(test_dir, "..", "..", "ush")
         params = calculate_cost(os.path.join(USHdir, 'config.community.yaml'))
         self.assertCountEqual(params, [150, 28689, 150, 28689])
+
+    def test_calculate_costs(self):
+        """ Test that configs given as dicts or files, with predefined grids
+        or not, share the parameters of the predefined grids."""
+        test_dir = os.path.dirname(os.path.abspath(__file__))
+        USHdir = os.path.join(test_dir, "..", "..", "ush")
+        configs = [
+            os.path.join(USHdir, 'config.community.yaml'),
+            {"task_run_fcst": {"PREDEF_GRID_NAME": "RRFS_CONUS_25km", "DT_ATMOS": 75}},
+            {"GRID_GEN_METHOD": "ESGgrid", "ESGgrid_NX": 10, "ESGgrid_NY": 20,
+             "DT_ATMOS": 60},
+        ]
+        costs = calculate_costs(configs)
+        self.assertEqual(costs, [[150, 28689, 150, 28689],
+                                 [75, 28689, 150, 28689],
+                                 [60, 200, 150, 28689]])
+
+        grids = predef_grids()
+        self.assertEqual(grids["RRFS_CONUS_25km"]["cost"], 28689 / 150)
+        self.assertEqual((grids["CONUS_25km_GFDLgrid"]["NX"],
+                          grids["CONUS_25km_GFDLgrid"]["NY"]), (216, 192))
+        self.assertIs(predef_grids(), grids)
@@ -0,0 +1,56 @@
+""" Tests for check_param_vals.py"""
+
+#pylint: disable=invalid-name
+import os
+import tempfile
+import unittest
+
+from check_param_vals import (
+    check_config_files,
+    check_param_vals,
+    find_invalid_params,
+)
+
+class Testing(unittest.TestCase):
+    """ Define the tests"""
+
+    def test_find_invalid_params(self):
+        """ Test that all invalid values are reported, including list
+        elements, and that valid or empty values are not."""
+        cfg = {
+            "workflow": {
+                "CCPP_PHYS_SUITE": "FV3_GFS_v16",
+                "PREEXISTING_DIR_METHOD": "explode",
+                "VERBOSE": None,
+            },
+            "global": {"DO_SHUM": "maybe"},
+            "verification": {"VX_FCST_MODEL_NAME": "anything"},
+            "task_get_extrn_ics": {"EXTRN_MDL_NAME_ICS": ["FV3GFS", "FOO"]},
+        }
+        invalid = find_invalid_params(cfg)
+        self.assertCountEqual(
+            [k for k, *_ in invalid],
+            ["PREEXISTING_DIR_METHOD", "DO_SHUM", "EXTRN_MDL_NAME_ICS"],
+        )
+        self.assertIn((["FOO"]), [bad for *_, bad, _ in invalid])
+
+        with self.assertRaises(ValueError) as ctx:
+            check_param_vals(cfg)
+        self.assertIn("Found 3 invalid", str(ctx.exception))
+
+        cfg["global"]["DO_SHUM"] = "{{ workflow.DO_ENSEMBLE }}"
+        self.assertEqual(len(find_invalid_params(cfg, skip_templates=True)), 2)
+
+    def test_check_config_files(self):
+        """ Test that config files are checked without generating an
+        experiment."""
+        with tempfile.TemporaryDirectory(dir=os.path.abspath(".")) as tmp_dir:
+            good = os.path.join(tmp_dir, "good.yaml")
+            bad = os.path.join(tmp_dir, "bad.yaml")
+            with open(good, "w", encoding="utf-8") as f:
+                f.write("user:\n  MACHINE: hera\nworkflow:\n  CCPP_PHYS_SUITE: FV3_HRRR\n")
+            with open(bad, "w", encoding="utf-8") as f:
+                f.write("workflow:\n  CCPP_PHYS_SUITE: FV3_NOPE\n")
+            errors = check_config_files([good, bad], procs=2)
+            self.assertEqual(list(errors), [bad])
+            self.assertIn("FV3_NOPE", errors[bad])
@@ -0,0 +1,125 @@
+""" Tests for the cost model fitted to the runtime history """
+
+#pylint: disable=invalid-name
+
+import os
+import tempfile
+import unittest
+
+from calculate_cost import experiment_params
+from cost_model import cost_terms, fit_cost_model, fit_terms, predict_core_hours
+from runtime_history import RuntimeHistory
+
+# Core-seconds per unit of each term of the synthetic experiments
+TRUE_COEFS = {
+    "forecast": {"work:FV3_GFS_v16": 2e-6, "work:FV3_HRRR": 4e-6, "output": 1e-7,
+                 "startup": 5.0},
+    "post": {"volume": 1e-7, "outputs": 20.0},
+    "vx": {"points": 1e-5, "hours": 30.0},
+}
+
+
+def synthetic_params(i, suite):
+    """ Quantities of a synthetic experiment, varying with i """
+    return {
+        "grid_points": (100 + 40 * i) * (80 + 15 * (i % 3)),
+        "levels": 64 if i % 2 else 127,
+        "dt_atmos": 36.0 + 12 * (i % 4),
+        "suite": suite,
+        "cycles": 1 + i % 3,
+        "fcst_hrs": 6.0 * (1 + i % 5),
+        "members": 1 if i % 4 else 2,
+        "outputs_per_hr": 1,
+        "fcst_mpi_tasks": 48 + 12 * (i % 3),
+        "fcst_write_tasks": 12 * (i % 2),
+        "fcst_threads": 2,
+        "post": True,
+        "vx": True,
+    }
+
+
+def true_core_seconds(category, params):
+    """ Core-seconds of a category of tasks of a synthetic experiment """
+    terms = cost_terms(category, params)
+    return sum(TRUE_COEFS[category][name] * value for name, value in terms.items())
+
+
+class Testing(unittest.TestCase):
+    """ Define the tests """
+
+    def test_fit_cost_model(self):
+        """ The cost model fitted to the history recovers the costs of its
+        experiments, with a coefficient for each physics suite """
+        suites = ["FV3_GFS_v16", "FV3_HRRR"]
+        with RuntimeHistory(os.path.join(self.tmp_dir.name, "history.db")) as history:
+            for i in range(12):
+                params = synthetic_params(i, suites[i % 2])
+                tasks = []
+                for category, task in [("forecast", "run_fcst_mem000"),
+                                       ("post", "run_post_mem000_f000"),
+                                       ("vx", "run_MET_GridStat_vx_APCP01h_mem000")]:
+                    if category == "vx" and i % 3 == 0:
+                        continue
+                    tasks.append({"task": task, "cycle": "202101010000", "cores": 40,
+                                  "walltime": true_core_seconds(category, params) / 40,
+                                  "state": "SUCCEEDED"})
+                history.record(f"expt{i}", "1", tasks, suite=params["suite"],
+                               status="COMPLETE", grid_points=params["grid_points"],
+                               params=params)
+            model = fit_cost_model(history)
+
+        self.assertEqual(model["forecast"]["samples"], 12)
+        self.assertEqual(model["vx"]["samples"], 8)
+        for category, coefs in TRUE_COEFS.items():
+            for name, value in coefs.items():
+                self.assertAlmostEqual(model[category]["coefficients"][name] / value, 1, 4)
+
+        params = synthetic_params(20, "FV3_HRRR")
+        core_hours = predict_core_hours(model, params)
+        for category in TRUE_COEFS:
+            self.assertAlmostEqual(core_hours[category] * 3600
+                                   / true_core_seconds(category, params), 1, 4)
+        self.assertAlmostEqual(core_hours["total"], sum(core_hours[c] for c in TRUE_COEFS))
+
+        # An unknown suite costs as the mean of the others, and an
+        # experiment without vx or post tasks costs nothing for them
+        params.update(suite="FV3_RAP", vx=False, post=False)
+        core_hours = predict_core_hours(model, params)
+        self.assertEqual(list(core_hours), ["forecast", "total"])
+        work = cost_terms("forecast", params)["work:FV3_RAP"]
+        expected = true_core_seconds("forecast", {**params, "suite": "FV3_GFS_v16"}) + 1e-6 * work
+        self.assertAlmostEqual(core_hours["forecast"] * 3600 / expected, 1, 4)
+
+    def test_fit_terms(self):
+        """ A term that only makes the fit worse is left out rather than
+        given a negative coefficient """
+        samples = [({"a": x, "b": 1.0}, 3.0 * x) for x in [1.0, 2.0, 4.0, 8.0]]
+        samples[0] = ({"a": 1.0, "b": 1.0}, 2.5)
+        coefs = fit_terms(samples)
+        self.assertEqual(list(coefs), ["a"])
+        self.assertGreater(coefs["a"], 0)
+
+    def test_experiment_params(self):
+        """ The quantities of an experiment are taken from its config, its
+        predefined grid and the defaults """
+        params = experiment_params({
+            "workflow": {"PREDEF_GRID_NAME": "RRFS_CONUS_25km",
+                         "CCPP_PHYS_SUITE": "FV3_GFS_v16",
+                         "DATE_FIRST_CYCL": "2019061500", "DATE_LAST_CYCL": "2019061512",
+                         "INCR_CYCL_FREQ": 6, "FCST_LEN_HRS": 6},
+            "global": {"DO_ENSEMBLE": True, "NUM_ENS_MEMBERS": 2},
+            "rocoto": {"tasks": {"taskgroups": "verify_det.yaml"}},
+        })
+        self.assertEqual(params["grid_points"], 219 * 131)
+        self.assertEqual((params["cycles"], params["fcst_hrs"], params["members"]), (3, 18, 2))
+        self.assertEqual(params["dt_atmos"], 150.0)
+        self.assertGreater(params["fcst_mpi_tasks"], params["fcst_write_tasks"])
+        self.assertTrue(params["vx"])
+        self.assertTrue(params["post"])
+
+    def setUp(self):
+        # pylint: disable=consider-using-with
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
@@ -0,0 +1,83 @@
+""" Tests for the critical path of a workflow """
+
+#pylint: disable=invalid-name
+
+import os
+import sqlite3
+import tempfile
+import unittest
+from contextlib import closing
+from datetime import datetime, timezone
+
+from critical_path import CriticalPath, Runtimes, report
+from local_workflow import Workflow
+
+ROCOTO_CONFIG = {
+    "entities": {"DATA": "/data"},
+    "cycledefs": {"forecast": ["202101010000 202101010600 06:00:00"]},
+    "tasks": {
+        "task_make_grid": {"command": "true", "walltime": "00:01:40", "nodes": "1:ppn=1"},
+        "metatask_fcst": {
+            "var": {"mem": "001 002"},
+            "task_fcst_mem#mem#": {
+                "command": "true",
+                "walltime": "00:10:00",
+                "nodes": "4:ppn=10",
+                "dependency": {"and": {
+                    "datadep": {"text": "&DATA;/make_grid_task_complete.txt"},
+                    "or": {
+                        "not": {"taskvalid": {"attrs": {"task": "post",
+                                                        "cycle_offset": "-06:00:00"}}},
+                        "taskdep": {"attrs": {"task": "post", "cycle_offset": "-06:00:00"}},
+                    },
+                }},
+            },
+        },
+        "task_post": {
+            "command": "true",
+            "walltime": "00:00:10",
+            "cores": "5",
+            "dependency": {"or": {
+                "metataskdep": {"attrs": {"metatask": "fcst"}},
+                "streq": {"left": "a", "right": "b"},
+            }},
+        },
+    },
+}
+
+
+class Testing(unittest.TestCase):
+    """ Define the tests """
+
+    def test_critical_path(self):
+        """ The path, slack and usage follow the dependencies, with measured
+        runtimes taking precedence over walltimes """
+        cycle0 = datetime(2021, 1, 1, 0, tzinfo=timezone.utc)
+        cycle6 = datetime(2021, 1, 1, 6, tzinfo=timezone.utc)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_fp = os.path.join(tmp_dir, "wflow.db")
+            with closing(sqlite3.connect(db_fp)) as db:
+                with db:
+                    db.execute("CREATE TABLE jobs (taskname TEXT, cycle INTEGER, state TEXT, "
+                               "duration REAL)")
+                    db.execute("INSERT INTO jobs VALUES ('fcst_mem002', ?, 'SUCCEEDED', 300.0)",
+                               (int(cycle0.timestamp()),))
+            runtimes = Runtimes([db_fp])
+            analysis = CriticalPath(Workflow(ROCOTO_CONFIG), runtimes, cores_per_node=4)
+
+        self.assertEqual(analysis.makespan(), 100 + 600 + 10 + 600 + 10)
+        self.assertEqual(analysis.critical_path(),
+                         [("make_grid", cycle0), ("fcst_mem001", cycle0), ("post", cycle0),
+                          ("fcst_mem001", cycle6), ("post", cycle6)])
+        slack = analysis.slack()
+        self.assertEqual(slack[("fcst_mem002", cycle0)], 300)
+        self.assertEqual(slack[("make_grid", cycle6)], 610)
+        self.assertEqual(slack[("post", cycle6)], 0)
+        self.assertEqual(analysis.schedule[("post", cycle0)]["nodes"], 2)
+        self.assertEqual(analysis.schedule[("fcst_mem002", cycle6)]["source"], "median")
+
+        stages = analysis.stages()
+        self.assertEqual(stages["fcst_mem#mem#"]["tasks"], 4)
+        self.assertEqual(stages["fcst_mem#mem#"]["max_parallel"], 2)
+        self.assertEqual(max(nodes for _, nodes, _, _ in analysis.usage()), 8)
+        self.assertIn("Critical path:", report(analysis))
@@ -0,0 +1,74 @@
+""" Tests for the content-addressed fix file store """
+
+#pylint: disable=invalid-name
+
+import os
+import tempfile
+import unittest
+
+from fix_store import FixStore
+from stage_fix_files import resolve_ops, stage_files
+
+
+class Testing(unittest.TestCase):
+    """ Define the tests """
+
+    def test_deduplication(self):
+        """ Identical files of two experiments share one stored blob """
+        store = FixStore(self.store_dir)
+        for expt in ("expt1", "expt2"):
+            exptdir = os.path.join(self.tmp_dir, expt)
+            stats = stage_files(
+                resolve_ops([(os.path.join(self.src_dir, "*.nc"), exptdir)]),
+                store=store,
+            )
+            self.assertEqual(len(stats["digests"]), 1)
+            store.add_refs(exptdir, stats["digests"])
+
+        blob = store.blob_path(stats["digests"][0])
+        for expt in ("expt1", "expt2"):
+            for fn in ("merra2.aerclim.m01.nc", "merra2.aerclim.m02.nc"):
+                with open(os.path.join(self.tmp_dir, expt, fn), encoding="utf-8") as f:
+                    self.assertEqual(f.read(), "aerosols\n")
+        self.assertEqual(len(store.refs()), 2)
+        self.assertTrue(os.path.exists(blob))
+
+    def test_gc(self):
+        """ Blobs are only removed once no existing experiment uses them """
+        store = FixStore(self.store_dir)
+        exptdir = os.path.join(self.tmp_dir, "expt")
+        os.makedirs(exptdir)
+        digest = store.put(os.path.join(self.src_dir, "merra2.aerclim.m01.nc"))
+        store.add_refs(exptdir, [digest])
+        orphan = store.put(os.path.join(self.src_dir, "optics_BC.dat"))
+
+        result = store.gc(dry_run=True)
+        self.assertEqual(result["blobs"], 1)
+        self.assertTrue(os.path.exists(store.blob_path(orphan)))
+
+        result = store.gc()
+        self.assertEqual(result["experiments"], [])
+        self.assertFalse(os.path.exists(store.blob_path(orphan)))
+        self.assertTrue(os.path.exists(store.blob_path(digest)))
+
+        os.rmdir(exptdir)
+        result = store.gc()
+        self.assertEqual(result["experiments"], [exptdir])
+        self.assertFalse(os.path.exists(store.blob_path(digest)))
+        self.assertEqual(store.refs(), {})
+
+    def setUp(self):
+        # pylint: disable=consider-using-with
+        self.tmp = tempfile.TemporaryDirectory()
+        self.tmp_dir = self.tmp.name
+        self.src_dir = os.path.join(self.tmp_dir, "src")
+        self.store_dir = os.path.join(self.tmp_dir, "store")
+        os.makedirs(self.src_dir)
+        for fn in ("merra2.aerclim.m01.nc", "merra2.aerclim.m02.nc"):
+            with open(os.path.join(self.src_dir, fn), "w", encoding="utf-8") as f:
+                f.write("aerosols\n")
+        with open(os.path.join(self.src_dir, "optics_BC.dat"), "w", encoding="utf-8") as f:
+            f.write("optics\n")
+
+    def tearDown(self):
+        self.tmp.cleanup()
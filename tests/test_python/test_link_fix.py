@@ -7,7 +7,7 @@ import unittest
 
 from python_utils import define_macos_utilities
 
-from link_fix import link_fix
+from link_fix import fix_file_key, index_fix_files, link_fix, symlink_atomic
 
 class Testing(unittest.TestCase):
     """ Define the tests. """
@@ -29,6 +29,54 @@ class Testing(unittest.TestCase):
         )
         self.assertTrue(res == "3357")
 
+    def test_link_fix_sfc_climo(self):
+        """ Test that the surface climatology links, including those without
+        halo in their names, are created without changing directory """
+        cwd = os.getcwd()
+        os.environ["RELATIVE_LINK_FLAG"] = "--relative"
+        res = link_fix(
+            verbose=False,
+            file_group="sfc_climo",
+            source_dir=self.task_dir,
+            target_dir=self.FIXlam,
+            ccpp_phys_suite=self.cfg["CCPP_PHYS_SUITE"],
+            constants=self.cfg["constants"],
+            dot_or_uscore=self.cfg["DOT_OR_USCORE"],
+            nhw=self.cfg["NHW"],
+            run_task=True,
+            sfc_climo_fields=["facsf", "vegetation_type"],
+        )
+        self.assertEqual(res, "3357")
+        self.assertEqual(os.getcwd(), cwd)
+        for fn in ("C3357.facsf.tile7.halo4.nc", "C3357.facsf.tile7.nc",
+                   "C3357.vegetation_type.tile1.nc"):
+            link = os.path.join(self.FIXlam, fn)
+            self.assertTrue(os.path.islink(link))
+            self.assertTrue(os.path.exists(link))
+        self.assertFalse(os.path.isabs(
+            os.readlink(os.path.join(self.FIXlam, "C3357.facsf.tile7.halo0.nc"))))
+
+    def test_index_fix_files(self):
+        """ Test that fix files are indexed by name pattern """
+        index = index_fix_files(self.task_dir)
+        self.assertEqual(
+            index[fix_file_key("C*_oro_data_ls.tile7.halo0.nc")],
+            {"3357": os.path.join(self.task_dir, "C3357_oro_data_ls.tile7.halo0.nc")},
+        )
+        self.assertEqual(fix_file_key("C*_mosaic.halo3.nc"), ("_", "mosaic", None, "3"))
+        self.assertIsNone(fix_file_key("C3357_grid.tile7.nc"))
+
+    def test_symlink_atomic(self):
+        """ Test that a link is replaced in place, even if a temporary link
+        of an interrupted run is left behind """
+        link = os.path.join(self.FIXlam, "C3357_grid.tile7.nc")
+        os.symlink("missing", f"{link}.tmp{os.getpid()}")
+        for fn in ("C3357_grid.tile7.halo3.nc", "C3357_grid.tile7.halo4.nc"):
+            symlink_atomic(os.path.join(self.task_dir, fn), link)
+            self.assertEqual(os.readlink(link), os.path.join(self.task_dir, fn))
+        self.assertEqual(sorted(os.listdir(self.FIXlam)),
+                         ["C3357_grid.tile7.nc", f"C3357_grid.tile7.nc.tmp{os.getpid()}"])
+
     def setUp(self):
         define_macos_utilities()
         test_dir = os.path.dirname(os.path.abspath(__file__))
@@ -0,0 +1,100 @@
+""" Tests for the local batch system """
+
+#pylint: disable=invalid-name
+
+import io
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+from local_batch import Executor, LocalBatch, parse_job_options, sacct, slurm_time, squeue
+
+
+def job_script(command, *options):
+    """ A job script with #SBATCH options """
+    return "#!/bin/bash\n" + "".join(f"#SBATCH {opt}\n" for opt in options) + command + "\n"
+
+
+class Testing(unittest.TestCase):
+    """ Define the tests """
+
+    def test_slurm_time(self):
+        """ Time limits in the formats slurm accepts """
+        self.assertEqual(slurm_time("10"), 600)
+        self.assertEqual(slurm_time("10:30"), 630)
+        self.assertEqual(slurm_time("01:20:00"), 4800)
+        self.assertEqual(slurm_time("1-02"), 93600)
+        self.assertEqual(slurm_time("1-00:00:30"), 86430)
+        self.assertIsNone(slurm_time("UNLIMITED"))
+
+    def test_parse_job_options(self):
+        """ Options are read from #SBATCH lines and the command line """
+        opts = parse_job_options(job_script("true", "--job-name=run_fcst", "-t 00:30:00",
+                                            "--nodes=2-2", "--tasks-per-node=12",
+                                            "-o log/%x.%j"))
+        self.assertEqual(opts, {"name": "run_fcst", "cores": 24, "walltime": 1800,
+                                "output": "log/%x.%j", "error": None})
+        opts = parse_job_options(job_script("true", "--ntasks=4", "--cpus-per-task=2"),
+                                 ["-J", "other"])
+        self.assertEqual((opts["name"], opts["cores"], opts["walltime"]), ("other", 8, None))
+        opts = parse_job_options(job_script("true", "--nodes=4", "--ntasks-per-node=12",
+                                            "hetjob", "--nodes=1", "--ntasks-per-node=2"))
+        self.assertEqual(opts["cores"], 50)
+
+    def test_run_jobs(self):
+        """ Jobs run within the core limit, with their exit codes, output,
+        walltime and cancellation """
+        with LocalBatch(self.tmp_dir.name) as batch:
+            ids = [batch.submit(job_script(f"sleep 0.3; echo job $SLURM_JOB_ID; exit {i}",
+                                           "--ntasks=2", "-o out.%j"), workdir=self.tmp_dir.name)
+                   for i in range(3)]
+            slow = batch.submit(job_script("sleep 30", "-t 0:01", "-n 1"),
+                                workdir=self.tmp_dir.name)
+            cancelled = batch.submit(job_script("true", "-n 1"), workdir=self.tmp_dir.name)
+            batch.cancel([cancelled])
+            self.assertTrue(Executor(batch, cores=5).run(idle_exit=0, poll_interval=0.1))
+
+            jobs = {job["id"]: job for job in batch.jobs(ids + [slow, cancelled])}
+            self.assertEqual([jobs[i]["state"] for i in ids], ["COMPLETED", "FAILED", "FAILED"])
+            self.assertEqual([jobs[i]["exit_code"] for i in ids], [0, 1, 2])
+            self.assertEqual(jobs[slow]["state"], "TIMEOUT")
+            self.assertEqual(jobs[cancelled]["state"], "CANCELLED")
+            # Only two of the 2-core jobs fit in 5 cores at a time
+            self.assertGreaterEqual(jobs[ids[2]]["started"],
+                                    min(jobs[ids[0]]["ended"], jobs[ids[1]]["ended"]))
+            with open(os.path.join(self.tmp_dir.name, f"out.{ids[0]}"), encoding="utf-8") as f:
+                self.assertEqual(f.read(), f"job {ids[0]}\n")
+
+            out = io.StringIO()
+            with redirect_stdout(out):
+                squeue(batch, ["-u", "user", "-t", "all"])
+                sacct(batch, [f"--jobs={ids[1]},{slow}"])
+            lines = out.getvalue().splitlines()
+            self.assertTrue(lines[0].startswith("JOBID"))
+            self.assertEqual(len(lines), 1 + 5 + 1 + 2)
+            self.assertEqual(lines[-2].split("|")[-2:], ["1", "FAILED"])
+            self.assertEqual(lines[-1].split("|")[-1], "TIMEOUT")
+
+    def test_backfill(self):
+        """ A job that does not fit holds back later jobs that would delay it """
+        with LocalBatch(self.tmp_dir.name) as batch:
+            executor = Executor(batch, cores=4)
+            first = batch.submit(job_script("sleep 5", "-n 2", "-t 10:00"))
+            executor.launch()
+            big = batch.submit(job_script("true", "-n 4", "-t 10:00"))
+            short = batch.submit(job_script("true", "-n 2", "-t 1:00"))
+            long = batch.submit(job_script("true", "-n 2", "-t 20:00"))
+            executor.launch()
+            states = {job["id"]: job["state"] for job in batch.jobs([first, big, short, long])}
+            self.assertEqual(states, {first: "RUNNING", big: "PENDING",
+                                      short: "RUNNING", long: "PENDING"})
+            batch.cancel([first, big, long])
+            executor.reap(wait=True)
+
+    def setUp(self):
+        # pylint: disable=consider-using-with
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
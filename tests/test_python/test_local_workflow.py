@@ -0,0 +1,154 @@
+""" Tests for running a rocoto YAML workflow without rocoto """
+
+#pylint: disable=invalid-name
+
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from contextlib import closing
+from unittest import mock
+from datetime import datetime, timezone
+
+from local_workflow import LocalWorkflow, Workflow, cycle_string
+
+
+def touch(path):
+    """ Creates an empty file """
+    with open(path, "w", encoding="utf-8"):
+        pass
+
+
+def rocoto_config(tmp_dir):
+    """ A workflow of two cycles: make_data, then a metatask of two members
+    that wait on it and its data, then a task that waits on the metatask and
+    on the previous cycle, and a task that fails once before it succeeds """
+    return {
+        "attrs": {"cyclethrottle": "1"},
+        "entities": {"TMP": tmp_dir, "DATA": "&TMP;/data", "LOGDIR": "&TMP;/log"},
+        "cycledefs": {"forecast": ["202101010000 202101010600 06:00:00"]},
+        "tasks": {
+            "task_make_data": {
+                "command": "mkdir -p $DATA && echo $PDY$cyc > $DATA/ready_$PDY$cyc",
+                "envars": {"DATA": "&DATA;", "PDY": "<cyclestr>@Y@m@d</cyclestr>",
+                           "cyc": "<cyclestr>@H</cyclestr>"},
+                "join": "<cyclestr>&LOGDIR;/make_data_@Y@m@d@H.log</cyclestr>",
+                "nodes": "1:ppn=2",
+            },
+            "metatask_members": {
+                "var": {"mem": "001 002"},
+                "task_member_#mem#": {
+                    "command": "echo member #mem# > &DATA;/member_#mem#_$cyc",
+                    "envars": {"cyc": "<cyclestr>@H</cyclestr>"},
+                    "dependency": {"and": {
+                        "taskdep": {"attrs": {"task": "make_data"}},
+                        "datadep": {"attrs": {"age": "00:00:00"},
+                                    "text": "<cyclestr>&DATA;/ready_@Y@m@d@H</cyclestr>"},
+                    }},
+                },
+            },
+            "task_finish": {
+                "command": "ls &DATA; > &DATA;/finish_$cyc",
+                "envars": {"cyc": "<cyclestr>@H</cyclestr>"},
+                "dependency": {"and": {
+                    "metataskdep": {"attrs": {"metatask": "members"}},
+                    "or": {
+                        "not": {"taskvalid": {"attrs": {"task": "finish",
+                                                        "cycle_offset": "-06:00:00"}}},
+                        "taskdep": {"attrs": {"task": "finish", "cycle_offset": "-06:00:00"}},
+                    },
+                    "streq": {"left": "a", "right": "a"},
+                }},
+            },
+            "task_flaky": {
+                "attrs": {"maxtries": "2"},
+                "command": "test -f &TMP;/flaky_$cyc || { touch &TMP;/flaky_$cyc; exit 3; }",
+                "envars": {"cyc": "<cyclestr>@H</cyclestr>"},
+            },
+        },
+    }
+
+
+class Testing(unittest.TestCase):
+    """ Define the tests """
+
+    def test_cycle_string(self):
+        """ Cycle strings are filled in for the cycle, with offsets """
+        cycle = datetime(2021, 1, 1, 6, tzinfo=timezone.utc)
+        self.assertEqual(cycle_string('x/<cyclestr>@Y@m@d@H</cyclestr>/<cyclestr '
+                                      'offset="-6:00:00">@H@@</cyclestr>@H', cycle),
+                         "x/2021010106/00@@H")
+
+    def test_workflow(self):
+        """ Metatasks are expanded, and entities resolved within entities """
+        wflow = Workflow(rocoto_config("/tmp/x"))
+        self.assertEqual(sorted(wflow.tasks),
+                         ["finish", "flaky", "make_data", "member_001", "member_002"])
+        self.assertEqual(wflow.metatasks, {"members": ["member_001", "member_002"]})
+        self.assertEqual(wflow.tasks["make_data"]["cores"], 2)
+        self.assertEqual(len(wflow.cycles), 2)
+        self.assertEqual(wflow.expand("&DATA;/#mem#", {"mem": "001"}), "/tmp/x/data/001")
+
+    def test_run(self):
+        """ All tasks run in dependency order, and a second run skips the
+        tasks that succeeded """
+        tmp = self.tmp_dir.name
+        db_fp = os.path.join(tmp, "wflow.db")
+        with LocalWorkflow(Workflow(rocoto_config(tmp)), db_fp, cores=4) as runner:
+            self.assertEqual(runner.run(), {"SUCCEEDED": 10})
+        with open(os.path.join(tmp, "data", "finish_06"), encoding="utf-8") as f:
+            self.assertIn("member_001_06", f.read().split())
+        with open(os.path.join(tmp, "log", "make_data_2021010100.log"), encoding="utf-8") as f:
+            self.assertEqual(f.read(), "")
+        with closing(sqlite3.connect(db_fp)) as db:
+            rows = db.execute("SELECT taskname, state, tries FROM jobs "
+                              "WHERE taskname = 'flaky'").fetchall()
+            self.assertEqual(rows, [("flaky", "SUCCEEDED", 2)] * 2)
+            self.assertEqual(db.execute("SELECT count(done) FROM cycles").fetchone(), (2,))
+
+        os.remove(os.path.join(tmp, "data", "finish_06"))
+        with LocalWorkflow(Workflow(rocoto_config(tmp)), db_fp, cores=4) as runner:
+            self.assertEqual(runner.run(), {"SUCCEEDED": 10})
+        self.assertFalse(os.path.exists(os.path.join(tmp, "data", "finish_06")))
+
+    def test_unmet_dependency(self):
+        """ Tasks whose dependencies can no longer be met are left unstarted """
+        cfg = rocoto_config(self.tmp_dir.name)
+        cfg["tasks"]["task_make_data"]["command"] = "exit 1"
+        with LocalWorkflow(Workflow(cfg), os.path.join(self.tmp_dir.name, "wflow.db"),
+                           cores=1) as runner:
+            self.assertEqual(runner.run(), {"DEAD": 1, "SUCCEEDED": 1, "UNSTARTED": 8})
+
+    @mock.patch("local_workflow.DATADEP_POLL", 0.05)
+    def test_external_data(self):
+        """ A task waiting only on a file from outside the workflow runs once
+        the file appears, unless the runner gives up waiting first """
+        data_fp = os.path.join(self.tmp_dir.name, "staged")
+        cfg = {
+            "cycledefs": {"forecast": ["202101010000 202101010000 06:00:00"]},
+            "tasks": {"task_use_data": {
+                "command": f"cat {data_fp}",
+                "nodes": "1:ppn=1",
+                "dependency": {"datadep": {"text": data_fp}},
+            }},
+        }
+        with LocalWorkflow(Workflow(cfg), os.path.join(self.tmp_dir.name, "timeout.db"),
+                           cores=1, data_timeout=0.2) as runner:
+            self.assertEqual(runner.run(), {"UNSTARTED": 1})
+
+        timer = threading.Timer(0.5, touch, [data_fp])
+        timer.start()
+        try:
+            with LocalWorkflow(Workflow(cfg), os.path.join(self.tmp_dir.name, "wflow.db"),
+                               cores=1) as runner:
+                self.assertEqual(runner.run(), {"SUCCEEDED": 1})
+        finally:
+            timer.cancel()
+
+    def setUp(self):
+        # pylint: disable=consider-using-with
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
@@ -0,0 +1,93 @@
+""" Tests for the in-place namelist patcher """
+
+#pylint: disable=invalid-name
+
+import os
+import tempfile
+import unittest
+
+from nml_patch import NamelistPatcher, NmlPatchError, format_value, patch_nml_file
+
+
+class Testing(unittest.TestCase):
+    """ Define the tests """
+
+    def test_patch_only_changes_patched_lines(self):
+        """ Patching the real FV3 namelist leaves every other line as is """
+        patcher = NamelistPatcher(self.fv3_nml)
+        self.assertEqual(patcher.unpatchable, {})
+        out = patcher.patch({
+            "fv_core_nml": {"k_split": 1, "n_split": 8},
+            "gfs_physics_nml": {"nstf_name": [2, 0, 0, 0, 0]},
+        })
+        old_lines = self.fv3_nml.splitlines(keepends=True)
+        new_lines = out.splitlines(keepends=True)
+        self.assertEqual(len(old_lines), len(new_lines))
+        changed = [new for old, new in zip(old_lines, new_lines) if old != new]
+        self.assertEqual(
+            changed,
+            ["    k_split = 1\n", "    n_split = 8\n", "    nstf_name = 2,0,0,0,0\n"],
+        )
+        # The patcher keeps the original text, so it can be reused
+        self.assertEqual(patcher.patch({}), self.fv3_nml)
+
+    def test_patch_new_keys_and_groups(self):
+        """ New keys go at the end of their group and new groups at the end
+        of the file """
+        text = "&a_nml\n  x = 1, ! first\n  y = 'b/c',\n      'd'\n/\n"
+        out = NamelistPatcher(text).patch({
+            "a_nml": {"X": 2.5, "y": ["e"], "z": True},
+            "b_nml": {"w": "it's"},
+        })
+        self.assertEqual(
+            out,
+            "&a_nml\n  x = 2.5, ! first\n  y = 'e'\n  z = .true.\n/\n"
+            "\n&b_nml\n  w = 'it''s'\n/\n",
+        )
+
+    def test_patch_one_line_groups(self):
+        """ Keys are added to a group written on one line rather than to a
+        second group of the same name """
+        text = "&a_nml\n  x = 1\n/\n&nam_stochy / ! empty\n&b_nml\n/\n"
+        patcher = NamelistPatcher(text)
+        self.assertEqual(patcher.unpatchable, {})
+        self.assertEqual(
+            patcher.patch({"nam_stochy": {"iseed_sppt": 7, "iseed_shum": 8}}),
+            "&a_nml\n  x = 1\n/\n&nam_stochy\n  iseed_sppt = 7\n  iseed_shum = 8\n"
+            "/ ! empty\n&b_nml\n/\n",
+        )
+        self.assertEqual(patcher.patch({"nam_stochy": {}}), text)
+        with self.assertRaises(NmlPatchError):
+            NamelistPatcher("&a x = 1 /\n").patch({"a": {"x": 3}})
+
+    def test_unpatchable(self):
+        """ Updates that cannot be made in place raise NmlPatchError """
+        with self.assertRaises(NmlPatchError):
+            NamelistPatcher("&a\n  x = 1, y = 2\n/\n").patch({"a": {"x": 3}})
+        with self.assertRaises(NmlPatchError):
+            NamelistPatcher("&a\n  x(1) = 1\n/\n").patch({"a": {"x": [3]}})
+        with self.assertRaises(NmlPatchError):
+            format_value(None)
+
+    def test_patch_nml_file(self):
+        """ The file is rewritten in place, or written to a new path """
+        path = os.path.join(self.tmp_dir.name, "input.nml")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.fv3_nml)
+        out_path = os.path.join(self.tmp_dir.name, "input.nml.stoch")
+        self.assertTrue(patch_nml_file(path, {"nam_stochy": {"iseed_sppt": 7}}, out_path))
+        with open(out_path, encoding="utf-8") as f:
+            self.assertIn("&nam_stochy\n    iseed_sppt = 7\n/\n", f.read())
+        with open(path, encoding="utf-8") as f:
+            self.assertEqual(f.read(), self.fv3_nml)
+
+    def setUp(self):
+        test_dir = os.path.dirname(os.path.abspath(__file__))
+        with open(os.path.join(test_dir, "..", "..", "parm", "input.nml.FV3"),
+                  encoding="utf-8") as f:
+            self.fv3_nml = f.read()
+        # pylint: disable=consider-using-with
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
@@ -17,6 +17,7 @@ import unittest
 import glob
 import tempfile
 import os
+from datetime import datetime
 
 import python_utils as util
 
@@ -117,6 +118,49 @@ class Testing(unittest.TestCase):
 
             self.assertFalse(os.path.exists(testable_path))
 
+    def test_filesys_cmds_native(self):
+        """ Test the native versions of the filesystem commands, including
+        paths with spaces and shell-style argument strings"""
+
+        with tempfile.TemporaryDirectory(
+            dir=os.path.abspath("."),
+            prefix="filesys space",
+            ) as tmp_dir:
+
+            src = os.path.join(tmp_dir, "src dir")
+            util.mkdir_vrfy("-p", os.path.join(src, "sub"))
+            with open(os.path.join(src, "sub", "a.txt"), "w", encoding="utf-8") as f:
+                f.write("a\n")
+
+            # Quoted paths in a single argument string
+            util.cp_vrfy(f"-r '{src}' '{tmp_dir}/copy'")
+            self.assertTrue(os.path.exists(f"{tmp_dir}/copy/sub/a.txt"))
+
+            # Links are replaced, and -n does not follow a link to a directory
+            link = os.path.join(tmp_dir, "link")
+            util.ln_vrfy("-sfn", src, link)
+            util.ln_vrfy("-sfn", f"{tmp_dir}/copy", link)
+            self.assertEqual(os.readlink(link), f"{tmp_dir}/copy")
+            util.ln_vrfy("-sf", "--relative", f"{src}/sub/a.txt", f"{tmp_dir}/rel.txt")
+            self.assertEqual(os.readlink(f"{tmp_dir}/rel.txt"), "src dir/sub/a.txt")
+
+            # Moves into an existing directory, and globbing removal
+            util.mv_vrfy(f"{tmp_dir}/rel.txt", src)
+            self.assertTrue(os.path.islink(f"{src}/rel.txt"))
+            util.rm_vrfy(" -rf ", f"{tmp_dir}/cop*")
+            self.assertFalse(os.path.exists(f"{tmp_dir}/copy"))
+
+            # Batch interface
+            results = util.run_fs_ops([
+                ("mkdir", "-p", f"{tmp_dir}/batch/a"),
+                ("mkdir", "-p", f"{tmp_dir}/other"),
+                ("cp", f"{src}/sub/a.txt", f"{tmp_dir}/batch/a/b.txt"),
+                ("rm", f"{tmp_dir}/missing"),
+            ])
+            self.assertEqual([r.ok for r in results], [True, True, True, False])
+            self.assertTrue(os.path.exists(f"{tmp_dir}/batch/a/b.txt"))
+            self.assertIn("missing", results[3].error)
+
     def test_run_command(self):
         """ Test the return of the run_command task is as expected."""
         self.assertEqual(util.run_command("echo hello"), (0, "hello", ""))
@@ -200,6 +244,29 @@ class Testing(unittest.TestCase):
         v = util.str_to_list(shell_str)
         self.assertFalse(isinstance(v, list))
 
+    def test_str_to_type(self):
+        """ Test the conversion of strings to python types, including the
+        corner cases that must stay strings"""
+        self.assertEqual(util.str_to_type("2023010112"), datetime(2023, 1, 1, 12))
+        self.assertEqual(util.str_to_type("2023010112", return_string=2), "2023010112")
+        self.assertEqual(util.str_to_type("20230230"), 20230230)
+        self.assertEqual(util.str_to_type("'42'"), 42)
+        self.assertEqual(util.str_to_type("-05"), -5)
+        self.assertEqual(util.str_to_type("007"), "007")
+        self.assertEqual(util.str_to_type("1.5e3"), 1500.0)
+        self.assertEqual(util.str_to_type("yes"), True)
+        self.assertEqual(util.str_to_type("NOPE"), False)
+        self.assertIsNone(util.str_to_type("null"))
+        self.assertEqual(util.str_to_type("TRUE", return_string=1), "TRUE")
+        self.assertEqual(util.str_to_type("C3357"), "C3357")
+        self.assertEqual(util.str_to_type("/path/to/file_1"), "/path/to/file_1")
+
+        # Repeated conversions, served from the memo cache, give the same values
+        for value in ["FV3_GFS_v16", "-05", "007", "1.5e3", "yes", "null"]:
+            self.assertEqual(util.str_to_type(value), util.str_to_type(value))
+        self.assertEqual(util.str_to_type("TRUE", return_string=1), "TRUE")
+        self.assertEqual(util.str_to_type("TRUE"), True)
+
     def test_config_parser(self):
         """ Test loading different config files """
         cfg = {"HRS": ["1", "2"]}
@@ -0,0 +1,90 @@
+""" Tests for reading the tasks of a rocoto XML """
+
+#pylint: disable=invalid-name
+
+import os
+import tempfile
+import unittest
+
+from rocoto_xml import (cycledef_cycles, expected_tasks, read_workflow, size_summary,
+                        task_resources, workflow_size)
+
+WORKFLOW_XML = """<?xml version="1.0"?>
+<!DOCTYPE workflow [
+<!ENTITY MEMBERS "001 002">
+]>
+<workflow realtime="F" scheduler="slurm" cyclethrottle="2">
+  <cycledef group="at_start">202101010000 202101010000 06:00:00</cycledef>
+  <cycledef group="forecast">202101010000 202101011200 06:00:00</cycledef>
+  <task name="make_grid" cycledefs="at_start">
+    <nodes>1:ppn=24</nodes>
+    <walltime>00:20:00</walltime>
+  </task>
+  <metatask name="run_ensemble">
+    <var name="mem">&MEMBERS;</var>
+    <task name="run_fcst_mem#mem#" cycledefs="forecast">
+      <nodes>4:ppn=12+1:ppn=2</nodes>
+    </task>
+    <metatask name="run_post_mem#mem#">
+      <var name="fhr">000 001</var>
+      <var name="cdef">forecast at_start</var>
+      <task name="run_post_mem#mem#_f#fhr#" cycledefs="#cdef#">
+        <cores>2</cores>
+      </task>
+    </metatask>
+  </metatask>
+  <task name="plot">
+    <cores>1</cores>
+    <dependency>
+      <and><taskdep task="make_grid"/><metataskdep metatask="run_ensemble"/></and>
+    </dependency>
+  </task>
+</workflow>
+"""
+
+
+class Testing(unittest.TestCase):
+    """ Define the tests """
+
+    def test_read_workflow(self):
+        """ Metatasks are expanded, and each task runs for the cycles of its
+        cycledefs """
+        tasks = read_workflow(self.xml_fp)["tasks"]
+        self.assertEqual(len(tasks), 8)
+        self.assertEqual(tasks["make_grid"]["cycles"], {"202101010000"})
+        self.assertEqual(tasks["make_grid"]["walltime"], 1200)
+        self.assertEqual((tasks["run_fcst_mem002"]["nodes"], tasks["run_fcst_mem002"]["cores"]),
+                         (5, 50))
+        self.assertEqual(len(tasks["run_post_mem001_f000"]["cycles"]), 3)
+        self.assertEqual(tasks["run_post_mem002_f001"]["cycles"], {"202101010000"})
+        self.assertEqual(len(tasks["plot"]["cycles"]), 3)
+        self.assertEqual(len(expected_tasks(self.xml_fp)), 1 + 2 * 3 + 2 * (3 + 1) + 3)
+
+    def test_cycledefs_and_resources(self):
+        """ Cycledefs and resources in the forms rocoto accepts """
+        self.assertEqual(cycledef_cycles("2021010100 2021010200 1:00:00:00"),
+                         {"202101010000", "202101020000"})
+        with self.assertRaises(ValueError):
+            cycledef_cycles("00 */6 * * * *")
+        self.assertEqual(task_resources(cores="8"), (None, 8))
+        self.assertEqual(task_resources(nodes="2:ppn=4:tpp=2"), (2, 8))
+
+    def test_workflow_size(self):
+        """ Tasks are counted once expanded, and their dependencies are
+        evaluated for at most cyclethrottle cycles """
+        size = workflow_size(self.xml_fp)
+        self.assertEqual(size["bytes"], os.path.getsize(self.xml_fp))
+        self.assertEqual((size["task_defs"], size["metatask_defs"], size["tasks"]), (4, 2, 8))
+        self.assertEqual((size["cycles"], size["jobs"]), (3, 18))
+        self.assertEqual(size["evaluations"], 1 + 2 * 2 + 2 * 2 + 2 * 1 + 2 * 4)
+        self.assertIn("8 tasks", size_summary(size))
+
+    def setUp(self):
+        # pylint: disable=consider-using-with
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.xml_fp = os.path.join(self.tmp_dir.name, "FV3LAM_wflow.xml")
+        with open(self.xml_fp, "w", encoding="utf-8") as f:
+            f.write(WORKFLOW_XML)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
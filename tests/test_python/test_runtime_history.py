@@ -0,0 +1,108 @@
+""" Tests for the runtime history database """
+
+#pylint: disable=invalid-name
+
+import os
+import sqlite3
+import tempfile
+import unittest
+from contextlib import closing
+
+from runtime_history import RuntimeHistory, percentile, record_experiment
+
+WORKFLOW_XML = """<?xml version="1.0"?>
+<workflow realtime="F" scheduler="slurm">
+  <cycledef group="forecast">202101010000 202101010600 06:00:00</cycledef>
+  <task name="run_fcst" cycledefs="forecast"><nodes>4:ppn=12</nodes></task>
+</workflow>
+"""
+
+
+class Testing(unittest.TestCase):
+    """ Define the tests """
+
+    def test_record_experiment(self):
+        """ The jobs of an experiment are recorded from its rocoto database,
+        and recording the same run again updates it """
+        self.write_rocoto_db([(101, 1609459200, "SUCCEEDED", 600.0),
+                              (102, 1609480800, "RUNNING", 100.0)])
+        with RuntimeHistory(self.db_fp) as history:
+            expt_id = record_experiment(history, self.expt_dir,
+                                        queue_waits={"run_fcst_202101010000": 30.0})
+            self.assertEqual(history.task_values(task="run_*"), [600.0])
+            self.assertEqual(history.task_values("queue_wait", grid="RRFS_CONUS_25km"), [30.0])
+            self.assertEqual(history.task_values("nodes", state=None), [4, 4])
+            self.assertEqual(history.experiment_walltimes(), {})
+
+            self.write_rocoto_db([(101, 1609459200, "SUCCEEDED", 600.0),
+                                  (102, 1609480800, "SUCCEEDED", 700.0)], done=True)
+            self.assertEqual(record_experiment(history, self.expt_dir), expt_id)
+            # A retried job gets a new job id, but it is still the same run
+            self.write_rocoto_db([(201, 1609459200, "SUCCEEDED", 600.0),
+                                  (102, 1609480800, "SUCCEEDED", 700.0)], done=True)
+            self.assertEqual(record_experiment(history, self.expt_dir), expt_id)
+            self.assertEqual(history.connection.execute(
+                "SELECT count(*) FROM experiments").fetchone(), (1,))
+            self.assertEqual(history.task_percentiles([0, 50, 100], suite="FV3_GFS_v16"),
+                             [600.0, 650.0, 700.0])
+            self.assertEqual(history.task_values("queue_wait"), [30.0])
+            self.assertEqual(history.experiment_walltimes(),
+                             {os.path.basename(self.expt_dir): 22600})
+            self.assertEqual(history.task_values(grid="other"), [])
+            self.assertEqual(history.task_runs(),
+                             [("run_fcst", 600.0, 4, 200 * 100, 12.0),
+                              ("run_fcst", 700.0, 4, 200 * 100, 12.0)])
+
+    def test_record_experiment_without_params(self):
+        """ An experiment whose cost parameters cannot be worked out is
+        recorded without them """
+        with open(os.path.join(self.expt_dir, "var_defns.yaml"), "a", encoding="utf-8") as f:
+            f.write("task_run_fcst:\n  DT_ATMOS: '{{ UNDEFINED_SETTING }}'\n")
+        self.write_rocoto_db([(101, 1609459200, "SUCCEEDED", 600.0)])
+        with RuntimeHistory(self.db_fp) as history:
+            self.assertIsNotNone(record_experiment(history, self.expt_dir))
+            self.assertEqual(history.task_values(task="run_*"), [600.0])
+
+    def test_percentile(self):
+        """ Percentiles interpolate between the closest ranks """
+        self.assertEqual(percentile([4, 1, 3, 2], 50), 2.5)
+        self.assertEqual(percentile([1, 2, 3], 90), 2.8)
+        self.assertIsNone(percentile([], 50))
+
+    def write_rocoto_db(self, jobs, done=False):
+        """ A rocoto database with the jobs of the run_fcst task """
+        db_fp = os.path.join(self.expt_dir, "FV3LAM_wflow.db")
+        if os.path.exists(db_fp):
+            os.remove(db_fp)
+        with closing(sqlite3.connect(db_fp)) as db:
+            with db:
+                db.execute("CREATE TABLE jobs (id INTEGER PRIMARY KEY, jobid VARCHAR(64), "
+                           "taskname VARCHAR(64), cycle DATETIME, cores INTEGER, "
+                           "state VARCHAR(64), native_state VARCHAR(64), exit_status INTEGER, "
+                           "tries INTEGER, nunknowns INTEGER, duration REAL)")
+                db.execute("CREATE TABLE cycles (id INTEGER PRIMARY KEY, cycle DATETIME, "
+                           "activated DATETIME, expired DATETIME, done DATETIME, "
+                           "draining DATETIME)")
+                for jobid, cycle, state, duration in jobs:
+                    db.execute("INSERT INTO jobs (jobid, taskname, cycle, cores, state, tries, "
+                               "duration) VALUES (?, 'run_fcst', ?, 48, ?, 1, ?)",
+                               (jobid, cycle, state, duration))
+                    db.execute("INSERT INTO cycles (cycle, activated, done) VALUES (?, ?, ?)",
+                               (cycle, 1700000000 + cycle - 1609459200,
+                                1700001000 + cycle - 1609459200 if done else None))
+
+    def setUp(self):
+        # pylint: disable=consider-using-with
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_fp = os.path.join(self.tmp_dir.name, "history.db")
+        self.expt_dir = os.path.join(self.tmp_dir.name, "grid_RRFS_CONUS_25km")
+        os.makedirs(self.expt_dir)
+        with open(os.path.join(self.expt_dir, "var_defns.yaml"), "w", encoding="utf-8") as f:
+            f.write("workflow:\n  PREDEF_GRID_NAME: RRFS_CONUS_25km\n"
+                    "  CCPP_PHYS_SUITE: FV3_GFS_v16\n  WFLOW_XML_FN: FV3LAM_wflow.xml\n"
+                    "  LONG_FCST_LEN: 12\ngrid_params:\n  NX: 200\n  NY: 100\n")
+        with open(os.path.join(self.expt_dir, "FV3LAM_wflow.xml"), "w", encoding="utf-8") as f:
+            f.write(WORKFLOW_XML)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
@@ -15,7 +15,11 @@ from python_utils import (
   set_env_var,
 )
 
-from set_fv3nml_ens_stoch_seeds import set_fv3nml_ens_stoch_seeds
+from set_fv3nml_ens_stoch_seeds import (
+  ens_stoch_seed_settings,
+  set_fv3nml_ens_stoch_seeds,
+  write_ens_stoch_nmls,
+)
 
 class Testing(unittest.TestCase):
     """ Define the tests """
@@ -24,6 +28,36 @@ class Testing(unittest.TestCase):
         os.chdir(self.mem_dir)
         set_fv3nml_ens_stoch_seeds(cdate=self.cdate, expt_config=self.config)
 
+    def test_write_ens_stoch_nmls(self):
+        """ The namelists of all members are written from one base namelist,
+        with the same seeds as when each member sets its own """
+        self.config["global"]["NUM_ENS_MEMBERS"] = 3
+        outdir = os.path.join(self.tmp_dir.name, "ens_stoch_nml")
+        # A namelist of an earlier generation is removed
+        os.makedirs(outdir)
+        stale_fp = os.path.join(outdir, "input.nml.2020010100.mem001")
+        with open(stale_fp, "w", encoding="utf-8"):
+            pass
+        paths = write_ens_stoch_nmls(
+            [self.cdate, "2021010106"], self.config, outdir,
+            base_nml_fp=os.path.join(self.mem_dir, "input.nml"),
+        )
+        self.assertEqual(len(paths), 6)
+        self.assertEqual(os.path.basename(paths[1]), "input.nml.2021010100.mem002")
+        self.assertFalse(os.path.exists(stale_fp))
+
+        seeds = ens_stoch_seed_settings([self.cdate], [2], self.config["global"])
+        settings = seeds[("2021010100", 2)]
+        self.assertEqual(settings["nam_stochy"]["iseed_sppt"], 2021010100 * 1000 + 21)
+        self.assertEqual(settings["nam_sppperts"]["iseed_spp"][0], 2021010100 * 1000 + 24)
+        self.assertEqual(settings["nam_sfcperts"]["iseed_lndp"], [2021010100 * 1000 + 29])
+
+        os.chdir(self.mem_dir)
+        set_fv3nml_ens_stoch_seeds(cdate=self.cdate, expt_config=self.config)
+        with open(paths[1], encoding="utf-8") as f1, \
+                open(os.path.join(self.mem_dir, "input.nml"), encoding="utf-8") as f2:
+            self.assertEqual(f1.read(), f2.read())
+
     def setUp(self):
         define_macos_utilities()
         set_env_var("VERBOSE", True)
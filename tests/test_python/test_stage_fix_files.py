@@ -0,0 +1,70 @@
+""" Tests for the native staging of fixed files """
+
+#pylint: disable=invalid-name
+
+import os
+import tempfile
+import unittest
+
+from stage_fix_files import StageOp, place_file, resolve_ops, stage_files
+
+
+class Testing(unittest.TestCase):
+    """ Define the tests """
+
+    def test_resolve_ops(self):
+        """ Glob patterns are expanded into the target directory """
+        ops = resolve_ops([(os.path.join(self.src_dir, "optics*.dat"), self.dst_dir)])
+        self.assertEqual(
+            [os.path.basename(op.dst) for op in ops], ["optics_BC.dat", "optics_DU.dat"]
+        )
+        self.assertTrue(all(os.path.dirname(op.dst) == self.dst_dir for op in ops))
+
+        src = os.path.join(self.src_dir, "global_co2.txt")
+        self.assertEqual(
+            resolve_ops([(src, os.path.join(self.dst_dir, "co2.txt"))], mode="link"),
+            [StageOp(src, os.path.join(self.dst_dir, "co2.txt"), "link")],
+        )
+        with self.assertRaises(FileNotFoundError):
+            resolve_ops([(os.path.join(self.src_dir, "merra2*.nc"), self.dst_dir)])
+
+    def test_stage_files(self):
+        """ Files are copied or linked, including into new subdirectories """
+        ops = resolve_ops([
+            (os.path.join(self.src_dir, "global_co2.txt"),
+             os.path.join(self.dst_dir, "fix_co2_proj", "global_co2.txt")),
+            (os.path.join(self.src_dir, "optics*.dat"), self.dst_dir),
+        ])
+        stats = stage_files(ops, group="test")
+        self.assertEqual(stats["files"], 3)
+        self.assertEqual(stats["bytes"], 3 * len("fix data\n"))
+        for op in ops:
+            with open(op.dst, encoding="utf-8") as f:
+                self.assertEqual(f.read(), "fix data\n")
+
+        # Restaging replaces the files, here with symbolic links
+        stats = stage_files([op._replace(mode="link") for op in ops])
+        self.assertEqual(stats["methods"], {"symlink": 3})
+        self.assertTrue(all(os.path.islink(op.dst) for op in ops))
+
+    def test_place_file_without_hardlink(self):
+        """ Without hardlinks, the copy is independent of the source """
+        src = os.path.join(self.src_dir, "global_co2.txt")
+        dst = os.path.join(self.dst_dir, "global_co2.txt")
+        method = place_file(src, dst, hardlink=False)
+        self.assertIn(method, ("reflink", "copy"))
+        self.assertNotEqual(os.stat(src).st_ino, os.stat(dst).st_ino)
+
+    def setUp(self):
+        # pylint: disable=consider-using-with
+        self.tmp = tempfile.TemporaryDirectory()
+        self.src_dir = os.path.join(self.tmp.name, "src")
+        self.dst_dir = os.path.join(self.tmp.name, "dst")
+        os.makedirs(self.src_dir)
+        os.makedirs(self.dst_dir)
+        for fn in ("global_co2.txt", "optics_BC.dat", "optics_DU.dat"):
+            with open(os.path.join(self.src_dir, fn), "w", encoding="utf-8") as f:
+                f.write("fix data\n")
+
+    def tearDown(self):
+        self.tmp.cleanup()
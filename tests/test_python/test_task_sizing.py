@@ -0,0 +1,100 @@
+""" Tests for sizing task walltimes from measured runtimes """
+
+#pylint: disable=invalid-name
+
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from task_sizing import apply_task_sizing, fit_sizing, fit_task, size_task
+
+WFLOW_YAML = """
+task_make_grid:
+  nnodes: 1
+  walltime: 00:20:00
+metatask_run_ensemble:
+  task_run_fcst_mem#mem#:
+    nnodes: '{{ task_run_fcst.NNODES_RUN_FCST // 1 }}'
+    walltime: 04:30:00
+  task_make_ics_mem#mem#:
+    nnodes: 4
+metatask_run_ens_post:
+  metatask_run_post_mem#mem#_all_fhrs:
+    task_run_post_mem#mem#_f#fhr#:
+      nnodes: 2
+  metatask_sub_hourly_post:
+    task_run_post_mem#mem#_f#fhr##fmn#:
+      nnodes: 2
+"""
+
+
+class Testing(unittest.TestCase):
+    """ Define the tests """
+
+    def test_fit_task(self):
+        """ The simplest model that fits the runtimes well is chosen """
+        self.assertIsNone(fit_task([(100.0, 1000, 6)] * 2))
+        model = fit_task([(100.0, 1000, 6), (102.0, 4000, 6), (98.0, 2000, 12),
+                          (102.0, 1000, 12), (98.0, 4000, 12)])
+        self.assertEqual(model["feature"], "constant")
+        self.assertAlmostEqual(model["base"], 100.0)
+
+        model = fit_task([(60.0 + 0.01 * n * h, n, h)
+                          for n, h in [(1000, 6), (4000, 6), (2000, 12), (8000, 24)]])
+        self.assertEqual(model["feature"], "grid_points_x_fcst_hrs")
+        self.assertAlmostEqual(model["base"], 60.0)
+        self.assertAlmostEqual(model["per_unit"], 0.01)
+        self.assertEqual(model["samples"], 4)
+
+    def test_size_task(self):
+        """ Walltimes are padded and rounded; tasks that would take too long
+        get more nodes """
+        model = {"feature": "grid_points", "base": 100.0, "per_unit": 0.1, "nodes": 2}
+        self.assertEqual(size_task(model, 1000, 6), ("00:10:00", None))
+        self.assertEqual(size_task(model, 10000, 6), ("00:35:00", None))
+        self.assertEqual(size_task(model, 400000, 6), ("06:50:00", 5))
+        del model["nodes"]
+        self.assertEqual(size_task(model, 400000, 6), ("08:00:00", None))
+
+    def test_fit_and_apply_sizing(self):
+        """ Jobs are matched to the tasks they were expanded from, and the
+        sizing only changes the tasks and settings it should """
+        runs = [("make_grid", 100.0, 1, 1000, 6), ("make_grid", 100.0, 1, 2000, 6),
+                ("make_grid", 100.0, 1, 4000, 6), ("run_post_mem000_f001", 200.0, 2, 1000, 6),
+                ("run_post_mem001_f002", 200.0, 2, 1000, 6),
+                ("run_post_mem000_f003", 200.0, 2, 1000, 6),
+                ("run_fcst_mem000", 3000.0, 5, 1000, 6)]
+        # A history returning the jobs as RuntimeHistory.task_runs() does
+        history = SimpleNamespace(task_runs=lambda: runs)
+        sizing = fit_sizing(history, self.tmp_dir.name)
+        self.assertEqual(set(sizing), {"task_make_grid", "metatask_run_ens_post"})
+        self.assertEqual(sizing["task_make_grid"]["sizing"]["nodes"], 1)
+        post = sizing["metatask_run_ens_post"]["metatask_run_post_mem#mem#_all_fhrs"]
+        self.assertEqual(post["task_run_post_mem#mem#_f#fhr#"]["sizing"]["samples"], 3)
+
+        tasks = {
+            "task_make_grid": {"walltime": "00:20:00"},
+            "metatask_run_ens_post": {
+                "metatask_run_post_mem#mem#_all_fhrs": {
+                    "task_run_post_mem#mem#_f#fhr#": {"walltime": "00:15:00"}}},
+        }
+        protected = {"task_make_grid": {"walltime": "00:45:00"}}
+        sized = apply_task_sizing(tasks, sizing, 1000, 6, protected)
+        self.assertCountEqual(sized, ["task_make_grid", "task_run_post_mem#mem#_f#fhr#"])
+        self.assertEqual(tasks["task_make_grid"]["walltime"], "00:20:00")
+        self.assertEqual(tasks["metatask_run_ens_post"]["metatask_run_post_mem#mem#_all_fhrs"]
+                         ["task_run_post_mem#mem#_f#fhr#"]["walltime"], "00:10:00")
+
+        sized = apply_task_sizing({}, sizing, 1000, 6)
+        self.assertEqual(sized, [])
+
+    def setUp(self):
+        # pylint: disable=consider-using-with
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.tmp_dir.name, "default.yaml"), "w",
+                  encoding="utf-8") as f:
+            f.write(WFLOW_YAML)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
@@ -0,0 +1,96 @@
+""" Tests for the compiled template store """
+
+#pylint: disable=invalid-name
+
+import importlib.util
+import os
+import tempfile
+import unittest
+from datetime import datetime
+
+from template_store import (
+    TEMPLATE_CACHE_DIRNAME,
+    TemplateStore,
+    prerender_cycle_files,
+    prerendered_fp,
+    render_template,
+)
+
+
+class Testing(unittest.TestCase):
+    """ Define the tests """
+
+    def test_render_template(self):
+        """ Templates are rendered with a trailing newline, and their bytecode
+        is cached in the experiment directory """
+        out_fp = os.path.join(self.exptdir, "diag_table")
+        render_template(self.diag_table_tmpl_fp, out_fp,
+                        {"starttime": datetime(2021, 1, 1, 6), "cres": "C48"},
+                        exptdir=self.exptdir)
+        with open(out_fp, encoding="utf-8") as f:
+            text = f.read()
+        self.assertTrue(text.startswith(
+            "20210101.06Z.C48.32bit.non-hydro.regional\n2021 01 01 06 00 00\n"))
+        self.assertTrue(text.endswith("\n"))
+        self.assertNotEqual(os.listdir(os.path.join(self.exptdir, TEMPLATE_CACHE_DIRNAME)), [])
+
+        # A new store (e.g. in another forecast task) loads the cached bytecode
+        store = TemplateStore(os.path.join(self.exptdir, TEMPLATE_CACHE_DIRNAME))
+        self.assertEqual(
+            store.render(self.diag_table_tmpl_fp,
+                         {"starttime": datetime(2021, 1, 1, 6), "cres": "C48"}),
+            text,
+        )
+
+    @unittest.skipUnless(importlib.util.find_spec("uwtools"), "uwtools is not installed")
+    def test_uwtools_parity(self):
+        """ Templates are rendered byte for byte as uwtools renders them """
+        # pylint: disable=import-outside-toplevel
+        from uwtools.api.template import render
+
+        values = {"starttime": datetime(2021, 1, 1, 6), "cres": "C48"}
+        out_fp = os.path.join(self.exptdir, "diag_table")
+        uw_out_fp = os.path.join(self.exptdir, "diag_table.uw")
+        render_template(self.diag_table_tmpl_fp, out_fp, values, exptdir=self.exptdir)
+        render(input_file=self.diag_table_tmpl_fp, output_file=uw_out_fp, values_src=values)
+        with open(out_fp, "rb") as f, open(uw_out_fp, "rb") as uw_f:
+            self.assertEqual(f.read(), uw_f.read())
+
+    def test_prerender_cycle_files(self):
+        """ The diag_table of each cycle and the ufs.configure file are
+        rendered when the grid resolution is known """
+        paths = prerender_cycle_files(self.config, ["2021010100", "2021010106"])
+        self.assertEqual(len(paths), 3)
+        with open(prerendered_fp(self.exptdir, "diag_table", "2021010106"),
+                  encoding="utf-8") as f:
+            self.assertTrue(f.read().startswith("20210101.06Z.C48"))
+        self.assertTrue(os.path.exists(prerendered_fp(self.exptdir, "ufs.configure")))
+
+        self.config["workflow"]["RES_IN_FIXLAM_FILENAMES"] = None
+        paths = prerender_cycle_files(self.config, ["2021010100"])
+        self.assertEqual(paths, [prerendered_fp(self.exptdir, "ufs.configure")])
+        self.assertFalse(os.path.exists(prerendered_fp(self.exptdir, "diag_table", "2021010106")))
+
+    def setUp(self):
+        test_dir = os.path.dirname(os.path.abspath(__file__))
+        PARMdir = os.path.join(test_dir, "..", "..", "parm")
+        self.diag_table_tmpl_fp = os.path.join(PARMdir, "diag_table.FV3_GFS_v15p2")
+        # pylint: disable=consider-using-with
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.exptdir = self.tmp_dir.name
+        self.config = {
+            "workflow": {
+                "EXPTDIR": self.exptdir,
+                "CRES": "C48",
+                "RES_IN_FIXLAM_FILENAMES": 48,
+                "DIAG_TABLE_FN": "diag_table",
+                "DIAG_TABLE_TMPL_FP": self.diag_table_tmpl_fp,
+                "UFS_CONFIG_FN": "ufs.configure",
+                "UFS_CONFIG_TMPL_FP": os.path.join(PARMdir, "ufs.configure"),
+            },
+            "task_run_fcst": {"DT_ATMOS": 36, "PRINT_ESMF": False},
+            "cpl_aqm_parm": {"CPL_AQM": False},
+        }
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
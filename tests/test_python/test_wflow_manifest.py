@@ -0,0 +1,66 @@
+""" Tests for the staging manifest used to update experiment directories """
+
+#pylint: disable=invalid-name
+
+import os
+import tempfile
+import unittest
+
+from wflow_manifest import MANIFEST_FN, StagingManifest, inputs_hash, stale_steps
+
+
+class Testing(unittest.TestCase):
+    """ Define the tests """
+
+    def test_inputs_hash(self):
+        """ The hash changes with the content of the input files and the
+        settings, but not otherwise """
+        src = os.path.join(self.tmp_dir, "data_table")
+        digest = inputs_hash([src], {"a": 1})
+        self.assertEqual(digest, inputs_hash([src], {"a": 1}))
+        self.assertNotEqual(digest, inputs_hash([src], {"a": 2}))
+        with open(src, "w", encoding="utf-8") as f:
+            f.write("changed\n")
+        self.assertNotEqual(digest, inputs_hash([src], {"a": 1}))
+        self.assertEqual(
+            inputs_hash([os.path.join(self.tmp_dir, "data_*")]),
+            inputs_hash([src]),
+        )
+
+    def test_update(self):
+        """ Steps are only current when updating with unchanged inputs and
+        existing outputs """
+        src = os.path.join(self.tmp_dir, "data_table")
+        dst = os.path.join(self.tmp_dir, "expt_data_table")
+
+        manifest = StagingManifest(self.tmp_dir)
+        self.assertFalse(manifest.is_current("data_table", [src], outputs=[dst]))
+        with open(dst, "w", encoding="utf-8") as f:
+            f.write("table\n")
+        manifest.record("data_table", [src], outputs=[dst])
+        self.assertTrue(os.path.exists(os.path.join(self.tmp_dir, MANIFEST_FN)))
+
+        # Without update, nothing is ever skipped
+        self.assertFalse(manifest.is_current("data_table", [src], outputs=[dst]))
+
+        manifest = StagingManifest(self.tmp_dir, update=True)
+        self.assertTrue(manifest.is_current("data_table", [src], outputs=[dst]))
+        self.assertEqual(manifest.skipped, ["data_table"])
+        self.assertFalse(manifest.is_current("data_table", [src], {"new": 1}, [dst]))
+
+        with open(src, "w", encoding="utf-8") as f:
+            f.write("changed\n")
+        self.assertFalse(manifest.is_current("data_table", [src], outputs=[dst]))
+
+        os.remove(dst)
+        self.assertEqual(stale_steps(self.tmp_dir), ["data_table"])
+
+    def setUp(self):
+        # pylint: disable=consider-using-with
+        self.tmp = tempfile.TemporaryDirectory()
+        self.tmp_dir = self.tmp.name
+        with open(os.path.join(self.tmp_dir, "data_table"), "w", encoding="utf-8") as f:
+            f.write("table\n")
+
+    def tearDown(self):
+        self.tmp.cleanup()
@@ -0,0 +1,90 @@
+""" Tests for the batching of forecast hours of the run_post tasks """
+
+#pylint: disable=invalid-name
+
+import os
+import re
+import unittest
+
+from jinja2 import Environment, StrictUndefined
+
+from python_utils import load_config_file
+
+PARM_WFLOW = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          "..", "..", "parm", "wflow")
+
+
+def render(template, batch_size, fcst_len_cycl, long_fcst_len):
+    """ A setting of a workflow YAML file rendered for the given post batch
+    size and forecast lengths, split into words """
+    context = {
+        "task_run_post": {"POST_FHR_BATCH_SIZE": batch_size},
+        "workflow": {"FCST_LEN_CYCL": fcst_len_cycl, "LONG_FCST_LEN": long_fcst_len},
+    }
+    return Environment(undefined=StrictUndefined).from_string(template).render(**context).split()
+
+
+class Testing(unittest.TestCase):
+    """ Define the tests """
+
+    def test_post_batches(self):
+        """ The batches of forecast hours cover each hour once and do not span
+        the forecast and long_forecast hours """
+        post = load_config_file(os.path.join(PARM_WFLOW, "post.yaml"))
+        hourly = post["metatask_run_ens_post"]["metatask_run_post_mem#mem#_all_fhrs"]
+        task = hourly["task_run_post_mem#mem#_f#fhr#"]
+
+        args = (3, [7, 12], 12)
+        self.assertEqual(render(hourly["var"]["fhr"], *args),
+                         ["000", "003", "006", "008", "011"])
+        self.assertEqual(render(hourly["var"]["fhr_last"], *args),
+                         ["002", "005", "007", "010", "012"])
+        self.assertEqual(render(hourly["var"]["cycledef"], *args),
+                         ["forecast"] * 3 + ["long_forecast"] * 2)
+        self.assertEqual(render(task["walltime"], *args), ["00:45:00"])
+
+        # Without batching, each hour has its own task
+        args = (1, [6], 6)
+        hours = [f"{h:03d}" for h in range(7)]
+        self.assertEqual(render(hourly["var"]["fhr"], *args), hours)
+        self.assertEqual(render(hourly["var"]["fhr_last"], *args), hours)
+        self.assertEqual(render(task["walltime"], *args), ["00:15:00"])
+
+    def test_post_fhr(self):
+        """ The tasks that follow post wait on the batch of each hour """
+        for wflow_file in ["plot.yaml", "prdgen.yaml"]:
+            wflow = load_config_file(os.path.join(PARM_WFLOW, wflow_file))
+            post_fhr = self.find_var(wflow, "post_fhr")
+            self.assertIsNotNone(post_fhr, wflow_file)
+            self.assertEqual(render(post_fhr, 3, [7, 12], 12),
+                             ["000"] * 3 + ["003"] * 3 + ["006"] * 2 + ["008"] * 3
+                             + ["011"] * 2)
+
+    def test_verify_pre_post_deps(self):
+        """ The vx tasks wait on the post task of each batch """
+        verify_pre = load_config_file(os.path.join(PARM_WFLOW, "verify_pre.yaml"))
+        templates = self.find_strings(verify_pre, "POST_FHR_BATCH_SIZE")
+        self.assertTrue(templates)
+        for template in templates:
+            rendered = " ".join(render(template, 3, [7, 12], 12))
+            self.assertEqual(re.findall(r"run_post_mem#mem#_f(\d+)", rendered),
+                             ["000", "003", "006", "008", "011"])
+
+    def find_strings(self, section, text):
+        """ The settings of a workflow section that contain the given text """
+        if isinstance(section, dict):
+            return [found for value in section.values()
+                    for found in self.find_strings(value, text)]
+        return [section] if isinstance(section, str) and text in section else []
+
+    def find_var(self, section, var):
+        """ The first metatask variable of the given name in a workflow
+        section """
+        if isinstance(section, dict):
+            if var in section.get("var", {}):
+                return section["var"][var]
+            for value in section.values():
+                found = self.find_var(value, var)
+                if found is not None:
+                    return found
+        return None
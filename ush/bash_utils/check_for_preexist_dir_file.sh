@@ -63,7 +63,7 @@ where the arguments are defined as follows:
 
   method:
   String specifying the action to take if a preexisting version of 
-  dir_or_file is found.  Valid values are \"delete\", \"reuse\", \"rename\", and \"quit\".
+  dir_or_file is found.  Valid values are \"delete\", \"reuse\", \"rename\", \"update\", and \"quit\".
 "
 
   fi
@@ -84,7 +84,7 @@ where the arguments are defined as follows:
 #
 #-----------------------------------------------------------------------
 #
-  local valid_vals_method=( "delete" "reuse" "rename" "quit" )
+  local valid_vals_method=( "delete" "reuse" "rename" "update" "quit" )
   check_var_valid_value "method" "valid_vals_method"
 #
 #-----------------------------------------------------------------------
@@ -139,11 +139,12 @@ Moving (renaming) preexisting directory or file to:
 #
 #-----------------------------------------------------------------------
 #
-# If method is set to "reuse", keep preexisting directory intact.
+# If method is set to "reuse" or "update", keep preexisting directory
+# intact.
 #
 #-----------------------------------------------------------------------
 #
-    "reuse")
+    "reuse"|"update")
       ;;
 #
 #-----------------------------------------------------------------------
@@ -1,84 +1,264 @@
 #!/usr/bin/env python3
 
+"""
+Parameters for the relative cost of the forecasts of an experiment: the time
+step and number of grid points of its grid, and those of the reference grid
+(a 6-hour forecast on RRFS_CONUS_25km). The predefined grids are read and
+their parameters computed once per process, so that the costs of many
+configurations (e.g. all WE2E tests) can be calculated at once with
+calculate_costs().
+
+The quantities that the cost of all the tasks of an experiment depends on
+(see experiment_params()) are used by the fitted cost model of cost_model.py.
+"""
+
 import os
+import re
 import argparse
+from datetime import datetime
+from functools import lru_cache
+
+from jinja2 import Environment, StrictUndefined
 
 from python_utils import (
     set_env_var,
     load_config_file,
     flatten_dict,
+    str_to_type,
 )
+from python_utils.config_parser import days_ago
 
-from set_predef_grid_params import set_predef_grid_params
-from set_gridparams_ESGgrid import set_gridparams_ESGgrid
+from set_cycle_dates import set_cycle_dates
+from set_predef_grid_params import load_predef_grids, set_predef_grid_params
 from set_gridparams_GFDLgrid import set_gridparams_GFDLgrid
 
+USHDIR = os.path.dirname(os.path.abspath(__file__))
 
-def calculate_cost(config_fn):
-    ushdir = os.path.dirname(os.path.abspath(__file__))
+# Predefined grid of the reference forecast
+REFERENCE_GRID_NAME = "RRFS_CONUS_25km"
+
+# The settings experiment_params() depends on, besides those of the grid
+COST_SETTINGS = (
+    "CCPP_PHYS_SUITE", "DT_ATMOS", "DATE_FIRST_CYCL", "DATE_LAST_CYCL", "INCR_CYCL_FREQ",
+    "FCST_LEN_HRS", "FCST_LEN_CYCL", "DO_ENSEMBLE", "NUM_ENS_MEMBERS", "SUB_HOURLY_POST",
+    "DT_SUBHOURLY_POST_MNTS", "QUILTING", "WRTCMP_write_groups", "WRTCMP_write_tasks_per_group",
+    "LAYOUT_X", "LAYOUT_Y", "OMP_NUM_THREADS_RUN_FCST",
+)
+
+
+@lru_cache(maxsize=None)
+def _gfdlgrid_points(*args):
+    """Number of grid points (NX, NY) of a GFDLgrid, from the arguments of
+    set_gridparams_GFDLgrid() in order"""
+    grid_params = set_gridparams_GFDLgrid(*args, run_envir="community", verbose=False, nh4=4)
+    return grid_params["NX"], grid_params["NY"]
+
+
+def grid_points(cfg):
+    """Number of grid points (NX, NY) of the grid of a flattened config
 
-    cfg_u = load_config_file(config_fn)
+    Args:
+        cfg (dict): The grid parameters, including GRID_GEN_METHOD
+    Returns:
+        tuple of NX and NY
+    """
+    # number of gridpoints (nx*ny) depends on grid generation method
+    if cfg['GRID_GEN_METHOD'] == "GFDLgrid":
+        return _gfdlgrid_points(
+            cfg['GFDLgrid_LON_T6_CTR'],
+            cfg['GFDLgrid_LAT_T6_CTR'],
+            cfg['GFDLgrid_NUM_CELLS'],
+            cfg['GFDLgrid_STRETCH_FAC'],
+            cfg['GFDLgrid_REFINE_RATIO'],
+            cfg['GFDLgrid_ISTART_OF_RGNL_DOM_ON_T6G'],
+            cfg['GFDLgrid_IEND_OF_RGNL_DOM_ON_T6G'],
+            cfg['GFDLgrid_JSTART_OF_RGNL_DOM_ON_T6G'],
+            cfg['GFDLgrid_JEND_OF_RGNL_DOM_ON_T6G'],
+        )
+    if cfg['GRID_GEN_METHOD'] == "ESGgrid":
+        return cfg['ESGgrid_NX'], cfg['ESGgrid_NY']
+    raise ValueError("GRID_GEN_METHOD is set to an invalid value")
+
+
+@lru_cache(maxsize=None)
+def predef_grids(ushdir=USHDIR):
+    """The predefined grids and their parameters, computed once per process
+
+    Args:
+        ushdir (str): Path to the SRW ush directory
+    Returns:
+        dict by grid name of dicts with the (flattened) "params" of the grid,
+        its "NX", "NY", "DT_ATMOS" and its "cost" (NX * NY / DT_ATMOS)
+    """
+    grids = {}
+    for name in load_predef_grids(ushdir):
+        params = set_predef_grid_params(USHdir=ushdir, grid_name=name, quilting=True)
+        nx, ny = grid_points(params)
+        grids[name] = {
+            "params": params,
+            "NX": nx,
+            "NY": ny,
+            "DT_ATMOS": params['DT_ATMOS'],
+            "cost": nx * ny / params['DT_ATMOS'],
+        }
+    return grids
+
+
+def _grid_config(config, ushdir):
+    """A config file or dict, flattened, with the parameters of its
+    predefined grid, if any, as defaults"""
+    cfg_u = load_config_file(config) if isinstance(config, str) else config
     cfg_u = flatten_dict(cfg_u)
 
-    if 'PREDEF_GRID_NAME' in cfg_u:
+    grid_name = cfg_u.get('PREDEF_GRID_NAME')
+    if grid_name is None:
+        return cfg_u
+    grids = predef_grids(ushdir)
+    if grid_name in grids:
+        params_dict = grids[grid_name]['params']
+    else:
+        # raises the error for an unknown grid
         params_dict = set_predef_grid_params(
             USHdir=ushdir,
-            grid_name=cfg_u['PREDEF_GRID_NAME'],
+            grid_name=grid_name,
             quilting=True
         )
+    # merge cfg_u with defaults, duplicate keys in cfg_u will overwrite defaults
+    return {**params_dict, **cfg_u}
 
-        # merge cfg_u with defaults, duplicate keys in cfg_u will overwrite defaults
-        cfg = {**params_dict, **cfg_u}
-    else:
-        cfg = cfg_u
 
-    # number of gridpoints (nx*ny) depends on grid generation method
-    if cfg['GRID_GEN_METHOD'] == "GFDLgrid":
-        grid_params = set_gridparams_GFDLgrid(
-            lon_of_t6_ctr=cfg['GFDLgrid_LON_T6_CTR'],
-            lat_of_t6_ctr=cfg['GFDLgrid_LAT_T6_CTR'],
-            res_of_t6g=cfg['GFDLgrid_NUM_CELLS'],
-            stretch_factor=cfg['GFDLgrid_STRETCH_FAC'],
-            refine_ratio_t6g_to_t7g=cfg['GFDLgrid_REFINE_RATIO'],
-            istart_of_t7_on_t6g=cfg['GFDLgrid_ISTART_OF_RGNL_DOM_ON_T6G'],
-            iend_of_t7_on_t6g=cfg['GFDLgrid_IEND_OF_RGNL_DOM_ON_T6G'],
-            jstart_of_t7_on_t6g=cfg['GFDLgrid_JSTART_OF_RGNL_DOM_ON_T6G'],
-            jend_of_t7_on_t6g=cfg['GFDLgrid_JEND_OF_RGNL_DOM_ON_T6G'],
-            run_envir="community",
-            verbose=False,
-            nh4=4,
-        )
+def calculate_costs(configs, ushdir=USHDIR):
+    """Cost parameters of several configurations
 
-    elif cfg['GRID_GEN_METHOD'] == "ESGgrid":
-        constants = load_config_file(os.path.join(ushdir, "constants.yaml"))
-        grid_params = set_gridparams_ESGgrid(
-            lon_ctr=cfg['ESGgrid_LON_CTR'],
-            lat_ctr=cfg['ESGgrid_LAT_CTR'],
-            nx=cfg['ESGgrid_NX'],
-            ny=cfg['ESGgrid_NY'],
-            pazi=cfg['ESGgrid_PAZI'],
-            halo_width=cfg['ESGgrid_WIDE_HALO_WIDTH'],
-            delx=cfg['ESGgrid_DELX'],
-            dely=cfg['ESGgrid_DELY'],
-            constants=constants["constants"],
-        )
+    Args:
+        configs (list): Paths to config files, or config dicts (nested or
+                        flattened)
+        ushdir   (str): Path to the SRW ush directory
+    Returns:
+        list with, for each config, the list [DT_ATMOS, NX * NY] of its grid
+        followed by those of the reference grid
+    """
+    grids = predef_grids(ushdir)
+    refgrid = grids[REFERENCE_GRID_NAME]
+    reference = [refgrid['DT_ATMOS'], refgrid['NX'] * refgrid['NY']]
+
+    costs = []
+    for config in configs:
+        cfg = _grid_config(config, ushdir)
+        nx, ny = grid_points(cfg)
+        costs.append([cfg['DT_ATMOS'], nx * ny] + reference)
+    return costs
+
+
+@lru_cache(maxsize=None)
+def _default_settings(ushdir):
+    """The settings of config_defaults.yaml that are plain values (not
+    templates), flattened"""
+    defaults = flatten_dict(load_config_file(os.path.join(ushdir, "config_defaults.yaml")))
+    return {key: value for key, value in defaults.items()
+            if value != "" and not (isinstance(value, str) and "{" in value)}
+
+
+def _render(value, cfg):
+    """A setting of a flattened config, with the Jinja templates that only
+    refer to other settings (e.g. '{{ LAYOUT_Y }}') filled in"""
+    if isinstance(value, list):
+        return [_render(item, cfg) for item in value]
+    if not (isinstance(value, str) and "{{" in value):
+        return value
+    env = Environment(undefined=StrictUndefined)
+    env.filters["days_ago"] = days_ago
+    return str_to_type(env.from_string(value).render(**cfg))
+
+
+@lru_cache(maxsize=None)
+def model_levels(suite, ushdir=USHDIR):
+    """Number of vertical layers (npz) of the forecast model for a physics
+    suite, from the base namelist and the changes for the suite"""
+    suite_nml = load_config_file(os.path.join(ushdir, os.pardir, "parm", "FV3.input.yml"))
+    npz = ((suite_nml or {}).get(suite) or {}).get("fv_core_nml", {}).get("npz")
+    if npz is not None:
+        return int(npz)
+    with open(os.path.join(ushdir, os.pardir, "parm", "input.nml.FV3"), encoding="utf-8") as f:
+        return int(re.search(r"^\s*npz\s*=\s*(\d+)", f.read(), re.M).group(1))
+
+
+def experiment_params(config, ushdir=USHDIR):
+    """The quantities that the cost of the tasks of an experiment depends on,
+    from its configuration: an experiment's var_defns.yaml or a user config,
+    whose missing settings are taken from its predefined grid and from
+    config_defaults.yaml
+
+    Args:
+        config (str or dict): Path to the config file, or the config
+        ushdir         (str): Path to the SRW ush directory
+    Returns:
+        dict with the number of "grid_points" (NX * NY), vertical "levels",
+        "dt_atmos", physics "suite", number of "cycles", "fcst_hrs" (forecast
+        hours summed over the cycles), ensemble "members", forecast outputs
+        per hour ("outputs_per_hr"), MPI tasks of the forecast
+        ("fcst_mpi_tasks") and of its write component ("fcst_write_tasks"),
+        OpenMP threads of the forecast ("fcst_threads"), whether the post
+        tasks run ("post", unless the forecast writes the post output inline)
+        and whether the workflow verifies the forecasts ("vx", from the taskgroups of the
+        rocoto section, so always false for a var_defns.yaml)
+    """
+    cfg_u = load_config_file(config) if isinstance(config, str) else config
+    cfg = {**_default_settings(ushdir), **_grid_config(cfg_u, ushdir)}
+    cfg.update({key: _render(cfg[key], cfg) for key in COST_SETTINGS if key in cfg})
+    nx, ny = grid_points(cfg)
+
+    dates = []
+    for key in ("DATE_FIRST_CYCL", "DATE_LAST_CYCL"):
+        date = cfg[key]
+        if not isinstance(date, datetime):
+            date = datetime.strptime(str(date), "%Y%m%d%H")
+        dates.append(date)
+    num_cycles = len(set_cycle_dates(dates[0], dates[1], int(cfg["INCR_CYCL_FREQ"])))
+    # The forecast lengths of FCST_LEN_CYCL repeat with the cycles of each
+    # day; in var_defns.yaml, FCST_LEN_HRS is then the shortest of them
+    fcst_len_cycl = cfg.get("FCST_LEN_CYCL") or []
+    if int(cfg["FCST_LEN_HRS"]) < 0 or len(fcst_len_cycl) > 1:
+        fcst_len_cycl = [int(hrs) for hrs in fcst_len_cycl]
+        fcst_hrs = sum(fcst_len_cycl[i % len(fcst_len_cycl)] for i in range(num_cycles))
     else:
-        raise ValueError("GRID_GEN_METHOD is set to an invalid value")
+        fcst_hrs = num_cycles * int(cfg["FCST_LEN_HRS"])
 
-    cost = [cfg['DT_ATMOS'], grid_params["NX"] * grid_params["NY"] ]
+    outputs_per_hr = 1
+    if cfg.get("SUB_HOURLY_POST") and cfg.get("DT_SUBHOURLY_POST_MNTS"):
+        outputs_per_hr = 60 // int(cfg["DT_SUBHOURLY_POST_MNTS"])
+    write_tasks = 0
+    if cfg.get("QUILTING", True):
+        write_tasks = int(cfg["WRTCMP_write_groups"]) * int(cfg["WRTCMP_write_tasks_per_group"])
+    taskgroups = ((cfg_u.get("rocoto") or {}).get("tasks") or {}).get("taskgroups", "")
 
-    # reference grid (6-hour forecast on RRFS_CONUS_25km)
-    PREDEF_GRID_NAME = "RRFS_CONUS_25km"
+    return {
+        "grid_points": nx * ny,
+        "levels": model_levels(cfg["CCPP_PHYS_SUITE"], ushdir),
+        "dt_atmos": float(cfg["DT_ATMOS"]),
+        "suite": cfg["CCPP_PHYS_SUITE"],
+        "cycles": num_cycles,
+        "fcst_hrs": fcst_hrs,
+        "members": int(cfg["NUM_ENS_MEMBERS"]) if cfg.get("DO_ENSEMBLE") else 1,
+        "outputs_per_hr": outputs_per_hr,
+        "fcst_mpi_tasks": int(cfg["LAYOUT_X"]) * int(cfg["LAYOUT_Y"]) + write_tasks,
+        "fcst_write_tasks": write_tasks,
+        "fcst_threads": int(cfg["OMP_NUM_THREADS_RUN_FCST"]),
+        "post": not cfg.get("WRITE_DOPOST", False),
+        "vx":"verify_" in str(taskgroups),
+    }
 
-    refgrid = set_predef_grid_params(
-        USHdir=ushdir,
-        grid_name=PREDEF_GRID_NAME,
-        quilting=True,
-    )
 
-    cost.extend([refgrid['DT_ATMOS'], refgrid['ESGgrid_NX'] * refgrid['ESGgrid_NY']])
+def calculate_cost(config_fn):
+    """Cost parameters of a configuration, see calculate_costs()
 
-    return cost
+    Args:
+        config_fn (str): Path to the config file
+    Returns:
+        list of DT_ATMOS and NX * NY of the grid of the config and of the
+        reference grid
+    """
+    return calculate_costs([config_fn])[0]
 
 
 # interface
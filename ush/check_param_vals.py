@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+
+"""
+Validation of experiment parameters against the allowed values listed in
+valid_param_vals.yaml. The valid-values file is loaded once per process into
+frozensets, and a configuration is checked in a single pass that reports every
+invalid parameter at once. The checks work on full experiment configurations
+(as in setup.py) as well as on partial user or WE2E test configurations.
+"""
+
+import argparse
+import os
+import sys
+from functools import lru_cache
+from multiprocessing import Pool
+from textwrap import dedent
+
+from python_utils import (
+    flatten_dict,
+    load_config_file,
+)
+
+VALID_VALS_PREFIX = "valid_vals_"
+
+
+@lru_cache(maxsize=None)
+def load_valid_param_vals(valid_vals_fp=None):
+    """Loads valid_param_vals.yaml once and precompiles it for membership tests
+
+    Args:
+        valid_vals_fp (str): Path to the valid values file; defaults to the one
+                             in the ush directory
+    Returns:
+        dict mapping each parameter name to a tuple of (frozenset of valid
+        values, list of valid values in file order)
+    """
+
+    if valid_vals_fp is None:
+        valid_vals_fp = os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), "valid_param_vals.yaml"
+        )
+    cfg_v = load_config_file(valid_vals_fp)
+    valid_vals = {}
+    for vkey, vals in cfg_v.items():
+        if not vkey.startswith(VALID_VALS_PREFIX):
+            continue
+        valid_vals[vkey[len(VALID_VALS_PREFIX):]] = (frozenset(vals), list(vals))
+    return valid_vals
+
+
+def _is_valid(value, valid_set, valid_list):
+    """Membership test that falls back on the list for unhashable values"""
+
+    try:
+        return value in valid_set
+    except TypeError:
+        return value in valid_list
+
+
+def _is_template(value):
+    """Whether a value still holds an unrendered Jinja2 template"""
+
+    return isinstance(value, str) and ("{{" in value or "{%" in value)
+
+
+def find_invalid_params(cfg, valid_vals_fp=None, skip_templates=False):
+    """Checks every parameter of a (possibly nested) configuration dictionary
+    against its valid values. Empty (None or "") parameters are not checked, and
+    list-valued parameters are checked element by element.
+
+    Args:
+        cfg            (dict): Configuration dictionary
+        valid_vals_fp   (str): Path to the valid values file
+        skip_templates (bool): Do not check values that are still Jinja2
+                               templates, e.g. in configs that have not been
+                               through setup yet
+    Returns:
+        list of (name, value, invalid_values, valid_values) tuples, empty if all
+        parameters are valid
+    """
+
+    valid_vals = load_valid_param_vals(valid_vals_fp)
+    invalid = []
+    for k, v in flatten_dict(cfg).items():
+        if v is None or v == "" or k not in valid_vals:
+            continue
+        valid_set, valid_list = valid_vals[k]
+        values = v if isinstance(v, list) else [v]
+        if skip_templates:
+            values = [ele for ele in values if not _is_template(ele)]
+        bad = [ele for ele in values if not _is_valid(ele, valid_set, valid_list)]
+        if bad:
+            invalid.append((k, v, bad, valid_list))
+    return invalid
+
+
+def format_invalid_params(invalid):
+    """Builds the error message for the output of find_invalid_params"""
+
+    msgs = []
+    for k, v, bad, valid_list in invalid:
+        if isinstance(v, list):
+            what = f"has at least one invalid value ({bad})"
+        else:
+            what = "does not have a valid value"
+        msgs.append(
+            dedent(
+                f"""
+                The variable
+                    {k} = {v}
+                in the user's configuration {what}.  Possible values are:
+                    {k} = {valid_list}"""
+            )
+        )
+    return "\n".join(msgs)
+
+
+def check_param_vals(cfg, valid_vals_fp=None):
+    """Raises an exception listing all invalid parameters in a configuration
+
+    Args:
+        cfg           (dict): Configuration dictionary
+        valid_vals_fp  (str): Path to the valid values file
+    Returns:
+        None
+    """
+
+    invalid = find_invalid_params(cfg, valid_vals_fp)
+    if invalid:
+        raise ValueError(
+            f"Found {len(invalid)} invalid parameter value(s):\n"
+            + format_invalid_params(invalid)
+        )
+
+
+def _check_config_file(config_fp):
+    """Worker for check_config_files; returns the error message for one file"""
+
+    try:
+        cfg = load_config_file(config_fp)
+        # setup() accepts the machine name in any case
+        machine = (cfg.get("user") or {}).get("MACHINE")
+        if isinstance(machine, str):
+            cfg["user"]["MACHINE"] = machine.upper()
+        invalid = find_invalid_params(cfg, skip_templates=True)
+    except Exception as e:  # pylint: disable=broad-except
+        return config_fp, f"Could not load {config_fp}: {e}"
+    return config_fp, format_invalid_params(invalid) if invalid else ""
+
+
+def check_config_files(config_fps, procs=1):
+    """Validates many user or test configuration files, optionally with a process
+    pool. No experiment is generated; each file is only checked against the valid
+    values, skipping values that are still Jinja2 templates.
+
+    Args:
+        config_fps (list): Paths to config files
+        procs       (int): Number of parallel processes
+    Returns:
+        dict mapping each config file with invalid values to its error message
+    """
+
+    if procs > 1 and len(config_fps) > 1:
+        with Pool(processes=procs) as pool:
+            results = pool.map(_check_config_file, config_fps)
+    else:
+        results = [_check_config_file(fp) for fp in config_fps]
+    return {fp: msg for fp, msg in results if msg}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Check config files against the values in valid_param_vals.yaml."
+    )
+    parser.add_argument("configs", nargs="+", help="Config files to check")
+    parser.add_argument(
+        "-p", "--procs", type=int, default=1, help="Number of parallel processes"
+    )
+    args = parser.parse_args()
+
+    errors = check_config_files(args.configs, args.procs)
+    for config_fp, msg in errors.items():
+        print(f"{config_fp}:{msg}\n")
+    print(f"{len(args.configs) - len(errors)} of {len(args.configs)} config files are valid")
+    sys.exit(1 if errors else 0)
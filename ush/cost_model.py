@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+
+"""
+Predicts the core-hours of the forecast, post-processing and verification
+tasks of an experiment, for allocation planning, from a cost model fitted to
+the experiments recorded in the runtime history (see runtime_history.py).
+
+The core-seconds (cores times walltime) used by the tasks of each category
+over a whole experiment are modeled as a sum of terms proportional to the
+quantities of calculate_cost.experiment_params():
+
+    forecast: grid points x levels x time steps, with a coefficient for each
+              physics suite with enough recorded experiments; grid points x
+              levels x output times; and cores x forecasts (start-up). The
+              first two are scaled up by the cores of the write component,
+              which are held for the whole forecast.
+    post:     grid points x levels x output times; and output times.
+    vx:       grid points x forecast hours; and forecast hours.
+
+All terms are summed over the cycles and ensemble members. The coefficients
+are fitted by least squares on the relative error, and kept non-negative.
+
+    python3 cost_model.py fit -o cost_model.yaml [--record EXPTDIR ...]
+    python3 cost_model.py predict -m cost_model.yaml config.yaml [...]
+"""
+
+import argparse
+import logging
+import sys
+from textwrap import dedent
+
+from calculate_cost import experiment_params
+from python_utils import cfg_to_yaml_str, load_config_file
+from runtime_history import DEFAULT_HISTORY_DB, RuntimeHistory, record_experiment
+
+# Glob patterns of the names of the tasks of each category
+CATEGORIES = {
+    "forecast": ["run_fcst*"],
+    "post": ["run_post*"],
+    "vx": ["get_obs_*", "run_MET_*", "check_post_output*"],
+}
+
+# Fewest recorded experiments a category is fitted to, and a physics suite
+# gets its own coefficient for
+MIN_SAMPLES = 3
+MIN_SUITE_SAMPLES = 2
+
+
+def cost_terms(category, params, suite_term=True):
+    """The terms of the cost model of a category of tasks for an experiment
+
+    Args:
+        category     (str): "forecast", "post" or "vx"
+        params      (dict): The quantities of calculate_cost.experiment_params()
+        suite_term  (bool): Whether the forecast work term is named for the
+                            physics suite ("work:SUITE") rather than "work"
+    Returns:
+        dict: The value of each term, by name
+    """
+    points = params["grid_points"]
+    members = params["members"]
+    outputs = params["outputs_per_hr"] * params["fcst_hrs"] + params["cycles"]
+    if category == "forecast":
+        mpi_tasks = params["fcst_mpi_tasks"]
+        held = mpi_tasks / max(mpi_tasks - params["fcst_write_tasks"], 1)
+        steps = params["fcst_hrs"] * 3600 / params["dt_atmos"]
+        work = f"work:{params['suite']}" if suite_term else "work"
+        return {
+            work: members * held * points * params["levels"] * steps,
+            "output": members * held * points * params["levels"] * outputs,
+            "startup": members * params["cycles"] * mpi_tasks * params["fcst_threads"],
+        }
+    if category == "post":
+        return {
+            "volume": members * points * params["levels"] * outputs,
+            "outputs": members * outputs,
+        }
+    if category == "vx":
+        hours = members * (params["fcst_hrs"] + params["cycles"])
+        return {"points": points * hours, "hours": hours}
+    raise ValueError(f"Invalid category {category}")
+
+
+def solve(matrix, vector):
+    """Solves a square linear system by Gaussian elimination with partial
+    pivoting; None if it is singular"""
+    n = len(vector)
+    rows = [list(row) + [value] for row, value in zip(matrix, vector)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(rows[r][col]))
+        if abs(rows[pivot][col]) < 1e-12:
+            return None
+        rows[col], rows[pivot] = rows[pivot], rows[col]
+        for r in range(col + 1, n):
+            factor = rows[r][col] / rows[col][col]
+            for c in range(col, n + 1):
+                rows[r][c] -= factor * rows[col][c]
+    solution = [0.0] * n
+    for r in reversed(range(n)):
+        solution[r] = (rows[r][n] - sum(rows[r][c] * solution[c]
+                                        for c in range(r + 1, n))) / rows[r][r]
+    return solution
+
+
+def fit_terms(samples):
+    """Least-squares fit of the relative error of a cost model, with the
+    coefficients kept non-negative by an active-set heuristic: while the fit
+    gives a term a negative coefficient, the most negative term is dropped
+    and the others are fitted again. This is not an exact non-negative least
+    squares solution, but it is close for the few, mostly independent, terms
+    of the cost model.
+
+    Args:
+        samples (list): (terms, core_seconds) of each experiment, with the
+                        terms as given by cost_terms()
+    Returns:
+        dict: The coefficient of each term, by name; terms that do not
+              improve the fit are left out
+    """
+    names = sorted({name for terms, _ in samples for name in terms})
+    # Each experiment is weighted by its cost, so that small and large ones
+    # count alike, and each term scaled to the same magnitude
+    rows = [[terms.get(name, 0) / cost for name in names] for terms, cost in samples]
+    scales = [max(abs(row[i]) for row in rows) or 1 for i in range(len(names))]
+    rows = [[value / scale for value, scale in zip(row, scales)] for row in rows]
+
+    active = list(range(len(names)))
+    while active:
+        normal = [[sum(row[i] * row[j] for row in rows) for j in active] for i in active]
+        rhs = [sum(row[i] for row in rows) for i in active]
+        solution = solve(normal, rhs)
+        if solution is None:
+            # Terms that cannot be told apart: keep the first ones
+            active.pop()
+            continue
+        if min(solution) >= 0:
+            return {names[i]: value / scales[i] for i, value in zip(active, solution)}
+        active.pop(solution.index(min(solution)))
+    return {}
+
+
+def fit_cost_model(history, min_samples=MIN_SAMPLES):
+    """Fits the cost model of each category of tasks to the experiments in a
+    runtime history
+
+    Args:
+        history (RuntimeHistory): The runtime history
+        min_samples        (int): Fewest experiments a category is fitted to
+    Returns:
+        dict: By category, the "coefficients" of its terms and the number of
+              "samples" it was fitted to; categories with too few samples are
+              left out
+    """
+    runs = history.experiment_core_seconds(CATEGORIES)
+    suites = {}
+    for params, core_seconds in runs:
+        if core_seconds["forecast"]:
+            suites[params["suite"]] = suites.get(params["suite"], 0) + 1
+
+    model = {}
+    for category in CATEGORIES:
+        samples = []
+        for params, core_seconds in runs:
+            # A category that did not run in an experiment tells nothing
+            if not core_seconds[category]:
+                continue
+            suite_term = suites.get(params["suite"], 0) >= MIN_SUITE_SAMPLES
+            samples.append((cost_terms(category, params, suite_term), core_seconds[category]))
+        if len(samples) < min_samples:
+            logging.info(f"Too few experiments ({len(samples)}) to fit the {category} cost")
+            continue
+        model[category] = {"coefficients": fit_terms(samples), "samples": len(samples)}
+    return model
+
+
+def predict_core_hours(model, params):
+    """The core-hours of the tasks of an experiment predicted by a cost model
+
+    Args:
+        model  (dict): The cost model, see fit_cost_model()
+        params (dict): The quantities of calculate_cost.experiment_params()
+    Returns:
+        dict: Core-hours of each category of tasks the experiment runs and
+              the model covers, and their "total"
+    """
+    core_hours = {}
+    for category, fitted in model.items():
+        if category == "post" and not params.get("post", True):
+            continue
+        if category == "vx" and not params.get("vx"):
+            continue
+        coefficients = dict(fitted["coefficients"])
+        terms = cost_terms(category, params)
+        suite_work = f"work:{params['suite']}"
+        if category == "forecast" and suite_work not in coefficients:
+            # A suite without a coefficient of its own costs as the pooled
+            # suites, or else as the mean of the others
+            suite_coefs = [value for name, value in coefficients.items()
+                           if name.startswith("work:")]
+            coefficients[suite_work] = coefficients.get(
+                "work", sum(suite_coefs) / len(suite_coefs) if suite_coefs else 0)
+        seconds = sum(coefficients.get(name, 0) * value for name, value in terms.items())
+        core_hours[category] = seconds / 3600
+    core_hours["total"] = sum(core_hours.values())
+    return core_hours
+
+
+def experiment_core_hours(model, configs):
+    """The predicted core-hours of several experiments
+
+    Args:
+        model   (dict): The cost model, see fit_cost_model()
+        configs (list): Paths to config files or config dicts, see
+                        calculate_cost.experiment_params()
+    Returns:
+        list of dicts of core-hours, see predict_core_hours()
+    """
+    return [predict_core_hours(model, experiment_params(config)) for config in configs]
+
+
+def parse_args(argv):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(
+        description="Fit a cost model to the runtime history and predict core-hours."
+    )
+    parser.add_argument(
+        "--db",
+        default=DEFAULT_HISTORY_DB,
+        help="Path to the runtime history database.",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    fit = subparsers.add_parser("fit", help="Fit the cost model and write it to a file.")
+    fit.add_argument("--record", nargs="+", default=[], metavar="EXPTDIR",
+                     help="Experiment directories to record in the history first.")
+    fit.add_argument("--min-samples", dest="min_samples", type=int, default=MIN_SAMPLES,
+                     help="Fewest experiments a category of tasks is fitted to.")
+    fit.add_argument("-o", "--output", required=True, help="The model file to write.")
+
+    predict = subparsers.add_parser("predict", help="Predict the core-hours of experiments.")
+    predict.add_argument("-m", "--model",
+                         help="Model file written by the fit command; by default the "
+                              "model is fitted to the history.")
+    predict.add_argument("configs", nargs="+",
+                         help="Experiment config files (user configs or var_defns.yaml).")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    args = parse_args(sys.argv[1:])
+    if args.command == "fit":
+        with RuntimeHistory(args.db) as hist:
+            for expt in args.record:
+                record_experiment(hist, expt)
+            cost_model = fit_cost_model(hist, args.min_samples)
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(dedent(
+                f"""\
+                # Cost model of workflow tasks in core-seconds, fitted from
+                # {args.db} by cost_model.py
+                """))
+            f.write(cfg_to_yaml_str(cost_model))
+        logging.info(f"Wrote {args.output}")
+    else:
+        if args.model:
+            cost_model = load_config_file(args.model)
+        else:
+            with RuntimeHistory(args.db) as hist:
+                cost_model = fit_cost_model(hist)
+        if not cost_model:
+            sys.exit("The cost model covers no tasks; record more experiments")
+        print(f"{'config':50} {'forecast':>10} {'post':>10} {'vx':>10} {'total':>10}")
+        for config_fp, core_hours in zip(args.configs,
+                                         experiment_core_hours(cost_model, args.configs)):
+            print(f"{config_fp:50}" + "".join(
+                f" {core_hours[c]:10.1f}" if c in core_hours else f" {'-':>10}"
+                for c in ["forecast", "post", "vx", "total"]))
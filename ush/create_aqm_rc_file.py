@@ -7,7 +7,6 @@ import argparse
 import os
 import sys
 from textwrap import dedent
-from uwtools.api.template import render
 
 from python_utils import (
     cfg_to_yaml_str,
@@ -18,6 +17,7 @@ from python_utils import (
     print_input_args,
     str_to_type,
 )
+from template_store import render_template
 
 def create_aqm_rc_file(cdate, run_dir, init_concentrations):
     """ Creates an aqm.rc file in the specified run directory
@@ -123,11 +123,7 @@ def create_aqm_rc_file(cdate, run_dir, init_concentrations):
     #
     #-----------------------------------------------------------------------
     #
-    render(
-        input_file = AQM_RC_TMPL_FP,
-        output_file = aqm_rc_fp,
-        values_src = settings,
-    )
+    render_template(AQM_RC_TMPL_FP, aqm_rc_fp, settings, exptdir=globals().get("EXPTDIR"))
     return True
 
 def parse_args(argv):
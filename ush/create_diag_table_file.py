@@ -8,7 +8,6 @@ import argparse
 import os
 import sys
 from textwrap import dedent
-from uwtools.api.template import render
 
 from python_utils import (
     cfg_to_yaml_str,
@@ -18,6 +17,7 @@ from python_utils import (
     print_info_msg,
     print_input_args,
 )
+from template_store import render_template
 
 
 def create_diag_table_file(run_dir):
@@ -73,11 +73,7 @@ def create_diag_table_file(run_dir):
         verbose=VERBOSE,
     )
 
-    render(
-        input_file = DIAG_TABLE_TMPL_FP,
-        output_file = diag_table_fp,
-        values_src = settings,
-        )
+    render_template(DIAG_TABLE_TMPL_FP, diag_table_fp, settings, exptdir=globals().get("EXPTDIR"))
     return True
 
 
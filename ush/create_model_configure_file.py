@@ -7,7 +7,6 @@ import argparse
 import os
 import sys
 from textwrap import dedent
-from uwtools.api.template import render
 
 from python_utils import (
     cfg_to_yaml_str,
@@ -19,6 +18,7 @@ from python_utils import (
     print_input_args,
     str_to_type,
 )
+from template_store import render_template
 
 
 def create_model_configure_file(
@@ -219,11 +219,8 @@ def create_model_configure_file(
     #
     model_config_fp = os.path.join(run_dir, MODEL_CONFIG_FN)
 
-    render(
-        input_file = MODEL_CONFIG_TMPL_FP,
-        output_file = model_config_fp,
-        values_src = settings
-        )
+    render_template(MODEL_CONFIG_TMPL_FP, model_config_fp, settings,
+                    exptdir=globals().get("EXPTDIR"))
     return True
 
 
@@ -9,7 +9,6 @@ import argparse
 import os
 import sys
 from textwrap import dedent
-from uwtools.api.template import render
 
 from python_utils import (
     cfg_to_yaml_str,
@@ -19,6 +18,7 @@ from python_utils import (
     print_info_msg,
     print_input_args,
 )
+from template_store import render_template
 
 def create_ufs_configure_file(run_dir):
     """ Creates a ufs configuration file in the specified
@@ -86,11 +86,7 @@ def create_ufs_configure_file(run_dir):
     #
     #-----------------------------------------------------------------------
     #
-    render(
-        input_file = UFS_CONFIG_TMPL_FP,
-        output_file = ufs_config_fp,
-        values_src = settings,
-        )
+    render_template(UFS_CONFIG_TMPL_FP, ufs_config_fp, settings, exptdir=globals().get("EXPTDIR"))
     return True
 
 def parse_args(argv):
@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+
+"""
+Finds the chain of tasks that bounds the wall time of an experiment's
+workflow (its critical path), how much each task can be delayed without
+delaying the workflow (its slack), and how many nodes and tasks the workflow
+would use over time if every task started as soon as its dependencies were
+met.
+
+The tasks and dependencies are read from the rocoto YAML written by setup()
+(ROCOTO_YAML_FP), with metatasks expanded. Dependencies that do not depend
+on the state of tasks (streq, taskvalid) are evaluated, and of the
+alternatives of an "or" the one met first is followed. A data dependency on
+a file named after a task (e.g. make_grid_task_complete.txt) is taken to
+wait on that task; other data dependencies are taken to be met.
+
+Task runtimes are, in order of preference, those measured in the rocoto
+databases given, their median in the runtime history, or the walltimes of
+the tasks:
+
+    python3 critical_path.py -e EXPTDIR [--db FV3LAM_wflow.db ...] [--history DB]
+"""
+
+import argparse
+import math
+import os
+import sqlite3
+import sys
+from contextlib import closing
+from datetime import datetime, timezone
+from statistics import median
+
+from python_utils import load_yaml_config
+from local_workflow import Workflow, signed_interval
+from runtime_history import RuntimeHistory
+
+NEVER = math.inf
+
+
+class Runtimes:
+    """Runtimes of the tasks of a workflow
+
+    Args:
+        rocoto_dbs (list): Paths of rocoto databases with measured runtimes
+        history (RuntimeHistory): The runtime history, or None
+        grid (str): Grid of the experiment, to select runtimes in the history
+    """
+
+    def __init__(self, rocoto_dbs=(), history=None, grid=None):
+        self.measured = {}
+        by_task = {}
+        for rocoto_db in rocoto_dbs:
+            with closing(sqlite3.connect(f"file:{rocoto_db}?mode=ro", uri=True)) as db:
+                for name, cycle, duration in db.execute(
+                        "SELECT taskname, cycle, duration FROM jobs "
+                        "WHERE state = 'SUCCEEDED' AND duration IS NOT NULL"):
+                    self.measured[(name, datetime.fromtimestamp(cycle, timezone.utc))] = duration
+                    by_task.setdefault(name, []).append(duration)
+        self.typical = {name: median(durations) for name, durations in by_task.items()}
+        self.history = history
+        self.grid = grid
+
+    def runtime(self, workflow, name, cycle):
+        """The runtime of a task for a cycle, in seconds, and where it came
+        from: "measured", "median", "history", "walltime" or "unknown\""""
+        if (name, cycle) in self.measured:
+            return self.measured[(name, cycle)], "measured"
+        if name in self.typical:
+            return self.typical[name], "median"
+        if self.history is not None:
+            value = self.history.task_percentiles([50], task=name, grid=self.grid)[0]
+            if value is not None:
+                self.typical[name] = value
+                return value, "history"
+        walltime = workflow.tasks[name]["walltime"]
+        if walltime is not None:
+            return walltime, "walltime"
+        return 0, "unknown"
+
+
+class CriticalPath:
+    """The earliest schedule of the tasks of a workflow with unlimited
+    resources
+
+    Args:
+        workflow (Workflow): The workflow
+        runtimes (Runtimes): The runtimes of its tasks
+        cores_per_node (int): Cores of a node, for tasks that request cores
+    """
+
+    def __init__(self, workflow, runtimes, cores_per_node=None):
+        self.workflow = workflow
+        self.runtimes = runtimes
+        self.cores_per_node = cores_per_node
+        # Per (task, cycle): its "start", "end", "runtime", "source", "nodes"
+        # and the (task, cycle) it waits on ("after")
+        self.schedule = {}
+        # Per task name that data dependencies may refer to, longest first
+        self._producers = sorted(workflow.tasks, key=len, reverse=True)
+        self._computing = set()
+        for cycle in workflow.cycles:
+            for name, task in workflow.tasks.items():
+                if cycle in task["cycles"]:
+                    self.node(name, cycle)
+
+    def node(self, name, cycle):
+        """The schedule of a task for a cycle"""
+        key = (name, cycle)
+        if key in self.schedule:
+            return self.schedule[key]
+        if key in self._computing:
+            raise ValueError(f"Dependency cycle at task {name} for {cycle:%Y%m%d%H%M}")
+        self._computing.add(key)
+        task = self.workflow.tasks[name]
+        dep = task["settings"].get("dependency")
+        start, after = 0, []
+        if dep:
+            start, after = self._and(dep, name, cycle)
+            start = start or 0
+        runtime, source = self.runtimes.runtime(self.workflow, name, cycle)
+        nodes = task["nodes"]
+        if nodes is None:
+            nodes = math.ceil(task["cores"] / self.cores_per_node) if self.cores_per_node else 1
+        self.schedule[key] = {
+            "start": start,
+            "end": start + runtime,
+            "runtime": runtime,
+            "source": source,
+            "nodes": nodes,
+            "after": after,
+        }
+        self._computing.discard(key)
+        return self.schedule[key]
+
+    # Each dependency evaluates to the time it is met (None if it does not
+    # constrain the start, NEVER if it is never met) and the tasks that
+    # determine that time
+
+    def _and(self, children, name, cycle):
+        start, after = None, []
+        for tag, value in children.items():
+            if tag == "attrs":
+                continue
+            child_start, child_after = self._dep(tag.split("_")[0], value, name, cycle)
+            if child_start is None:
+                continue
+            if start is None or child_start > start:
+                start = child_start
+            after.extend(child_after)
+        return start, after
+
+    def _or(self, children, name, cycle):
+        best = None, []
+        for tag, value in children.items():
+            if tag == "attrs":
+                continue
+            child = self._dep(tag.split("_")[0], value, name, cycle)
+            if child[0] is not None and (best[0] is None or child[0] < best[0]):
+                best = child
+        return best
+
+    def _static(self, tag, value, name, cycle):
+        """The value of a dependency that does not depend on the state of
+        tasks, or None"""
+        wflow = self.workflow
+        subs = wflow.tasks[name]["subs"]
+        if tag in ("and", "or", "not", "nand", "nor"):
+            values = [self._static(child.split("_")[0], child_value, name, cycle)
+                      for child, child_value in value.items() if child != "attrs"]
+            if None in values:
+                return None
+            met = all(values) if tag in ("and", "not", "nand") else any(values)
+            return not met if tag in ("not", "nand", "nor") else met
+        if tag in ("streq", "strneq"):
+            equal = (wflow.expand(value.get("left", ""), subs, cycle)
+                     == wflow.expand(value.get("right", ""), subs, cycle))
+            return equal if tag == "streq" else not equal
+        if tag == "taskvalid":
+            return wflow.valid(self._attr(value, "task", name), self._offset(value, name, cycle))
+        return None
+
+    def _attr(self, value, attr, name):
+        return self.workflow.expand((value.get("attrs") or {}).get(attr, ""),
+                                    self.workflow.tasks[name]["subs"])
+
+    def _offset(self, value, name, cycle):
+        offset = self._attr(value, "cycle_offset", name)
+        if not offset:
+            return cycle
+        return datetime.fromtimestamp(cycle.timestamp() + signed_interval(offset), timezone.utc)
+
+    def _dep(self, tag, value, name, cycle):
+        static = self._static(tag, value, name, cycle)
+        if static is not None:
+            return (0 if static else NEVER), []
+        if tag == "and":
+            return self._and(value, name, cycle)
+        if tag == "or":
+            return self._or(value, name, cycle)
+        if tag in ("not", "nand", "nor"):
+            return None, []
+        if tag == "taskdep":
+            if self._attr(value, "state", name).upper() not in ("", "SUCCEEDED"):
+                return None, []
+            return self._task_end(self._attr(value, "task", name),
+                                  self._offset(value, name, cycle))
+        if tag == "metataskdep":
+            members = [task for task in
+                       self.workflow.metatasks.get(self._attr(value, "metatask", name), [])
+                       if self.workflow.valid(task, cycle)]
+            return self._and({f"taskdep_{i}": {"attrs": {"task": task}}
+                              for i, task in enumerate(members)}, name, cycle) \
+                if members else (0, [])
+        if tag == "datadep":
+            text = value.get("text", "") if isinstance(value, dict) else value
+            path = self.workflow.expand(text, self.workflow.tasks[name]["subs"], cycle)
+            basename = os.path.basename(path.strip())
+            for producer in self._producers:
+                if producer != name and basename.startswith(f"{producer}_"):
+                    return self._task_end(producer, cycle)
+        return None, []
+
+    def _task_end(self, task, cycle):
+        if not self.workflow.valid(task, cycle):
+            return NEVER, []
+        return self.node(task, cycle)["end"], [(task, cycle)]
+
+    def reachable(self):
+        """The tasks that can run, by (task, cycle)"""
+        return {key: node for key, node in self.schedule.items() if node["start"] < NEVER}
+
+    def makespan(self):
+        """Time from the start of the workflow to the end of its last task"""
+        return max((node["end"] for node in self.reachable().values()), default=0)
+
+    def critical_path(self):
+        """The chain of tasks, from the first, that ends last"""
+        nodes = self.reachable()
+        if not nodes:
+            return []
+        key = max(nodes, key=lambda k: nodes[k]["end"])
+        path = [key]
+        while nodes[key]["after"]:
+            key = max(nodes[key]["after"], key=lambda k: nodes[k]["end"])
+            path.append(key)
+        return path[::-1]
+
+    def slack(self):
+        """How long each task can be delayed without delaying the workflow,
+        by (task, cycle)"""
+        nodes = self.reachable()
+        makespan = self.makespan()
+        latest_end = {key: makespan for key in nodes}
+        # Tasks are scheduled after the tasks they wait on
+        for key in reversed([key for key in self.schedule if key in nodes]):
+            latest_start = latest_end[key] - nodes[key]["runtime"]
+            for before in nodes[key]["after"]:
+                if before in latest_end:
+                    latest_end[before] = min(latest_end[before], latest_start)
+        return {key: latest_end[key] - node["end"] for key, node in nodes.items()}
+
+    def usage(self):
+        """Nodes and tasks in use over time
+
+        Returns:
+            list of (time, nodes, tasks, cycles) at each time the usage
+            changes
+        """
+        events = []
+        for (_, cycle), node in self.reachable().items():
+            if node["runtime"] > 0:
+                events.append((node["start"], node["nodes"], 1, cycle))
+                events.append((node["end"], -node["nodes"], -1, cycle))
+        events.sort(key=lambda event: (event[0], event[1]))
+        usage, nodes, tasks, cycles = [], 0, 0, {}
+        for when, dnodes, dtasks, cycle in events:
+            nodes += dnodes
+            tasks += dtasks
+            cycles[cycle] = cycles.get(cycle, 0) + dtasks
+            if not cycles[cycle]:
+                del cycles[cycle]
+            if usage and usage[-1][0] == when:
+                usage[-1] = (when, nodes, tasks, len(cycles))
+            else:
+                usage.append((when, nodes, tasks, len(cycles)))
+        return usage
+
+    def stages(self):
+        """Per task as named in the rocoto YAML (i.e. before its metatasks
+        are expanded): number of tasks, node-hours, time from the first start
+        to the last end, and the most tasks running at once"""
+        groups = {}
+        for (name, _), node in self.reachable().items():
+            groups.setdefault(self.workflow.tasks[name]["template"], []).append(node)
+        stages = {}
+        for template, nodes in groups.items():
+            events = sorted([(node["start"], 1) for node in nodes if node["runtime"] > 0]
+                            + [(node["end"], -1) for node in nodes if node["runtime"] > 0])
+            running = peak = 0
+            for _, delta in events:
+                running += delta
+                peak = max(peak, running)
+            stages[template] = {
+                "tasks": len(nodes),
+                "node_hours": sum(node["runtime"] * node["nodes"] for node in nodes) / 3600,
+                "span": max(node["end"] for node in nodes) - min(node["start"] for node in nodes),
+                "max_parallel": peak,
+            }
+        return stages
+
+
+def format_duration(seconds):
+    """A duration as H:MM:SS"""
+    seconds = int(round(seconds))
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def report(analysis, top=20):
+    """The critical path, tasks with the least slack, stages and usage of a
+    workflow, as text"""
+    nodes = analysis.reachable()
+    lines = [f"Makespan: {format_duration(analysis.makespan())}", "", "Critical path:"]
+    for name, cycle in analysis.critical_path():
+        node = nodes[(name, cycle)]
+        lines.append(f"  {format_duration(node['start']):>9} {format_duration(node['end']):>9} "
+                     f"{format_duration(node['runtime']):>9} {node['source']:9} "
+                     f"{cycle:%Y%m%d%H%M} {name}")
+
+    slack = analysis.slack()
+    lines += ["", f"Least slack (of {len(slack)} tasks):"]
+    for (name, cycle), value in sorted(slack.items(), key=lambda item: item[1])[:top]:
+        lines.append(f"  {format_duration(value):>9} {cycle:%Y%m%d%H%M} {name}")
+
+    lines += ["", "Stages:", f"  {'task':50} {'tasks':>6} {'node-hrs':>9} {'span':>9} {'max par':>8}"]
+    for template, stage in sorted(analysis.stages().items(),
+                                  key=lambda item: -item[1]["node_hours"]):
+        lines.append(f"  {template:50} {stage['tasks']:6d} {stage['node_hours']:9.2f} "
+                     f"{format_duration(stage['span']):>9} {stage['max_parallel']:8d}")
+
+    usage = analysis.usage()
+    if usage:
+        peak_nodes = max(nodes for _, nodes, _, _ in usage)
+        peak_tasks = max(tasks for _, _, tasks, _ in usage)
+        peak_cycles = max(cycles for _, _, _, cycles in usage)
+        lines += ["", "Ideal usage:",
+                  f"  peak of {peak_nodes} nodes, {peak_tasks} tasks and {peak_cycles} active "
+                  f"cycles (taskthrottle and cyclethrottle below these delay the workflow)"]
+        makespan = analysis.makespan()
+        steps = 20
+        for i in range(steps):
+            when = makespan * i / steps
+            current = [u for u in usage if u[0] <= when]
+            used = current[-1][1] if current else 0
+            bar = "#" * (round(40 * used / peak_nodes) if peak_nodes else 0)
+            lines.append(f"  {format_duration(when):>9} {used:6d} {bar}")
+
+    never = len(analysis.schedule) - len(nodes)
+    if never:
+        lines += ["", f"{never} tasks never run: their dependencies cannot be met"]
+    return "\n".join(lines)
+
+
+def parse_args(argv):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(
+        description="Report the critical path of an experiment's workflow."
+    )
+    parser.add_argument(
+        "-e", "--exptdir",
+        dest="exptdir",
+        required=True,
+        help="The experiment directory.",
+    )
+    parser.add_argument(
+        "--db",
+        nargs="+",
+        default=None,
+        help="Rocoto databases with measured runtimes; the experiment's by default.",
+    )
+    parser.add_argument(
+        "--history",
+        default=None,
+        help="Runtime history database with runtimes of earlier experiments.",
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=20,
+        help="Number of tasks with the least slack to list.",
+    )
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    expt_cfg = load_yaml_config(os.path.join(args.exptdir, "var_defns.yaml"))
+    workflow_cfg = expt_cfg["workflow"]
+    rocoto_yaml = workflow_cfg.get("ROCOTO_YAML_FP",
+                                   os.path.join(args.exptdir, "rocoto_defns.yaml"))
+    dbs = args.db
+    if dbs is None:
+        expt_db = os.path.join(args.exptdir, os.path.splitext(
+            workflow_cfg.get("WFLOW_XML_FN", "FV3LAM_wflow.xml"))[0] + ".db")
+        dbs = [expt_db] if os.path.exists(expt_db) else []
+    hist = RuntimeHistory(args.history) if args.history else None
+    wflow = Workflow(load_yaml_config(rocoto_yaml))
+    analyzer = CriticalPath(
+        wflow,
+        Runtimes(dbs, hist, workflow_cfg.get("PREDEF_GRID_NAME")),
+        expt_cfg.get("platform", {}).get("NCORES_PER_NODE"),
+    )
+    print(report(analyzer, args.top))
+    if hist is not None:
+        hist.close()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+
+"""
+A content-addressed store of fixed files shared between experiments. When
+FIX_STORE_DIR is set and fix files are copied (SYMLINK_FIX_FILES: false), each
+file is stored once under the SHA-256 hash of its content and materialized in
+the experiment directory as a reflink or hardlink to the stored blob. Each
+experiment records the blobs it uses, so that blobs no longer referenced by any
+existing experiment can be garbage collected:
+
+    python3 fix_store.py gc /path/to/fix_store [--dry-run]
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import threading
+
+from stage_fix_files import place_file
+
+HASH_CHUNK_BYTES = 1 << 24
+
+
+def _atomic_write(path, content):
+    """Writes a file through a temporary file and a rename, so that concurrent
+    readers never see a partially written file"""
+
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp, path)
+
+
+class FixStore:
+    """A content-addressed store of fixed files
+
+    Args:
+        root (str): Directory of the store; created if it does not exist
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.blob_dir = os.path.join(self.root, "blobs")
+        self.ref_dir = os.path.join(self.root, "refs")
+        self.index_fp = os.path.join(self.root, "index.json")
+        os.makedirs(self.blob_dir, exist_ok=True)
+        os.makedirs(self.ref_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._index = {}
+        if os.path.exists(self.index_fp):
+            with open(self.index_fp, encoding="utf-8") as f:
+                self._index = json.load(f)
+        self._index_changed = False
+
+    def blob_path(self, digest):
+        """Path of the blob with the given hash"""
+
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    def digest(self, path):
+        """Hash of the content of a file. Hashes of source files are remembered
+        by path, size, and modification time so that unchanged files are only
+        read once."""
+
+        st = os.stat(path)
+        key = f"{os.path.realpath(path)}|{st.st_size}|{st.st_mtime_ns}"
+        with self._lock:
+            if key in self._index:
+                return self._index[key]
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        with self._lock:
+            self._index[key] = digest
+            self._index_changed = True
+        return digest
+
+    def put(self, path):
+        """Adds a file to the store if its content is not there yet
+
+        Args:
+            path (str): File to add
+        Returns:
+            str: Hash of the file
+        """
+
+        digest = self.digest(path)
+        blob = self.blob_path(digest)
+        if not os.path.exists(blob):
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(blob), prefix=".tmp")
+            os.close(fd)
+            shutil.copyfile(path, tmp)
+            # Blobs are shared by hardlinks, so they must not be edited in place
+            os.chmod(tmp, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            os.replace(tmp, blob)
+        return digest
+
+    def materialize(self, src, dst):
+        """Places a file in an experiment directory from the store
+
+        Args:
+            src (str): Source file, added to the store if needed
+            dst (str): Target path
+        Returns:
+            tuple: The method used (see place_file) and the hash of the file
+        """
+
+        digest = self.put(src)
+        return place_file(self.blob_path(digest), dst, "copy", hardlink=True), digest
+
+    def save_index(self):
+        """Writes the index of known file hashes back to the store"""
+
+        with self._lock:
+            if not self._index_changed:
+                return
+            # Merge with hashes added by other processes in the meantime
+            if os.path.exists(self.index_fp):
+                with open(self.index_fp, encoding="utf-8") as f:
+                    index = json.load(f)
+                index.update(self._index)
+                self._index = index
+            _atomic_write(self.index_fp, json.dumps(self._index, indent=0))
+            self._index_changed = False
+
+    def _ref_fp(self, exptdir):
+        exptdir = os.path.abspath(exptdir)
+        name = hashlib.sha256(exptdir.encode()).hexdigest()[:32]
+        return os.path.join(self.ref_dir, f"{name}.json")
+
+    def add_refs(self, exptdir, digests):
+        """Records that an experiment directory uses the given blobs
+
+        Args:
+            exptdir  (str): The experiment directory
+            digests (list): Hashes of the blobs it uses
+        """
+
+        ref_fp = self._ref_fp(exptdir)
+        ref = {"exptdir": os.path.abspath(exptdir), "blobs": []}
+        if os.path.exists(ref_fp):
+            with open(ref_fp, encoding="utf-8") as f:
+                ref = json.load(f)
+        ref["blobs"] = sorted(set(ref["blobs"]) | set(digests))
+        _atomic_write(ref_fp, json.dumps(ref, indent=1))
+        self.save_index()
+
+    def refs(self):
+        """All experiments that use the store
+
+        Returns:
+            dict mapping each experiment directory to the set of blob hashes it
+            uses
+        """
+
+        refs = {}
+        for fn in sorted(os.listdir(self.ref_dir)):
+            if fn.endswith(".json"):
+                with open(os.path.join(self.ref_dir, fn), encoding="utf-8") as f:
+                    ref = json.load(f)
+                refs[ref["exptdir"]] = set(ref["blobs"])
+        return refs
+
+    def gc(self, dry_run=False):
+        """Removes the references of experiment directories that no longer
+        exist, and then every blob that is not referenced anymore. This should
+        not run while experiments using the store are being generated.
+
+        Args:
+            dry_run (bool): Only report what would be removed
+        Returns:
+            dict with the removed experiments, number of blobs, and bytes freed
+        """
+
+        live = set()
+        removed_expts = []
+        for exptdir, digests in self.refs().items():
+            if os.path.isdir(exptdir):
+                live |= digests
+            else:
+                removed_expts.append(exptdir)
+                if not dry_run:
+                    os.remove(self._ref_fp(exptdir))
+
+        num_blobs = 0
+        freed = 0
+        for subdir in os.listdir(self.blob_dir):
+            for digest in os.listdir(os.path.join(self.blob_dir, subdir)):
+                if digest in live or digest.startswith(".tmp"):
+                    continue
+                blob = self.blob_path(digest)
+                num_blobs += 1
+                freed += os.stat(blob).st_size
+                if not dry_run:
+                    os.remove(blob)
+
+        if not dry_run:
+            # Forget the hashes of files that are not stored anymore
+            with self._lock:
+                self._index = {
+                    k: v for k, v in self._index.items() if v in live
+                }
+                _atomic_write(self.index_fp, json.dumps(self._index, indent=0))
+                self._index_changed = False
+
+        logging.info(
+            f"{'Would remove' if dry_run else 'Removed'} {num_blobs} unreferenced blobs "
+            f"({freed / 2**30:.2f} GiB) and the references of {len(removed_expts)} "
+            f"experiments that no longer exist"
+        )
+        return {"experiments": removed_expts, "blobs": num_blobs, "bytes": freed}
+
+
+def parse_args(argv):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(
+        description="Manage the content-addressed fix file store."
+    )
+    parser.add_argument("action", choices=["gc", "refs"],
+                        help="Garbage collect unreferenced blobs, or list experiments")
+    parser.add_argument("store", help="Directory of the fix store (FIX_STORE_DIR)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Only report what would be removed")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    args = parse_args(sys.argv[1:])
+    store = FixStore(args.store)
+    if args.action == "gc":
+        store.gc(dry_run=args.dry_run)
+    else:
+        for expt, blobs in store.refs().items():
+            status = "" if os.path.isdir(expt) else " (removed)"
+            print(f"{expt}{status}: {len(blobs)} blobs")
@@ -10,6 +10,7 @@ user-defined config.yaml file.
 import argparse
 import logging
 import os
+import shutil
 import sys
 from stat import S_IXUSR
 from string import Template
@@ -35,21 +36,35 @@ from python_utils import (
 
 from setup import setup
 from set_fv3nml_sfc_climo_filenames import set_fv3nml_sfc_climo_filenames
+from set_fv3nml_ens_stoch_seeds import (
+    ENS_STOCH_NML_DIRNAME,
+    MAX_PREGEN_ENS_STOCH_NMLS,
+    write_ens_stoch_nmls,
+)
+from set_cycle_dates import all_cycle_dates
+from template_store import PRERENDER_DIRNAME, prerender_cycle_files
 from get_crontab_contents import add_crontab_line
 from check_python_version import check_python_version
+from rocoto_xml import size_summary, workflow_size
+from wflow_manifest import StagingManifest
+from stage_fix_files import resolve_ops, stage_files
+from fix_store import FixStore
 
 # pylint: disable=too-many-locals,too-many-branches, too-many-statements
 def generate_FV3LAM_wflow(
         ushdir,
         logfile: str = "log.generate_FV3LAM_wflow",
-        debug: bool = False) -> str:
+        debug: bool = False,
+        user_config="config.yaml") -> str:
     """Function to setup a forecast experiment and create a workflow
     (according to the parameters specified in the config file)
 
     Args:
-        ushdir  (str) : The full path of the ush/ directory where this script is located
-        logfile (str) : The name of the file where logging is written
-        debug   (bool): Enable extra output for debugging
+        ushdir      (str) : The full path of the ush/ directory where this script is located
+        logfile     (str) : The name of the file where logging is written
+        debug       (bool): Enable extra output for debugging
+        user_config (str|dict): The user config file, either relative to ushdir or a full
+                            path, or the user config dictionary itself
     Returns:
         EXPTDIR (str) : The full path of the directory where this experiment has been generated
     """
@@ -70,7 +85,21 @@ def generate_FV3LAM_wflow(
 
     # The setup function reads the user configuration file and fills in
     # non-user-specified values from config_defaults.yaml
-    expt_config = setup(ushdir,debug=debug)
+    expt_config = setup(ushdir, user_config, debug=debug)
+
+    #
+    # -----------------------------------------------------------------------
+    #
+    # Record each staging step below in a manifest in the experiment
+    # directory.  When updating a preexisting experiment, steps whose inputs
+    # have not changed since the manifest was written are skipped.
+    #
+    # -----------------------------------------------------------------------
+    #
+    manifest = StagingManifest(
+        expt_config["workflow"]["EXPTDIR"],
+        update=expt_config["workflow"]["PREEXISTING_DIR_METHOD"] == "update",
+    )
 
     #
     # -----------------------------------------------------------------------
@@ -114,11 +143,19 @@ def generate_FV3LAM_wflow(
         # Call the python script to generate the experiment's XML file
         #
         rocoto_yaml_fp = expt_config["workflow"]["ROCOTO_YAML_FP"]
-        render(
-            input_file = template_xml_fp,
-            output_file = wflow_xml_fp,
-            values_src = rocoto_yaml_fp,
-            )
+        xml_inputs = [template_xml_fp, rocoto_yaml_fp]
+        if not manifest.is_current("rocoto_xml", xml_inputs, outputs=[wflow_xml_fp]):
+            render(
+                input_file = template_xml_fp,
+                output_file = wflow_xml_fp,
+                values_src = rocoto_yaml_fp,
+                )
+            manifest.record("rocoto_xml", xml_inputs, outputs=[wflow_xml_fp])
+        log_info(
+            f"""
+            Size of the rocoto workflow XML file:
+              {size_summary(workflow_size(wflow_xml_fp))}"""
+        )
     #
     # -----------------------------------------------------------------------
     #
@@ -179,9 +216,27 @@ def generate_FV3LAM_wflow(
                          exptdir=exptdir,debug=debug)
 
     #
-    # Copy or symlink fix files
-    #
-    if SYMLINK_FIX_FILES:
+    # Copy or symlink fix files.  Copies are taken from the shared fix store,
+    # if there is one.
+    #
+    fix_store = None
+    if FIX_STORE_DIR and not SYMLINK_FIX_FILES:
+        fix_store = FixStore(FIX_STORE_DIR)
+    fix_store_digests = []
+    fixam_settings = {"SYMLINK_FIX_FILES": SYMLINK_FIX_FILES, "FIXgsm": FIXgsm}
+    fixam_inputs = []
+    fixam_outputs = [FIXam]
+    if not SYMLINK_FIX_FILES:
+        fixam_inputs = [os.path.join(FIXgsm, fn) for fn in FIXgsm_FILES_TO_COPY_TO_FIXam]
+        fixam_outputs += [os.path.join(FIXam, fn) for fn in FIXgsm_FILES_TO_COPY_TO_FIXam]
+    if manifest.is_current("fix_am", fixam_inputs, fixam_settings, fixam_outputs):
+        log_info(
+            f"""
+            Fixed files in FIXam are up to date:
+              FIXam = '{FIXam}'""",
+            verbose=debug,
+        )
+    elif SYMLINK_FIX_FILES:
         log_info(
             f"""
             Symlinking fixed files from system directory (FIXgsm) to a subdirectory (FIXam):
@@ -205,10 +260,16 @@ def generate_FV3LAM_wflow(
         mkdir_vrfy("-p", FIXam)
         mkdir_vrfy("-p", os.path.join(FIXam, "fix_co2_proj"))
 
-        num_files = len(FIXgsm_FILES_TO_COPY_TO_FIXam)
-        for i in range(num_files):
-            fn = f"{FIXgsm_FILES_TO_COPY_TO_FIXam[i]}"
-            cp_vrfy(os.path.join(FIXgsm, fn), os.path.join(FIXam, fn))
+        stats = stage_files(
+            resolve_ops([
+                (os.path.join(FIXgsm, fn), os.path.join(FIXam, fn))
+                for fn in FIXgsm_FILES_TO_COPY_TO_FIXam
+            ]),
+            group="FIXam",
+            store=fix_store,
+        )
+        fix_store_digests += stats["digests"]
+    manifest.record("fix_am", fixam_inputs, fixam_settings, fixam_outputs)
     #
     # -----------------------------------------------------------------------
     #
@@ -216,7 +277,13 @@ def generate_FV3LAM_wflow(
     #
     # -----------------------------------------------------------------------
     #
-    if USE_MERRA_CLIMO:
+    fixclim_inputs = [
+        os.path.join(FIXaer, "merra2.aerclim*.nc"),
+        os.path.join(FIXlut, "optics*.dat"),
+    ]
+    fixclim_settings = {"SYMLINK_FIX_FILES": SYMLINK_FIX_FILES}
+    if USE_MERRA_CLIMO and \
+            not manifest.is_current("fix_clim", fixclim_inputs, fixclim_settings, [FIXclim]):
         log_info(
             f"""
             Copying MERRA2 aerosol climatology data files from system directory
@@ -230,12 +297,18 @@ def generate_FV3LAM_wflow(
         check_for_preexist_dir_file(FIXclim, "delete")
         mkdir_vrfy("-p", FIXclim)
 
-        if SYMLINK_FIX_FILES:
-            ln_vrfy("-fsn", os.path.join(FIXaer, "merra2.aerclim*.nc"), FIXclim)
-            ln_vrfy("-fsn", os.path.join(FIXlut, "optics*.dat"), FIXclim)
-        else:
-            cp_vrfy(os.path.join(FIXaer, "merra2.aerclim*.nc"), FIXclim)
-            cp_vrfy(os.path.join(FIXlut, "optics*.dat"), FIXclim)
+        stats = stage_files(
+            resolve_ops(
+                [(pattern, FIXclim) for pattern in fixclim_inputs],
+                mode="link" if SYMLINK_FIX_FILES else "copy",
+            ),
+            group="FIXclim",
+            store=fix_store,
+        )
+        fix_store_digests += stats["digests"]
+        manifest.record("fix_clim", fixclim_inputs, fixclim_settings, [FIXclim])
+    if fix_store and fix_store_digests:
+        fix_store.add_refs(EXPTDIR, fix_store_digests)
     #
     # -----------------------------------------------------------------------
     #
@@ -254,14 +327,18 @@ def generate_FV3LAM_wflow(
         Copying the template data table file to the experiment directory...""",
         verbose=debug,
     )
-    cp_vrfy(DATA_TABLE_TMPL_FP, DATA_TABLE_FP)
+    if not manifest.is_current("data_table", [DATA_TABLE_TMPL_FP], outputs=[DATA_TABLE_FP]):
+        cp_vrfy(DATA_TABLE_TMPL_FP, DATA_TABLE_FP)
+        manifest.record("data_table", [DATA_TABLE_TMPL_FP], outputs=[DATA_TABLE_FP])
 
     log_info(
         """
         Copying the template field table file to the experiment directory...""",
         verbose=debug,
     )
-    cp_vrfy(FIELD_TABLE_TMPL_FP, FIELD_TABLE_FP)
+    if not manifest.is_current("field_table", [FIELD_TABLE_TMPL_FP], outputs=[FIELD_TABLE_FP]):
+        cp_vrfy(FIELD_TABLE_TMPL_FP, FIELD_TABLE_FP)
+        manifest.record("field_table", [FIELD_TABLE_TMPL_FP], outputs=[FIELD_TABLE_FP])
 
     #
     # Copy the CCPP physics suite definition file from its location in the
@@ -274,7 +351,11 @@ def generate_FV3LAM_wflow(
         the forecast model directory structure to the experiment directory...""",
         verbose=debug,
     )
-    cp_vrfy(CCPP_PHYS_SUITE_IN_CCPP_FP, CCPP_PHYS_SUITE_FP)
+    if not manifest.is_current("ccpp_phys_suite", [CCPP_PHYS_SUITE_IN_CCPP_FP],
+                               outputs=[CCPP_PHYS_SUITE_FP]):
+        cp_vrfy(CCPP_PHYS_SUITE_IN_CCPP_FP, CCPP_PHYS_SUITE_FP)
+        manifest.record("ccpp_phys_suite", [CCPP_PHYS_SUITE_IN_CCPP_FP],
+                        outputs=[CCPP_PHYS_SUITE_FP])
     #
     # Copy the field dictionary file from its location in the
     # clone of the FV3 code repository to the experiment directory (EXPT-
@@ -287,7 +368,9 @@ def generate_FV3LAM_wflow(
         directory...""",
         verbose=debug,
     )
-    cp_vrfy(FIELD_DICT_IN_UWM_FP, FIELD_DICT_FP)
+    if not manifest.is_current("field_dict", [FIELD_DICT_IN_UWM_FP], outputs=[FIELD_DICT_FP]):
+        cp_vrfy(FIELD_DICT_IN_UWM_FP, FIELD_DICT_FP)
+        manifest.record("field_dict", [FIELD_DICT_IN_UWM_FP], outputs=[FIELD_DICT_FP])
     #
     # -----------------------------------------------------------------------
     #
@@ -510,18 +593,36 @@ def generate_FV3LAM_wflow(
     # -----------------------------------------------------------------------
     #
 
-    physics_cfg = get_yaml_config(FV3_NML_YAML_CONFIG_FP)
-    base_namelist = get_nml_config(FV3_NML_BASE_SUITE_FP)
-    base_namelist.update_values(physics_cfg[CCPP_PHYS_SUITE])
-    base_namelist.update_values(settings)
-    for sect, values in base_namelist.copy().items():
-        if not values:
-            del base_namelist[sect]
-            continue
-        for k, v in values.copy().items():
-            if v is None:
-                del base_namelist[sect][k]
-    base_namelist.dump(FV3_NML_FP)
+    run_make_grid = bool(expt_config['rocoto']['tasks'].get('task_make_grid'))
+    nml_inputs = [
+        FV3_NML_YAML_CONFIG_FP,
+        FV3_NML_BASE_SUITE_FP,
+        os.path.join(PARMdir, "fixed_files_mapping.yaml"),
+    ]
+    nml_settings = {
+        "settings": settings,
+        "CCPP_PHYS_SUITE": CCPP_PHYS_SUITE,
+        "run_make_grid": run_make_grid,
+        "CRES": expt_config["workflow"].get("CRES"),
+        "FIXlam": FIXlam,
+        "DO_ENSEMBLE": DO_ENSEMBLE,
+        "RUN_ENVIR": RUN_ENVIR,
+    }
+    nml_is_current = manifest.is_current("fv3_nml", nml_inputs, nml_settings, [FV3_NML_FP])
+
+    if not nml_is_current:
+        physics_cfg = get_yaml_config(FV3_NML_YAML_CONFIG_FP)
+        base_namelist = get_nml_config(FV3_NML_BASE_SUITE_FP)
+        base_namelist.update_values(physics_cfg[CCPP_PHYS_SUITE])
+        base_namelist.update_values(settings)
+        for sect, values in base_namelist.copy().items():
+            if not values:
+                del base_namelist[sect]
+                continue
+            for k, v in values.copy().items():
+                if v is None:
+                    del base_namelist[sect][k]
+        base_namelist.dump(FV3_NML_FP)
     #
     # If not running the TN_MAKE_GRID task (which implies the workflow will
     # use pregenerated grid files), set the namelist variables specifying
@@ -534,9 +635,12 @@ def generate_FV3LAM_wflow(
     # the C-resolution of the grid), and this parameter is in most workflow
     # configurations is not known until the grid is created.
     #
-    if not expt_config['rocoto']['tasks'].get('task_make_grid'):
+    if not nml_is_current:
+        if not run_make_grid:
+
+            set_fv3nml_sfc_climo_filenames(flatten_dict(expt_config), debug)
 
-        set_fv3nml_sfc_climo_filenames(flatten_dict(expt_config), debug)
+        manifest.record("fv3_nml", nml_inputs, nml_settings, [FV3_NML_FP])
 
     #
     # -----------------------------------------------------------------------
@@ -649,7 +753,8 @@ def generate_FV3LAM_wflow(
     #
     #-----------------------------------------------------------------------
     #
-    if any((DO_SPP, DO_SPPT, DO_SHUM, DO_SKEB, DO_LSM_SPP)):
+    if any((DO_SPP, DO_SPPT, DO_SHUM, DO_SKEB, DO_LSM_SPP)) and \
+            not manifest.is_current("fv3_nml_stoch", [FV3_NML_FP], settings, [FV3_NML_STOCH_FP]):
         realize(
             input_config=FV3_NML_FP,
             input_format="nml",
@@ -657,6 +762,52 @@ def generate_FV3LAM_wflow(
             output_format="nml",
             update_config=get_nml_config(settings),
             )
+        manifest.record("fv3_nml_stoch", [FV3_NML_FP], settings, [FV3_NML_STOCH_FP])
+
+    #
+    # For ensembles, write the namelists of all members from a single parse of
+    # the stochastic namelist, so that the forecast tasks only need to copy
+    # them instead of each setting its own seeds.  The forecast tasks copy
+    # any namelist found there, so the namelists of an earlier generation
+    # are removed when they are not written.
+    #
+    ens_nml_dir = os.path.join(EXPTDIR, ENS_STOCH_NML_DIRNAME)
+    pregen_ens_nmls = False
+    if any((DO_SPP, DO_SPPT, DO_SHUM, DO_SKEB, DO_LSM_SPP)) and DO_ENSEMBLE:
+        cycles = all_cycle_dates(expt_config)
+        ens_nml_settings = {"cycles": cycles, "global": expt_config["global"]}
+        if len(cycles) * NUM_ENS_MEMBERS > MAX_PREGEN_ENS_STOCH_NMLS:
+            logging.info(
+                f"Not pregenerating {len(cycles) * NUM_ENS_MEMBERS} ensemble "
+                f"namelists; the forecast tasks will set their seeds"
+            )
+        else:
+            pregen_ens_nmls = True
+            if not manifest.is_current("fv3_nml_ens_stoch", [FV3_NML_STOCH_FP],
+                                       ens_nml_settings, [ens_nml_dir]):
+                write_ens_stoch_nmls(cycles, expt_config, ens_nml_dir)
+                manifest.record("fv3_nml_ens_stoch", [FV3_NML_STOCH_FP],
+                                ens_nml_settings, [ens_nml_dir])
+    if not pregen_ens_nmls:
+        shutil.rmtree(ens_nml_dir, ignore_errors=True)
+
+    #
+    # Render the run directory files that depend only on the configuration
+    # and the cycle for all cycles, so that the forecast tasks can copy them
+    #
+    prerender_inputs = [DIAG_TABLE_TMPL_FP, UFS_CONFIG_TMPL_FP]
+    prerender_settings = {
+        "cycles": all_cycle_dates(expt_config),
+        "CRES": expt_config["workflow"].get("CRES"),
+        "DT_ATMOS": DT_ATMOS,
+        "PRINT_ESMF": PRINT_ESMF,
+        "CPL_AQM": CPL_AQM,
+    }
+    prerender_dir = os.path.join(EXPTDIR, PRERENDER_DIRNAME)
+    if not manifest.is_current("prerender", prerender_inputs, prerender_settings,
+                               [prerender_dir]):
+        prerender_cycle_files(expt_config, prerender_settings["cycles"])
+        manifest.record("prerender", prerender_inputs, prerender_settings, [prerender_dir])
 
     #
     # -----------------------------------------------------------------------
@@ -667,7 +818,11 @@ def generate_FV3LAM_wflow(
     #
     # -----------------------------------------------------------------------
     #
-    cp_vrfy(os.path.join(ushdir, EXPT_CONFIG_FN), EXPTDIR)
+    if isinstance(user_config, dict):
+        with open(os.path.join(EXPTDIR, EXPT_CONFIG_FN), "w", encoding="utf-8") as cfg_file:
+            cfg_file.write(cfg_to_yaml_str(user_config))
+    else:
+        cp_vrfy(os.path.join(ushdir, user_config), os.path.join(EXPTDIR, EXPT_CONFIG_FN))
 
     #
     # -----------------------------------------------------------------------
@@ -717,6 +872,14 @@ def generate_FV3LAM_wflow(
         )
         # pylint: enable=line-too-long
 
+    if manifest.skipped:
+        log_info(
+            f"""
+            The following staging steps were already up to date in the experiment
+            directory and have been skipped:
+              {", ".join(manifest.skipped)}"""
+        )
+
     # If we got to this point everything was successful: move the log
     # file to the experiment directory.
     mv_vrfy(logfile, EXPTDIR)
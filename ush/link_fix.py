@@ -4,24 +4,88 @@ import os
 import sys
 import argparse
 import re
-import glob
+import uuid
 
 from python_utils import (
     import_vars,
     print_input_args,
     print_info_msg,
     print_err_msg_exit,
-    create_symlink_to_file,
     define_macos_utilities,
     check_var_valid_value,
     flatten_dict,
-    cd_vrfy,
     mkdir_vrfy,
-    find_pattern_in_str,
     load_yaml_config,
 )
 
 
+# Names of grid, orography and surface climatology fix files, e.g.
+#   C3357_grid.tile7.halo4.nc, C3357_mosaic.halo4.nc,
+#   C3357_oro_data_ls.tile7.halo0.nc, C3357.vegetation_type.tile7.halo4.nc
+# The resolution may also be the "*" of a globbing pattern.
+FIX_FN_REGEX = re.compile(
+    r"^C(?P<res>[0-9]+|\*)(?P<sep>[._])(?P<field>.+?)"
+    r"(?:\.tile(?P<tile>[0-9]+))?\.halo(?P<halo>[0-9]+)\.nc$"
+)
+
+
+def fix_file_key(fn):
+    """Returns the (separator, field, tile, halo) key of a fix file name or
+    globbing pattern, or None if the name is not that of a fix file"""
+
+    match = FIX_FN_REGEX.match(fn)
+    if not match:
+        return None
+    return match.group("sep", "field", "tile", "halo")
+
+
+def index_fix_files(source_dir):
+    """Indexes the fix files in a directory with a single scan
+
+    Args:
+        source_dir: directory containing grid, orography, and/or surface
+                    climatology files
+    Returns:
+        dict mapping the key of each file (see fix_file_key) to a dict from
+        resolution to the full path of the file
+    """
+
+    index = {}
+    with os.scandir(source_dir) as entries:
+        for entry in entries:
+            match = FIX_FN_REGEX.match(entry.name)
+            if match and match.group("res") != "*":
+                key = match.group("sep", "field", "tile", "halo")
+                index.setdefault(key, {})[match.group("res")] = entry.path
+    return index
+
+
+def symlink_atomic(target, symlink):
+    """Creates or replaces a symbolic link without a window in which the link
+    is missing, by renaming a temporary link into place.
+
+    Args:
+        target: target of the link, relative to the directory of the link
+                if it is not an absolute path
+        symlink: path of the link
+    Returns:
+        None
+    """
+
+    if not os.path.exists(os.path.join(os.path.dirname(symlink), target)):
+        print_err_msg_exit(
+            f"""
+            Cannot create symlink to specified target file because the latter does
+            not exist or is not a file:
+                target = '{target}'"""
+        )
+    # A unique name, so that a temporary link left behind by an interrupted
+    # run, or being created by another process, is never in the way
+    tmp = f"{symlink}.tmp{uuid.uuid4().hex}"
+    os.symlink(target, tmp)
+    os.replace(tmp, symlink)
+
+
 def link_fix(
     verbose,
     file_group,
@@ -224,49 +288,30 @@ def link_fix(
             fns.append(f"C*.{sfc_climo_field}.tile{tile_rgnl}.halo{nh0}.nc")
             fns.append(f"C*.{sfc_climo_field}.tile{tile_rgnl}.halo{nh4}.nc")
 
-    fps = [os.path.join(source_dir, itm) for itm in fns]
     #
     # -----------------------------------------------------------------------
     #
-    # Find all files matching the globbing patterns and make sure that they
-    # all have the same resolution (an integer) in their names.
+    # Index the fix files in source_dir in a single pass, and look up the
+    # files matching each globbing pattern in that index.  Make sure that
+    # they all have the same resolution (an integer) in their names.
     #
     # -----------------------------------------------------------------------
     #
-    i = 0
-    res_prev = ""
+    index = index_fix_files(source_dir)
+
     res = ""
     fp_prev = ""
-
-    for pattern in fps:
-        files = glob.glob(pattern)
+    for fn_pattern in fns:
+        files = index.get(fix_file_key(fn_pattern), {})
         if not files:
             print_err_msg_exit(
                 f"""
                 Trying to link files in group: {file_group} 
-                No files were found matching the pattern {pattern}.
+                No files were found matching the pattern {os.path.join(source_dir, fn_pattern)}.
                 """
             )
-        for fp in files:
-
-            fn = os.path.basename(fp)
-
-            regex_search = "^C([0-9]*).*"
-            res = find_pattern_in_str(regex_search, fn)
-            if not res:
-                print_err_msg_exit(
-                    f"""
-                    The resolution could not be extracted from the current file's name.  The
-                    full path to the file (fp) is:
-                      fp = '{fp}'
-                    This may be because fp contains the * globbing character, which would
-                    imply that no files were found that match the globbing pattern specified
-                    in fp."""
-                )
-            else:
-                res = res[0]
-
-            if (i > 0) and (res != res_prev):
+        for res_fn, fp in sorted(files.items()):
+            if res and res_fn != res:
                 print_err_msg_exit(
                     f"""
                     The resolutions (as obtained from the file names) of the previous and
@@ -275,36 +320,22 @@ def link_fix(
                       fp      = '{fp}'
                     Please ensure that all files have the same resolution."""
                 )
-
-            i = i + 1
-            fp_prev = f"{fp}"
-            res_prev = res
+            res = res_fn
+            fp_prev = fp
     #
     # -----------------------------------------------------------------------
     #
     # Replace the * globbing character in the set of globbing patterns with
-    # the resolution.  This will result in a set of (full paths to) specific
-    # files.
-    #
-    # -----------------------------------------------------------------------
-    #
-    fps = [itm.replace("*", res) for itm in fps]
-    #
-    # -----------------------------------------------------------------------
-    #
-    # In creating the various symlinks below, it is convenient to work in
-    # the FIXlam directory.  We will change directory back to the original
-    # later below.
+    # the resolution.  This will result in a set of specific file names.
     #
     # -----------------------------------------------------------------------
     #
-    save_dir = os.getcwd()
-    cd_vrfy(target_dir)
+    fns = [itm.replace("*", res) for itm in fns]
     #
     # -----------------------------------------------------------------------
     #
-    # Use the set of full file paths generated above as the link targets to
-    # create symlinks to these files in the target directory.
+    # Use the set of file names generated above to create symlinks in the
+    # target directory to the corresponding files in the source directory.
     #
     # -----------------------------------------------------------------------
     #
@@ -318,9 +349,12 @@ def link_fix(
     if run_task:
         relative_link_flag = True
 
-    for fp in fps:
-        fn = os.path.basename(fp)
-        create_symlink_to_file(fp, fn, relative_link_flag)
+    links = []
+    for fn in fns:
+        fp = os.path.abspath(os.path.join(source_dir, fn))
+        if relative_link_flag and os.getenv("RELATIVE_LINK_FLAG"):
+            fp = os.path.relpath(fp, os.path.abspath(target_dir))
+        links.append((fp, fn))
     #
     # -----------------------------------------------------------------------
     #
@@ -343,7 +377,7 @@ def link_fix(
     if file_group == "grid":
         target = f"{cres}{dot_or_uscore}grid.tile{tile_rgnl}.halo{nh4}.nc"
         symlink = f"{cres}{dot_or_uscore}grid.tile{tile_rgnl}.nc"
-        create_symlink_to_file(target, symlink, True)
+        links.append((target, symlink))
     #
     # -----------------------------------------------------------------------
     #
@@ -363,15 +397,15 @@ def link_fix(
             # Create links without "halo" in the name
             halo = f"{cres}.{field}.tile{tile_rgnl}.halo{nh4}.nc"
             no_halo = re.sub(f".halo{nh4}", "", halo)
-            create_symlink_to_file(halo, no_halo, True)
+            links.append((halo, no_halo))
 
             # Create links without halo and tile7, and with "tile1"
             halo_tile = f"{cres}.{field}.tile{tile_rgnl}.halo{nh0}.nc"
             no_halo_tile = re.sub(f"tile{tile_rgnl}.halo{nh0}", "tile1", halo_tile)
-            create_symlink_to_file(halo_tile, no_halo_tile, True)
+            links.append((halo_tile, no_halo_tile))
 
-    # Change directory back to original one.
-    cd_vrfy(save_dir)
+    for target, symlink in links:
+        symlink_atomic(target, os.path.join(target_dir, symlink))
 
     return res
 
@@ -0,0 +1,648 @@
+#!/usr/bin/env python3
+
+"""
+A batch system for running rocoto workflows on a single Linux (or macOS)
+machine, standing in for slurm.
+
+Jobs submitted with sbatch are queued in a SQLite job table and started by a
+daemon, which runs as many of them at a time as fit in a number of cores
+(LOCAL_BATCH_CORES, by default all cores of the machine), first come first
+served with backfilling, and ends those that exceed their walltime. The
+daemon is started by sbatch when it is not running and exits after it has
+been idle for a while.
+
+The sbatch, squeue, sacct and scancel commands in ush/rocoto_fake_slurm call
+this script, with the same options and output as the slurm commands rocoto
+uses, so rocoto can submit jobs to it with <scheduler>slurm</scheduler>:
+
+    python3 local_batch.py sbatch < job.sh
+    python3 local_batch.py squeue [--jobs=ID,...]
+    python3 local_batch.py sacct [--jobs=ID,...]
+    python3 local_batch.py scancel ID [ID ...]
+    python3 local_batch.py daemon [--cores N]
+
+The job table and the daemon's files are kept in LOCAL_BATCH_DIR (by default
+~/.srw_local_batch), shared by all experiments of a user.
+"""
+
+import argparse
+import fcntl
+import getpass
+import json
+import logging
+import os
+import select
+import shlex
+import signal
+import sqlite3
+import subprocess
+import sys
+import time
+from contextlib import closing
+from datetime import datetime, timezone
+
+DEFAULT_STATE_DIR = os.environ.get(
+    "LOCAL_BATCH_DIR",
+    os.path.join(os.path.expanduser("~"), ".srw_local_batch"),
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT,
+    user TEXT,
+    cores INTEGER,
+    walltime REAL,
+    script TEXT,
+    workdir TEXT,
+    environment TEXT,
+    output TEXT,
+    error TEXT,
+    state TEXT,
+    pid INTEGER,
+    exit_code INTEGER,
+    cancelled INTEGER DEFAULT 0,
+    submitted REAL,
+    started REAL,
+    ended REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state);
+"""
+
+# Seconds between checks of the job table when nothing wakes the daemon up
+POLL_INTERVAL = 5
+# The daemon exits after this many seconds without jobs
+IDLE_EXIT = 600
+# Seconds between SIGTERM and SIGKILL for jobs that exceed their walltime
+KILL_GRACE = 30
+# Finished jobs are listed by squeue for this many seconds, as with slurm's
+# MinJobAge, and removed from the job table after PURGE_AGE seconds
+SQUEUE_MIN_AGE = 300
+PURGE_AGE = 7 * 86400
+
+TIME_FORMAT = "%Y-%m-%d:%H:%M:%S"
+
+
+def default_cores():
+    """Number of cores jobs may use: LOCAL_BATCH_CORES, or all cores this
+    process may run on"""
+    if os.environ.get("LOCAL_BATCH_CORES"):
+        return int(os.environ["LOCAL_BATCH_CORES"])
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def slurm_time(text):
+    """A slurm time limit ("MM", "MM:SS", "HH:MM:SS", "D-HH", "D-HH:MM" or
+    "D-HH:MM:SS") in seconds; None for no limit"""
+    if text in ("", "UNLIMITED", "INFINITE", "-1"):
+        return None
+    days, _, rest = text.rpartition("-")
+    parts = [int(part) for part in rest.split(":")]
+    if days:
+        hours, minutes, seconds = (parts + [0, 0])[:3]
+    elif len(parts) == 3:
+        hours, minutes, seconds = parts
+    else:
+        hours, (minutes, seconds) = 0, (parts + [0])[:2]
+    return ((int(days or 0) * 24 + hours) * 60 + minutes) * 60 + seconds
+
+
+def parse_job_options(script, argv=()):
+    """Reads the options of a job from the #SBATCH lines of its script and
+    the sbatch command line, which takes precedence
+
+    Args:
+        script (str): The job script
+        argv  (list): Options given to sbatch
+    Returns:
+        dict with the "name", "cores", "walltime" (in seconds, None for no
+        limit), "output" and "error" of the job
+    """
+    lines = [shlex.split(line[len("#SBATCH"):]) for line in script.splitlines()
+             if line.startswith("#SBATCH")]
+    opts = {}
+    # Each component of a heterogeneous job, separated by "hetjob" (or
+    # "packjob" in older slurm) lines, has its own nodes and tasks
+    components = [{}]
+    for tokens in lines + [list(argv)]:
+        if tokens in (["hetjob"], ["packjob"]):
+            components.append({})
+            continue
+        i = 0
+        while i < len(tokens):
+            token = tokens[i]
+            if token.startswith("--") and "=" in token:
+                key, value = token.split("=", 1)
+            elif token.startswith("-") and i + 1 < len(tokens):
+                key, value = token, tokens[i + 1]
+                i += 1
+            else:
+                i += 1
+                continue
+            i += 1
+            key = {"-J": "--job-name", "-o": "--output", "-e": "--error", "-t": "--time",
+                   "-n": "--ntasks", "-N": "--nodes", "-c": "--cpus-per-task",
+                   "--tasks-per-node": "--ntasks-per-node"}.get(key, key)
+            if key in ("--ntasks", "--nodes", "--ntasks-per-node", "--cpus-per-task"):
+                components[-1][key] = int(value.split("-")[0])
+            else:
+                opts[key] = value
+
+    cores = 0
+    for component in components:
+        tasks = component.get("--ntasks")
+        if tasks is None:
+            tasks = component.get("--nodes", 1) * component.get("--ntasks-per-node", 1)
+        cores += tasks * component.get("--cpus-per-task", 1)
+    return {
+        "name": opts.get("--job-name", "default"),
+        "cores": max(cores, 1),
+        "walltime": slurm_time(opts["--time"]) if "--time" in opts else None,
+        "output": opts.get("--output"),
+        "error": opts.get("--error"),
+    }
+
+
+def format_time(timestamp):
+    """A time as printed by squeue and sacct"""
+    if timestamp is None:
+        return "N/A"
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime(TIME_FORMAT)
+
+
+def job_path(pattern, job):
+    """The path of the output or error file of a job, with slurm's %j, %x
+    and %u replaced"""
+    if not pattern:
+        return None
+    subs = {"j": str(job["id"]), "x": job["name"], "u": job["user"], "%": "%"}
+    path, i = "", 0
+    while i < len(pattern):
+        if pattern[i] == "%" and i + 1 < len(pattern) and pattern[i + 1] in subs:
+            path += subs[pattern[i + 1]]
+            i += 2
+        else:
+            path += pattern[i]
+            i += 1
+    return os.path.join(job["workdir"], path)
+
+
+class LocalBatch:
+    """The job table of the local batch system"""
+
+    def __init__(self, state_dir=DEFAULT_STATE_DIR):
+        os.makedirs(state_dir, exist_ok=True)
+        self.state_dir = state_dir
+        self.connection = sqlite3.connect(os.path.join(state_dir, "jobs.db"), timeout=60)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        """Closes the job table"""
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def submit(self, script, argv=(), workdir=None, environment=None):
+        """Queues a job
+
+        Args:
+            script       (str): The job script
+            argv        (list): Options given to sbatch
+            workdir      (str): Directory the job runs in; the current one
+                                by default
+            environment (dict): Environment of the job; the current one by
+                                default
+        Returns:
+            int: The job id
+        """
+        opts = parse_job_options(script, argv)
+        with self.connection:
+            cur = self.connection.execute(
+                "INSERT INTO jobs (name, user, cores, walltime, script, workdir, environment, "
+                "output, error, state, submitted) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (opts["name"], getpass.getuser(), opts["cores"], opts["walltime"], script,
+                 workdir or os.getcwd(), json.dumps(dict(environment or os.environ)),
+                 opts["output"], opts["error"], "PENDING", time.time()))
+        return cur.lastrowid
+
+    def jobs(self, ids=None, since=None):
+        """The jobs with the given ids, or the jobs that are pending, running,
+        or ended after the time since"""
+        columns = ("id, name, user, cores, walltime, state, pid, exit_code, cancelled, "
+                   "submitted, started, ended")
+        if ids is not None:
+            ids = list(ids)
+            query = (f"SELECT {columns} FROM jobs WHERE id IN "
+                     f"({', '.join('?' * len(ids))}) ORDER BY id")
+            params = ids
+        else:
+            query = (f"SELECT {columns} FROM jobs WHERE state IN ('PENDING', 'RUNNING') "
+                     "OR ended >= ? ORDER BY id")
+            params = [since or 0]
+        with closing(self.connection.execute(query, params)) as cur:
+            return [dict(row) for row in cur]
+
+    def cancel(self, ids):
+        """Cancels jobs: pending jobs are not started, running ones are
+        killed"""
+        for job_id in ids:
+            with self.connection:
+                self.connection.execute(
+                    "UPDATE jobs SET state = 'CANCELLED', cancelled = 1, ended = ? "
+                    "WHERE id = ? AND state = 'PENDING'", (time.time(), job_id))
+                row = self.connection.execute(
+                    "SELECT pid FROM jobs WHERE id = ? AND state = 'RUNNING'",
+                    (job_id,)).fetchone()
+                if row is None:
+                    continue
+                self.connection.execute("UPDATE jobs SET cancelled = 1 WHERE id = ?", (job_id,))
+            try:
+                os.killpg(row["pid"], signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+
+    def daemon_running(self):
+        """Whether a daemon is running for this job table"""
+        with open(os.path.join(self.state_dir, "daemon.lock"), "a", encoding="utf-8") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return True
+            fcntl.flock(lock, fcntl.LOCK_UN)
+        return False
+
+    def wake_daemon(self):
+        """Starts the daemon, or makes the running one check the job table"""
+        if not self.daemon_running():
+            with open(os.path.join(self.state_dir, "daemon.log"), "a",
+                      encoding="utf-8") as log:
+                subprocess.Popen(  # pylint: disable=consider-using-with
+                    [sys.executable, os.path.abspath(__file__), "daemon",
+                     "--state-dir", self.state_dir],
+                    stdin=subprocess.DEVNULL, stdout=log, stderr=log,
+                    start_new_session=True)
+            return
+        try:
+            with open(os.path.join(self.state_dir, "daemon.pid"), encoding="utf-8") as f:
+                os.kill(int(f.read()), signal.SIGUSR1)
+        except (OSError, ValueError):
+            pass
+
+
+class Executor:
+    """Runs the jobs of a job table on the cores of this machine
+
+    Args:
+        batch (LocalBatch): The job table
+        cores        (int): Number of cores jobs may use at a time
+    """
+
+    def __init__(self, batch, cores=None):
+        self.batch = batch
+        self.cores = cores or default_cores()
+        # Per running job id: its process and job row
+        self.running = {}
+        self._lock = None
+        self._purged = 0
+
+    def run(self, idle_exit=IDLE_EXIT, poll_interval=POLL_INTERVAL):
+        """Runs jobs until there have been none for idle_exit seconds
+
+        Returns:
+            bool: False if another daemon is running for the job table
+        """
+        if not self._acquire_lock():
+            return False
+        wakeup_r, wakeup_w = os.pipe()
+        os.set_blocking(wakeup_r, False)
+        os.set_blocking(wakeup_w, False)
+        stop = []
+        handlers = {
+            signal.SIGCHLD: lambda *_: None,
+            signal.SIGUSR1: lambda *_: None,
+            signal.SIGTERM: lambda *_: stop.append(True),
+        }
+        previous = {sig: signal.signal(sig, handler) for sig, handler in handlers.items()}
+        previous_fd = signal.set_wakeup_fd(wakeup_w)
+        try:
+            self._fail_orphans()
+            idle_since = time.time()
+            while not stop:
+                self.reap()
+                self.enforce_walltimes()
+                self.launch()
+                self.purge()
+                if self.running or self._pending():
+                    idle_since = time.time()
+                elif time.time() - idle_since >= idle_exit:
+                    # Release the lock before the last look at the job table,
+                    # so a job submitted meanwhile either is seen here or
+                    # starts a new daemon
+                    self._release_lock()
+                    if not self._pending() or not self._acquire_lock():
+                        break
+                    continue
+                select.select([wakeup_r], [], [], poll_interval)
+                try:
+                    while os.read(wakeup_r, 512):
+                        pass
+                except BlockingIOError:
+                    pass
+            for job_id, (proc, _) in self.running.items():
+                _kill(proc.pid, signal.SIGKILL)
+                with self.batch.connection:
+                    self.batch.connection.execute(
+                        "UPDATE jobs SET cancelled = 1 WHERE id = ?", (job_id,))
+            self.reap(wait=True)
+        finally:
+            signal.set_wakeup_fd(previous_fd)
+            for sig, handler in previous.items():
+                signal.signal(sig, handler)
+            os.close(wakeup_r)
+            os.close(wakeup_w)
+            self._release_lock()
+        return True
+
+    def _acquire_lock(self):
+        lock = open(os.path.join(self.batch.state_dir, "daemon.lock"), "a",  # pylint: disable=consider-using-with
+                    encoding="utf-8")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            return False
+        self._lock = lock
+        with open(os.path.join(self.batch.state_dir, "daemon.pid"), "w", encoding="utf-8") as f:
+            f.write(str(os.getpid()))
+        return True
+
+    def _release_lock(self):
+        if self._lock is not None:
+            self._lock.close()
+            self._lock = None
+
+    def _pending(self):
+        return self.batch.connection.execute(
+            "SELECT count(*) FROM jobs WHERE state = 'PENDING'").fetchone()[0]
+
+    def _fail_orphans(self):
+        """Jobs left running by a daemon that stopped can no longer be
+        followed; they are killed and reported as failed"""
+        with self.batch.connection:
+            for row in self.batch.connection.execute(
+                    "SELECT id, pid FROM jobs WHERE state = 'RUNNING'").fetchall():
+                _kill(row["pid"], signal.SIGKILL)
+                self.batch.connection.execute(
+                    "UPDATE jobs SET state = 'NODE_FAIL', ended = ? WHERE id = ?",
+                    (time.time(), row["id"]))
+
+    def launch(self):
+        """Starts the pending jobs that fit in the free cores, in the order
+        they were submitted; a later job is started ahead of one that does
+        not fit (backfilled) only if it ends before that one can start"""
+        now = time.time()
+        free = self.cores - sum(self._cores(job) for _, job in self.running.values())
+        # When the first job that does not fit can start, from the walltimes
+        # of the running jobs, and the cores left over for backfilled jobs
+        # that run beyond it
+        reserved_start, spare = None, None
+        pending = self.batch.connection.execute(
+            "SELECT * FROM jobs WHERE state = 'PENDING' ORDER BY id").fetchall()
+        for row in pending:
+            job = dict(row)
+            cores = self._cores(job)
+            if reserved_start is None:
+                if cores <= free:
+                    free -= self.start(job)
+                    continue
+                reserved_start, spare = self._reservation(cores, free, now)
+                continue
+            if cores > free:
+                continue
+            ends = now + job["walltime"] if job["walltime"] is not None else float("inf")
+            if ends <= reserved_start:
+                free -= self.start(job)
+            elif cores <= spare:
+                spare -= cores
+                free -= self.start(job)
+
+    def _cores(self, job):
+        return min(job["cores"], self.cores)
+
+    def _reservation(self, cores, free, now):
+        """When a job needing cores can start, and how many cores are left
+        then"""
+        ends = sorted(
+            (job["started"] + job["walltime"] if job["walltime"] is not None else float("inf"),
+             self._cores(job))
+            for _, job in self.running.values())
+        for end, job_cores in ends:
+            free += job_cores
+            if free >= cores:
+                return end, free - cores
+        return float("inf"), 0
+
+    def start(self, job):
+        """Starts a job
+
+        Returns:
+            int: Number of cores it uses
+        """
+        now = time.time()
+        script_dir = os.path.join(self.batch.state_dir, "scripts")
+        os.makedirs(script_dir, exist_ok=True)
+        script_fp = os.path.join(script_dir, f"{job['id']}.sh")
+        with open(script_fp, "w", encoding="utf-8") as f:
+            f.write(job["script"])
+        env = json.loads(job["environment"])
+        env.update({"SLURM_JOB_ID": str(job["id"]), "SLURM_JOB_NAME": job["name"],
+                    "SLURM_NTASKS": str(self._cores(job))})
+        output = job_path(job["output"], job) or os.devnull
+        error = job_path(job["error"], job)
+        try:
+            with open(output, "w", encoding="utf-8") as out, \
+                 open(error or os.devnull, "w", encoding="utf-8") as err:
+                proc = subprocess.Popen(  # pylint: disable=consider-using-with
+                    ["bash", script_fp], cwd=job["workdir"], env=env,
+                    stdin=subprocess.DEVNULL, stdout=out,
+                    stderr=err if error else subprocess.STDOUT, start_new_session=True)
+        except OSError as e:
+            logging.warning(f"Could not start job {job['id']}: {e}")
+            with self.batch.connection:
+                self.batch.connection.execute(
+                    "UPDATE jobs SET state = 'FAILED', exit_code = 1, started = ?, ended = ? "
+                    "WHERE id = ?", (now, now, job["id"]))
+            os.remove(script_fp)
+            return 0
+        with self.batch.connection:
+            self.batch.connection.execute(
+                "UPDATE jobs SET state = 'RUNNING', pid = ?, started = ? WHERE id = ?",
+                (proc.pid, now, job["id"]))
+        job.update(pid=proc.pid, started=now, timed_out=None)
+        self.running[job["id"]] = (proc, job)
+        return self._cores(job)
+
+    def reap(self, wait=False):
+        """Records the jobs that have ended"""
+        for job_id, (proc, job) in list(self.running.items()):
+            exit_code = proc.wait() if wait else proc.poll()
+            if exit_code is None:
+                continue
+            del self.running[job_id]
+            if exit_code < 0:
+                exit_code = 128 - exit_code
+            cancelled = self.batch.connection.execute(
+                "SELECT cancelled FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+            if cancelled:
+                state = "CANCELLED"
+            elif job["timed_out"] is not None:
+                state = "TIMEOUT"
+            else:
+                state = "COMPLETED" if exit_code == 0 else "FAILED"
+            with self.batch.connection:
+                self.batch.connection.execute(
+                    "UPDATE jobs SET state = ?, exit_code = ?, ended = ? WHERE id = ?",
+                    (state, exit_code, time.time(), job_id))
+            script_fp = os.path.join(self.batch.state_dir, "scripts", f"{job_id}.sh")
+            if os.path.exists(script_fp):
+                os.remove(script_fp)
+
+    def enforce_walltimes(self):
+        """Ends the jobs that run beyond their walltime: SIGTERM first, and
+        SIGKILL KILL_GRACE seconds later"""
+        now = time.time()
+        for proc, job in self.running.values():
+            if job["walltime"] is None or now < job["started"] + job["walltime"]:
+                continue
+            if job["timed_out"] is None:
+                job["timed_out"] = now
+                _kill(proc.pid, signal.SIGTERM)
+            elif now >= job["timed_out"] + KILL_GRACE:
+                _kill(proc.pid, signal.SIGKILL)
+
+    def purge(self):
+        """Removes old jobs from the job table, at most once an hour"""
+        now = time.time()
+        if now - self._purged < 3600:
+            return
+        self._purged = now
+        with self.batch.connection:
+            self.batch.connection.execute(
+                "DELETE FROM jobs WHERE state NOT IN ('PENDING', 'RUNNING') AND ended < ?",
+                (now - PURGE_AGE,))
+
+
+def _kill(pid, sig):
+    """Signals the process group of a job"""
+    try:
+        os.killpg(pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def job_ids(values):
+    """Job ids from --jobs options (comma-separated) and arguments"""
+    return [int(job_id) for value in values for job_id in value.split(",") if job_id]
+
+
+def squeue(batch, argv):
+    """Prints jobs the way rocoto reads squeue's output"""
+    parser = argparse.ArgumentParser(prog="squeue")
+    parser.add_argument("-j", "--jobs", action="append", default=[])
+    args, _ = parser.parse_known_args(argv)
+    ids = job_ids(args.jobs) if args.jobs else None
+    fmt = "{:<40}{:<40}{:<10}{:<20}{:<30}{:<30}{:<30}{:<30}{:<10}{:<30}{:<200}"
+    lines = [fmt.format("JOBID", "USER", "CPUS", "PARTITION", "SUBMIT_TIME", "START_TIME",
+                        "END_TIME", "PRIORITY", "EXIT_CODE", "STATE", "NAME")]
+    for job in batch.jobs(ids, since=time.time() - SQUEUE_MIN_AGE):
+        end = job["ended"]
+        if end is None and job["started"] is not None and job["walltime"] is not None:
+            end = job["started"] + job["walltime"]
+        lines.append(fmt.format(
+            job["id"], job["user"], job["cores"], "linux", format_time(job["submitted"]),
+            format_time(job["started"]), format_time(end), 0.1,
+            job["exit_code"] or 0, job["state"], job["name"]))
+    print("\n".join(lines))
+
+
+def sacct(batch, argv):
+    """Prints jobs the way rocoto reads sacct's output"""
+    parser = argparse.ArgumentParser(prog="sacct")
+    parser.add_argument("-j", "--jobs", action="append", default=[])
+    args, _ = parser.parse_known_args(argv)
+    if args.jobs:
+        jobs = batch.jobs(job_ids(args.jobs))
+    else:
+        # Jobs since midnight, as with slurm
+        midnight = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        jobs = batch.jobs(since=midnight.timestamp())
+    lines = ["JobID|User|JobName|Partition|Priority|Submit|Start|End|NCPUS|ExitCode|State"]
+    for job in jobs:
+        lines.append("|".join(str(value) for value in (
+            job["id"], job["user"][:30], job["name"][:30], "linux", 0.1,
+            format_time(job["submitted"]), format_time(job["started"]),
+            format_time(job["ended"]), job["cores"], job["exit_code"] or 0, job["state"])))
+    print("\n".join(lines))
+
+
+def parse_args(argv):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Run batch jobs on this machine.")
+    parser.add_argument(
+        "--state-dir",
+        dest="state_dir",
+        default=DEFAULT_STATE_DIR,
+        help="Directory of the job table and the daemon's files.",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for command in ("sbatch", "squeue", "sacct", "scancel"):
+        subparsers.add_parser(command, add_help=False)
+    daemon = subparsers.add_parser("daemon", help="Run the jobs.")
+    daemon.add_argument(
+        "--cores",
+        type=int,
+        default=None,
+        help="Number of cores jobs may use; LOCAL_BATCH_CORES or all by default.",
+    )
+    daemon.add_argument(
+        "--state-dir",
+        dest="state_dir",
+        default=argparse.SUPPRESS,
+        help=argparse.SUPPRESS,
+    )
+    return parser.parse_known_args(argv)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    args, rest = parse_args(sys.argv[1:])
+    with LocalBatch(args.state_dir) as local:
+        if args.command == "sbatch":
+            # The script is the last argument that is not an option, or stdin
+            script_args = [arg for arg in rest if not arg.startswith("-")]
+            if script_args and os.path.isfile(script_args[-1]):
+                with open(script_args[-1], encoding="utf-8") as script_file:
+                    job_script = script_file.read()
+                rest.remove(script_args[-1])
+            else:
+                job_script = sys.stdin.read()
+            new_id = local.submit(job_script, rest)
+            local.wake_daemon()
+            print(f"Submitted batch job {new_id}")
+        elif args.command == "squeue":
+            squeue(local, rest)
+        elif args.command == "sacct":
+            sacct(local, rest)
+        elif args.command == "scancel":
+            local.cancel(job_ids([arg for arg in rest if not arg.startswith("-")]))
+        elif args.command == "daemon":
+            if not Executor(local, args.cores).run():
+                logging.info("A daemon is already running")
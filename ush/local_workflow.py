@@ -0,0 +1,570 @@
+#!/usr/bin/env python3
+
+"""
+Runs the tasks of an experiment directly from its rocoto YAML
+(ROCOTO_YAML_FP), without rocoto or a batch system, on the local machine or
+within a single batch allocation.
+
+Tasks run as soon as their dependencies are met, as many at a time as fit in
+a number of cores, instead of waiting for the next rocotorun. Dependencies
+are those of rocoto: taskdep (with cycle_offset and state), metataskdep,
+taskvalid, datadep (with age and minsize), streq, strneq, timedep and the
+and, or, not, nand and nor operators. The runner wakes up as soon as a task
+ends or a data dependency becomes old enough, and checks for missing files of
+data dependencies every few seconds. While a task waits only on files that do
+not exist yet (e.g. real-time input staged from outside the workflow), the
+runner keeps polling for them, for at most --data-timeout seconds without any
+task starting or ending if given.
+
+The state of the tasks is kept in a database with the jobs and cycles tables
+of a rocoto database, by default the one rocoto would use (FV3LAM_wflow.db in
+the experiment directory), so tools that read rocoto databases work with it.
+Running the workflow again skips the tasks that succeeded:
+
+    python3 local_workflow.py -e EXPTDIR [--cores N]
+"""
+
+import argparse
+import logging
+import os
+import queue
+import re
+import signal
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+from python_utils import load_yaml_config
+from rocoto_xml import cycledef_cycles, rocoto_interval, rocoto_time, task_resources
+
+# Seconds between checks for the missing files of data dependencies
+DATADEP_POLL = 5
+
+ROCOTO_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    jobid VARCHAR(64),
+    taskname VARCHAR(64),
+    cycle DATETIME,
+    cores INTEGER,
+    state VARCHAR(64),
+    native_state VARCHAR(64),
+    exit_status INTEGER,
+    tries INTEGER,
+    nunknowns INTEGER,
+    duration REAL
+);
+CREATE TABLE IF NOT EXISTS cycles (
+    id INTEGER PRIMARY KEY,
+    cycle DATETIME,
+    activated DATETIME,
+    expired DATETIME,
+    done DATETIME,
+    draining DATETIME
+);
+"""
+
+ENTITY_RE = re.compile(r"&([A-Za-z_][\w.-]*);")
+CYCLESTR_RE = re.compile(r'<cyclestr(?:\s+offset="([^"]*)")?\s*>(.*?)</cyclestr>', re.S)
+XML_ENTITIES = {"amp": "&", "lt": "<", "gt": ">", "quot": '"', "apos": "'"}
+CYCLE_FLAGS = {"Y": "%Y", "y": "%y", "m": "%m", "d": "%d", "H": "%H", "M": "%M", "S": "%S",
+               "j": "%j", "a": "%a", "A": "%A", "b": "%b", "B": "%B"}
+
+
+def signed_interval(text):
+    """A rocoto offset or age, which may be negative, in seconds"""
+    text = str(text).strip()
+    sign = -1 if text.startswith("-") else 1
+    return sign * rocoto_interval(text.lstrip("-+")).total_seconds()
+
+
+def cycle_string(text, cycle):
+    """Replaces the <cyclestr> elements of a text with their contents for a
+    cycle (a datetime)"""
+
+    def flags(match):
+        when = cycle
+        if match.group(1):
+            when = datetime.fromtimestamp(cycle.timestamp() + signed_interval(match.group(1)),
+                                          timezone.utc)
+        return re.sub(r"@(.)", lambda flag: (
+            "@" if flag.group(1) == "@"
+            else str(int(when.timestamp())) if flag.group(1) == "s"
+            else when.strftime(CYCLE_FLAGS[flag.group(1)]) if flag.group(1) in CYCLE_FLAGS
+            else flag.group(0)), match.group(2))
+
+    return CYCLESTR_RE.sub(flags, text)
+
+
+def substitute(text, subs):
+    """Replaces the #var# metatask variables in a text"""
+    for var, value in subs.items():
+        text = text.replace(f"#{var}#", value)
+    return text
+
+
+def size_bytes(text):
+    """A datadep minsize, in bytes, with an optional K, M or G suffix"""
+    text = str(text).strip().upper().rstrip("B")
+    scale = {"K": 1024, "M": 1024**2, "G": 1024**3}.get(text[-1:], 1)
+    return int(text.rstrip("KMG")) * scale
+
+
+class Workflow:
+    """The cycles and tasks of a rocoto YAML, with its entities, metatask
+    variables and cycle strings resolved
+
+    Args:
+        rocoto_cfg (dict): The contents of the rocoto YAML
+    """
+
+    def __init__(self, rocoto_cfg):
+        self.attrs = rocoto_cfg.get("attrs") or {}
+        self.entities = {name: str(value) for name, value in
+                         (rocoto_cfg.get("entities") or {}).items()}
+        self.groups = {}
+        for group, cdefs in (rocoto_cfg.get("cycledefs") or {}).items():
+            cycles = set()
+            for cdef in cdefs if isinstance(cdefs, list) else [cdefs]:
+                cycles.update(cycledef_cycles(self.expand(str(cdef))))
+            self.groups[group] = {datetime.strptime(c, "%Y%m%d%H%M").replace(tzinfo=timezone.utc)
+                                  for c in cycles}
+        self.cycles = sorted(set().union(*self.groups.values()))
+        # Per task name: the name it was expanded from, its settings,
+        # metatask variables, cycles, cores, walltime (in seconds, None for
+        # no limit) and number of tries
+        self.tasks = {}
+        # Per metatask name: the names of its tasks
+        self.metatasks = {}
+        self._expand_tasks(rocoto_cfg.get("tasks") or {}, {}, [])
+
+    def expand(self, text, subs=None, cycle=None):
+        """Resolves the entities, then the metatask variables and, for a
+        cycle, the cycle strings of a text, as rocoto does"""
+        text = str(text)
+        for _ in range(20):
+            expanded = ENTITY_RE.sub(
+                lambda m: self.entities.get(m.group(1), m.group(0)), text)
+            if expanded == text:
+                break
+            text = expanded
+        text = ENTITY_RE.sub(lambda m: XML_ENTITIES.get(m.group(1), m.group(0)), text)
+        if subs:
+            text = substitute(text, subs)
+        if cycle is not None:
+            text = cycle_string(text, cycle)
+        return text
+
+    def _expand_tasks(self, section, subs, parents):
+        for key, settings in section.items():
+            if not isinstance(settings, dict):
+                continue
+            kind, _, name = key.partition("_")
+            if kind == "task" and settings.get("command"):
+                name = substitute(name, subs)
+                attrs = settings.get("attrs") or {}
+                cycledefs = attrs.get("cycledefs")
+                if cycledefs:
+                    cycles = set().union(*(self.groups.get(substitute(group, subs).strip(), set())
+                                           for group in str(cycledefs).split(",")))
+                else:
+                    cycles = set(self.cycles)
+                nodes, cores = task_resources(
+                    self.expand(settings["nodes"], subs) if settings.get("nodes") else None,
+                    self.expand(settings["cores"], subs) if settings.get("cores") else None)
+                walltime = settings.get("walltime")
+                self.tasks[name] = {
+                    "template": key[len("task_"):],
+                    "settings": settings,
+                    "subs": dict(subs),
+                    "cycles": cycles,
+                    "cores": cores or 1,
+                    "nodes": nodes,
+                    "walltime": rocoto_interval(str(walltime)).total_seconds()
+                                if walltime else None,
+                    "maxtries": int(attrs.get("maxtries", 1)),
+                }
+                for parent in parents:
+                    self.metatasks[parent].append(name)
+            elif kind == "metatask":
+                name = substitute(name, subs)
+                self.metatasks[name] = []
+                metavars = {var: str(substitute(str(values), subs)).split()
+                            for var, values in (settings.get("var") or {}).items()}
+                num = min(len(values) for values in metavars.values()) if metavars else 0
+                for i in range(num):
+                    self._expand_tasks(
+                        settings, {**subs, **{var: values[i] for var, values in metavars.items()}},
+                        parents + [name])
+
+    def valid(self, name, cycle):
+        """Whether a task runs for a cycle"""
+        return name in self.tasks and cycle in self.tasks[name]["cycles"]
+
+
+class LocalWorkflow:
+    """Runs the tasks of a workflow, keeping their state in a rocoto-style
+    database
+
+    Args:
+        workflow (Workflow): The workflow
+        db_path       (str): Path of the database
+        cores         (int): Number of cores the tasks may use at a time
+        data_timeout (float): Longest time to wait for the missing files of
+                              data dependencies while no task starts or
+                              ends, in seconds; no limit by default
+    """
+
+    def __init__(self, workflow, db_path, cores=None, data_timeout=None):
+        self.workflow = workflow
+        self.cores = cores or (len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity")
+                               else os.cpu_count() or 1)
+        self.connection = sqlite3.connect(db_path, timeout=60)
+        self.connection.executescript(ROCOTO_SCHEMA)
+        # Per (task, cycle): its "state", "tries", database "id" and, while
+        # it runs, its "proc", "cores", "started" time and "timed_out" time
+        self.jobs = {}
+        self.finished = queue.Queue()
+        self.data_timeout = data_timeout
+        self._data_missing = False
+        # Whether missing files of data dependencies count as present
+        self._assume_data = False
+        self._load_state()
+
+    def close(self):
+        """Closes the database"""
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _load_state(self):
+        """Reads the tasks that succeeded in earlier runs"""
+        for row_id, name, cycle, state, tries in self.connection.execute(
+                "SELECT id, taskname, cycle, state, tries FROM jobs"):
+            key = (name, datetime.fromtimestamp(cycle, timezone.utc))
+            self.jobs[key] = {"id": row_id, "state": state if state == "SUCCEEDED" else None,
+                              "tries": 0}
+        # Cycles with tasks that did not succeed are run again
+        self.cycle_rows = {}
+        for row_id, cycle, done in self.connection.execute(
+                "SELECT id, cycle, done FROM cycles").fetchall():
+            cycle = datetime.fromtimestamp(cycle, timezone.utc)
+            if done is not None and not all(
+                    self.state(name, cycle) == "SUCCEEDED"
+                    for name, task in self.workflow.tasks.items() if cycle in task["cycles"]):
+                done = None
+                with self.connection:
+                    self.connection.execute("UPDATE cycles SET done = NULL WHERE id = ?",
+                                            (row_id,))
+            self.cycle_rows[cycle] = (row_id, done)
+
+    def state(self, name, cycle):
+        """The state of a task for a cycle"""
+        return self.jobs.get((name, cycle), {}).get("state")
+
+    def dependency_met(self, dep, name, cycle, now, wake):
+        """Whether a dependency (the dictionary of a <dependency> element)
+        of a task is met for a cycle; the times at which data dependencies
+        will be old enough are added to wake"""
+        return all(self._node_met(tag.split("_")[0], value, name, cycle, now, wake)
+                   for tag, value in dep.items())
+
+    def _node_met(self, tag, value, name, cycle, now, wake):
+        wflow = self.workflow
+        subs = wflow.tasks[name]["subs"]
+        if tag in ("and", "or", "not", "nand", "nor"):
+            results = [self._node_met(child.split("_")[0], child_value, name, cycle, now, wake)
+                       for child, child_value in value.items() if child != "attrs"]
+            met = all(results) if tag in ("and", "not", "nand") else any(results)
+            return not met if tag in ("not", "nand", "nor") else met
+
+        attrs = (value.get("attrs") or {}) if isinstance(value, dict) else {}
+        attrs = {key: wflow.expand(val, subs) for key, val in attrs.items()}
+        if tag in ("taskdep", "taskvalid"):
+            dep_cycle = cycle
+            if attrs.get("cycle_offset"):
+                dep_cycle = datetime.fromtimestamp(
+                    cycle.timestamp() + signed_interval(attrs["cycle_offset"]), timezone.utc)
+            if not wflow.valid(attrs["task"], dep_cycle):
+                return False
+            if tag == "taskvalid":
+                return True
+            return self.state(attrs["task"], dep_cycle) == attrs.get("state", "SUCCEEDED").upper()
+        if tag == "metataskdep":
+            return all(self.state(task, cycle) == "SUCCEEDED"
+                       for task in wflow.metatasks.get(attrs["metatask"], [])
+                       if wflow.valid(task, cycle))
+        if tag in ("streq", "strneq"):
+            equal = (wflow.expand(value.get("left", ""), subs, cycle)
+                     == wflow.expand(value.get("right", ""), subs, cycle))
+            return equal if tag == "streq" else not equal
+
+        text = value.get("text", "") if isinstance(value, dict) else value
+        text = wflow.expand(text, subs, cycle).strip()
+        if tag == "datadep":
+            try:
+                stat = os.stat(text)
+            except OSError:
+                self._data_missing = True
+                return self._assume_data
+            if attrs.get("minsize") and stat.st_size < size_bytes(attrs["minsize"]):
+                self._data_missing = True
+                return self._assume_data
+            ready = stat.st_mtime + signed_interval(attrs.get("age", 0))
+            if now < ready:
+                wake.append(ready)
+                return False
+            return True
+        if tag == "timedep":
+            ready = rocoto_time(text).replace(tzinfo=timezone.utc).timestamp()
+            if now < ready:
+                wake.append(ready)
+                return False
+            return True
+        raise ValueError(f"Unsupported dependency {tag} of task {name}")
+
+    def waits_on_data(self, dep, name, cycle, now):
+        """Whether an unmet dependency of a task for a cycle would be met
+        once the missing files of its data dependencies exist, so that the
+        task may still run"""
+        self._assume_data = True
+        try:
+            return self.dependency_met(dep, name, cycle, now, [])
+        finally:
+            self._assume_data = False
+
+    def run(self):
+        """Runs the workflow until no task can run any more
+
+        Returns:
+            dict: Number of tasks per final state, with "UNSTARTED" for the
+                  tasks whose dependencies were never met
+        """
+        wflow = self.workflow
+        cycle_throttle = int(wflow.attrs.get("cyclethrottle", len(wflow.cycles) or 1))
+        task_throttle = int(wflow.attrs.get("taskthrottle", 10**9))
+        running = {}
+        last_change = time.time()
+        stop = []
+        previous = signal.signal(signal.SIGTERM, lambda *_: stop.append(True)) \
+            if threading.current_thread() is threading.main_thread() else None
+        try:
+            while not stop:
+                now = time.time()
+                self._data_missing = False
+                waiting_on_data = False
+                wake = []
+                active = [cycle for cycle in wflow.cycles if not self._cycle_done(cycle)]
+                for cycle in active[:cycle_throttle]:
+                    self._activate(cycle, now)
+                    for name, task in wflow.tasks.items():
+                        if cycle not in task["cycles"] or (name, cycle) in running:
+                            continue
+                        if self.state(name, cycle) in ("SUCCEEDED", "DEAD"):
+                            continue
+                        if len(running) >= task_throttle:
+                            break
+                        dep = task["settings"].get("dependency")
+                        if dep and not self.dependency_met(dep, name, cycle, now, wake):
+                            if self._data_missing and not waiting_on_data:
+                                waiting_on_data = self.waits_on_data(dep, name, cycle, now)
+                            continue
+                        cores = min(task["cores"], self.cores)
+                        if cores > self.cores - sum(job["cores"] for job in running.values()):
+                            continue
+                        running[(name, cycle)] = self.start(name, cycle, cores)
+                        last_change = now
+
+                self._enforce_walltimes(running, now)
+                if not running and not wake:
+                    if not waiting_on_data:
+                        break
+                    if self.data_timeout is not None and now - last_change > self.data_timeout:
+                        logging.warning("Gave up waiting for the missing files of data "
+                                        "dependencies")
+                        break
+                timeout = min(wake) - now if wake else None
+                if self._data_missing or running:
+                    timeout = DATADEP_POLL if timeout is None else min(timeout, DATADEP_POLL)
+                try:
+                    key, exit_code = self.finished.get(timeout=max(timeout, 0.01))
+                except queue.Empty:
+                    continue
+                last_change = time.time()
+                while True:
+                    self.end(key, exit_code, running.pop(key))
+                    try:
+                        key, exit_code = self.finished.get_nowait()
+                    except queue.Empty:
+                        break
+        finally:
+            for job in running.values():
+                _kill(job["proc"].pid, signal.SIGKILL)
+            if previous is not None:
+                signal.signal(signal.SIGTERM, previous)
+
+        summary = {}
+        for cycle in wflow.cycles:
+            for name, task in wflow.tasks.items():
+                if cycle in task["cycles"]:
+                    state = self.state(name, cycle) or "UNSTARTED"
+                    summary[state] = summary.get(state, 0) + 1
+        return summary
+
+    def _cycle_done(self, cycle):
+        if self.cycle_rows.get(cycle, (None, None))[1] is not None:
+            return True
+        if all(self.state(name, cycle) in ("SUCCEEDED", "DEAD")
+               for name, task in self.workflow.tasks.items() if cycle in task["cycles"]):
+            row_id, _ = self.cycle_rows.get(cycle, (None, None))
+            if row_id is not None:
+                with self.connection:
+                    self.connection.execute("UPDATE cycles SET done = ? WHERE id = ?",
+                                            (int(time.time()), row_id))
+                self.cycle_rows[cycle] = (row_id, int(time.time()))
+            return True
+        return False
+
+    def _activate(self, cycle, now):
+        if cycle in self.cycle_rows:
+            return
+        with self.connection:
+            cur = self.connection.execute("INSERT INTO cycles (cycle, activated) VALUES (?, ?)",
+                                          (int(cycle.timestamp()), int(now)))
+        self.cycle_rows[cycle] = (cur.lastrowid, None)
+
+    def start(self, name, cycle, cores):
+        """Starts a task for a cycle
+
+        Returns:
+            dict: The running job
+        """
+        wflow = self.workflow
+        task = wflow.tasks[name]
+        settings, subs = task["settings"], task["subs"]
+        env = dict(os.environ)
+        env.update({var: wflow.expand(value, subs, cycle)
+                    for var, value in (settings.get("envars") or {}).items()
+                    if value is not None})
+        log_fp = wflow.expand(settings.get("join") or settings.get("stdout") or os.devnull,
+                              subs, cycle)
+        if log_fp != os.devnull:
+            os.makedirs(os.path.dirname(log_fp) or ".", exist_ok=True)
+        command = wflow.expand(settings["command"], subs, cycle)
+        job = self.jobs.setdefault((name, cycle), {"id": None, "state": None, "tries": 0})
+        job["tries"] += 1
+        with open(log_fp, "w", encoding="utf-8") as log:
+            proc = subprocess.Popen(  # pylint: disable=consider-using-with
+                ["bash", "-c", command], env=env, stdin=subprocess.DEVNULL, stdout=log,
+                stderr=subprocess.STDOUT, start_new_session=True)
+        threading.Thread(target=lambda: self.finished.put(((name, cycle), proc.wait())),
+                         daemon=True).start()
+        job.update(state="RUNNING", proc=proc, cores=cores, started=time.time(), timed_out=None)
+        with self.connection:
+            if job["id"] is None:
+                job["id"] = self.connection.execute(
+                    "INSERT INTO jobs (jobid, taskname, cycle, cores, state, tries, nunknowns) "
+                    "VALUES (?, ?, ?, ?, 'RUNNING', ?, 0)",
+                    (str(proc.pid), name, int(cycle.timestamp()), cores, job["tries"])).lastrowid
+            else:
+                self.connection.execute(
+                    "UPDATE jobs SET jobid = ?, cores = ?, state = 'RUNNING', tries = ?, "
+                    "exit_status = NULL, duration = NULL WHERE id = ?",
+                    (str(proc.pid), cores, job["tries"], job["id"]))
+        logging.info(f"{cycle:%Y%m%d%H%M} {name}: started (try {job['tries']})")
+        return job
+
+    def end(self, key, exit_code, job):
+        """Records the end of a task: it succeeded, will be retried, or is
+        dead"""
+        name, cycle = key
+        duration = time.time() - job["started"]
+        if exit_code < 0:
+            exit_code = 128 - exit_code
+        if exit_code == 0:
+            state = "SUCCEEDED"
+        elif job["tries"] < self.workflow.tasks[name]["maxtries"]:
+            state = None
+        else:
+            state = "DEAD"
+        job["state"] = state
+        with self.connection:
+            self.connection.execute(
+                "UPDATE jobs SET state = ?, exit_status = ?, duration = ? WHERE id = ?",
+                (state or "FAILED", exit_code, duration, job["id"]))
+        logging.info(f"{cycle:%Y%m%d%H%M} {name}: {(state or 'FAILED').lower()} "
+                     f"(exit status {exit_code}, {duration:.0f} s)")
+
+    def _enforce_walltimes(self, running, now):
+        for (name, _), job in running.items():
+            walltime = self.workflow.tasks[name]["walltime"]
+            if walltime is None or now < job["started"] + walltime:
+                continue
+            if job["timed_out"] is None:
+                job["timed_out"] = now
+                _kill(job["proc"].pid, signal.SIGTERM)
+            elif now >= job["timed_out"] + 30:
+                _kill(job["proc"].pid, signal.SIGKILL)
+
+
+def _kill(pid, sig):
+    """Signals the process group of a task"""
+    try:
+        os.killpg(pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def parse_args(argv):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(
+        description="Run the tasks of an experiment without rocoto."
+    )
+    parser.add_argument(
+        "-e", "--exptdir",
+        dest="exptdir",
+        required=True,
+        help="The experiment directory.",
+    )
+    parser.add_argument(
+        "--cores",
+        type=int,
+        default=None,
+        help="Number of cores the tasks may use at a time; all cores by default.",
+    )
+    parser.add_argument(
+        "--db",
+        default=None,
+        help="Path of the database of task states; the rocoto database by default.",
+    )
+    parser.add_argument(
+        "--data-timeout",
+        dest="data_timeout",
+        type=float,
+        default=None,
+        help="Seconds to keep waiting for the missing files of data dependencies while "
+             "no task starts or ends; no limit by default.",
+    )
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    args = parse_args(sys.argv[1:])
+    expt_cfg = load_yaml_config(os.path.join(args.exptdir, "var_defns.yaml"))["workflow"]
+    rocoto_yaml = expt_cfg.get("ROCOTO_YAML_FP",
+                               os.path.join(args.exptdir, "rocoto_defns.yaml"))
+    db_fp = args.db or os.path.join(
+        args.exptdir, f"{os.path.splitext(expt_cfg.get('WFLOW_XML_FN', 'FV3LAM_wflow.xml'))[0]}.db")
+    with LocalWorkflow(Workflow(load_yaml_config(rocoto_yaml)), db_fp, args.cores,
+                       args.data_timeout) as runner:
+        result = runner.run()
+    logging.info(", ".join(f"{count} {state.lower()}" for state, count in sorted(result.items())))
+    sys.exit(0 if set(result) == {"SUCCEEDED"} else 1)
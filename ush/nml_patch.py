@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+
+"""
+In-place patching of Fortran namelist files. The group and key positions of a
+namelist are indexed once, and updating a few values rewrites only the lines
+holding them, so that the rest of the file is kept byte for byte instead of
+being parsed and re-serialized in full. Keys and groups that do not exist yet
+are appended to their group or to the file. Updates the patcher cannot make
+safely (array elements, derived types, several assignments on one line, ...)
+fall back to a full uwtools realize.
+"""
+
+import re
+
+GROUP_START_REGEX = re.compile(r"^\s*[&$](?P<group>[A-Za-z_]\w*)\s*$")
+GROUP_END_REGEX = re.compile(r"^\s*(/|[&$]end)\s*$", re.IGNORECASE)
+# A whole group on one line, e.g. an empty "&nam_stochy /"
+GROUP_LINE_REGEX = re.compile(
+    r"^(?P<start>\s*[&$](?P<group>[A-Za-z_]\w*))(?P<body>.*?)(/|[&$]end)\s*$", re.IGNORECASE
+)
+ASSIGNMENT_REGEX = re.compile(
+    r"^(?P<prefix>\s*(?P<key>[A-Za-z_][\w%]*(?:\([^)]*\))?)\s*=\s*)(?P<value>.*?)(?P<suffix>\s*)$"
+)
+SIMPLE_KEY_REGEX = re.compile(r"^[A-Za-z_]\w*$")
+DEFAULT_INDENT = "    "
+
+
+class NmlPatchError(Exception):
+    """Raised for updates that cannot be patched in place"""
+
+
+def _split_comment(line):
+    """Splits a line into its content and a trailing comment, ignoring
+    comment characters inside quoted strings"""
+
+    quote = None
+    for i, char in enumerate(line):
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in "'\"":
+            quote = char
+        elif char == "!":
+            return line[:i], line[i:]
+    return line, ""
+
+
+def _count_assignments(content):
+    """Number of '=' outside quoted strings"""
+
+    quote = None
+    count = 0
+    for char in content:
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in "'\"":
+            quote = char
+        elif char == "=":
+            count += 1
+    return count
+
+
+def format_value(value, sep=", "):
+    """Formats a Python value as a namelist value, as f90nml writes it
+
+    Args:
+        value: bool, int, float, str, or a list of those
+        sep (str): Separator of list elements
+    Returns:
+        str
+    """
+
+    if isinstance(value, (list, tuple)):
+        if not value:
+            raise NmlPatchError("Empty lists cannot be patched")
+        return sep.join(format_value(v) for v in value)
+    if isinstance(value, bool):
+        return ".true." if value else ".false."
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    raise NmlPatchError(f"Values of type {type(value).__name__} cannot be patched")
+
+
+class NamelistPatcher:
+    """Index of the groups and keys of a namelist, for patching it
+
+    Args:
+        text (str): Content of the namelist file
+    """
+
+    def __init__(self, text):
+        self.lines = text.splitlines(keepends=True)
+        # Group name -> {"end": line index of the terminator,
+        #                "keys": key name -> [first line, last line],
+        #                "start": text opening the group, if it is on one line}
+        self.groups = {}
+        # Groups that cannot be patched in place, with the reason
+        self.unpatchable = {}
+        self.indent = None
+        self._index()
+
+    @classmethod
+    def from_file(cls, path):
+        """Indexes a namelist file"""
+
+        with open(path, encoding="utf-8") as f:
+            return cls(f.read())
+
+    def _index(self):
+        group = None
+        key = None
+        for i, line in enumerate(self.lines):
+            content, _ = _split_comment(line.rstrip("\r\n"))
+            if not content.strip():
+                continue
+            if group is None:
+                match = GROUP_START_REGEX.match(content)
+                if match:
+                    group = match.group("group").lower()
+                    if group in self.groups:
+                        self.unpatchable[group] = "it appears more than once"
+                    self.groups[group] = {"end": None, "keys": {}}
+                    key = None
+                    continue
+                self._index_group_line(i, content)
+                continue
+            if GROUP_END_REGEX.match(content):
+                self.groups[group]["end"] = i
+                group = None
+                continue
+            match = ASSIGNMENT_REGEX.match(content)
+            if match:
+                key = match.group("key").lower()
+                if _count_assignments(content) > 1:
+                    self.unpatchable[group] = f"line {i + 1} has several assignments"
+                if self.indent is None:
+                    self.indent = re.match(r"\s*", content).group()
+                self.groups[group]["keys"][key] = [i, i]
+            elif key is not None:
+                # Continuation of the value of the previous key
+                self.groups[group]["keys"][key][1] = i
+            else:
+                self.unpatchable[group] = f"line {i + 1} could not be parsed"
+        if group is not None:
+            self.unpatchable[group] = "it is not terminated"
+
+    def _index_group_line(self, i, content):
+        """Indexes a group written on one line, e.g. an empty "&nam_stochy /" """
+
+        match = GROUP_LINE_REGEX.match(content)
+        if not match:
+            return
+        group = match.group("group").lower()
+        if group in self.groups:
+            self.unpatchable[group] = "it appears more than once"
+        elif match.group("body").strip():
+            self.unpatchable[group] = f"its values are on line {i + 1} with its name"
+        self.groups[group] = {"end": i, "keys": {}, "start": match.group("start")}
+
+    def _split_group_line(self, info, keys, newline):
+        """Rewrites a group written on one line over several lines, with new
+        keys, keeping its comment and line ending on the terminator"""
+
+        body = self.lines[info["end"]].rstrip("\r\n")
+        eol = self.lines[info["end"]][len(body):]
+        comment = _split_comment(body)[1]
+        comment = f" {comment}" if comment else ""
+        return "".join([f"{info['start']}{newline}"] + keys + [f"/{comment}{eol}"])
+
+    def _replace_value(self, first, last, value):
+        """Rewrites the lines of one key with a new value, keeping the text
+        before the value and the trailing comma, comment and line ending of
+        its last line"""
+
+        head, _ = _split_comment(self.lines[first].rstrip("\r\n"))
+        match = ASSIGNMENT_REGEX.match(head)
+        old_value = " ".join(
+            [match.group("value")]
+            + [_split_comment(l)[0].strip() for l in self.lines[first + 1:last + 1]]
+        ).rstrip(" ,")
+        # Keep the list separator style of the file
+        sep = "," if "," in old_value and not re.search(r",\s", old_value) else ", "
+
+        body = self.lines[last].rstrip("\r\n")
+        eol = self.lines[last][len(body):]
+        content, comment = _split_comment(body)
+        trailing = re.search(r"\s*,?\s*$", content).group()
+        return f"{match.group('prefix')}{format_value(value, sep)}{trailing}{comment}{eol}"
+
+    def patch(self, settings):
+        """Applies updates to the namelist text
+
+        Args:
+            settings (dict): Group name -> {key: value} of the values to set
+        Returns:
+            str: The patched namelist text; the patcher itself is unchanged,
+                 so it can be used for several updates of the same file
+        Raises:
+            NmlPatchError: if an update cannot be made in place
+        """
+
+        # Replacements (last line, new line) by first line, lines to insert
+        # before a line index, and new groups
+        replace = {}
+        insert = {}
+        append = []
+        newline = "\n"
+        if self.lines and self.lines[0].endswith("\r\n"):
+            newline = "\r\n"
+        indent = DEFAULT_INDENT if self.indent is None else self.indent
+
+        for group, values in settings.items():
+            group_l = group.lower()
+            if not isinstance(values, dict):
+                raise NmlPatchError(f"Settings of group {group} are not a mapping")
+            if group_l in self.unpatchable:
+                raise NmlPatchError(f"Group {group} cannot be patched: {self.unpatchable[group_l]}")
+            if group_l not in self.groups:
+                append.append(f"&{group}{newline}")
+                for key, value in values.items():
+                    self._check_key(key)
+                    append.append(f"{indent}{key} = {format_value(value)}{newline}")
+                append.append(f"/{newline}")
+                continue
+            info = self.groups[group_l]
+            for key, value in values.items():
+                self._check_key(key)
+                key_l = key.lower()
+                if any(k.startswith((key_l + "(", key_l + "%")) for k in info["keys"]):
+                    raise NmlPatchError(f"Key {key} of group {group} is set by element")
+                span = info["keys"].get(key_l)
+                if span is None:
+                    insert.setdefault(info["end"], []).append(
+                        f"{indent}{key} = {format_value(value)}{newline}"
+                    )
+                else:
+                    replace[span[0]] = (span[1], self._replace_value(*span, value))
+            if "start" in info and info["end"] in insert:
+                keys = insert.pop(info["end"])
+                replace[info["end"]] = (info["end"], self._split_group_line(info, keys, newline))
+
+        out = []
+        i = 0
+        while i < len(self.lines):
+            out.extend(insert.get(i, []))
+            if i in replace:
+                last, line = replace[i]
+                out.append(line)
+                i = last + 1
+                continue
+            out.append(self.lines[i])
+            i += 1
+        if append:
+            if out and not out[-1].endswith(("\n", "\r")):
+                out.append(newline)
+            if out and out[-1].strip():
+                out.append(newline)
+            out.extend(append)
+        return "".join(out)
+
+    @staticmethod
+    def _check_key(key):
+        if not SIMPLE_KEY_REGEX.match(key):
+            raise NmlPatchError(f"Key {key} is not a plain variable name")
+
+
+def patch_nml_file(input_file, settings, output_file=None):
+    """Updates values of a namelist file, patching only the lines that change
+    and falling back to a full uwtools realize if that is not possible
+
+    Args:
+        input_file  (str): The namelist to update
+        settings   (dict): Group name -> {key: value} of the values to set
+        output_file (str): Where to write the result; defaults to input_file
+    Returns:
+        bool: True if the file was patched in place, False if it was realized
+    """
+
+    output_file = output_file or input_file
+    try:
+        text = NamelistPatcher.from_file(input_file).patch(settings)
+    except NmlPatchError:
+        # Imported here so that the patcher itself does not depend on uwtools
+        # pylint: disable=import-outside-toplevel
+        from uwtools.api.config import get_nml_config, realize
+
+        realize(
+            input_config=input_file,
+            input_format="nml",
+            output_file=output_file,
+            output_format="nml",
+            update_config=get_nml_config(settings),
+        )
+        return False
+    with open(output_file, "w", encoding="utf-8") as f:
+        f.write(text)
+    return True
@@ -23,6 +23,7 @@ from .filesys_cmds_vrfy import (
     ln_vrfy,
     mkdir_vrfy,
     cd_vrfy,
+    run_fs_ops,
 )
 from .print_input_args import print_input_args
 from .print_msg import print_info_msg, print_err_msg_exit, log_info
@@ -14,13 +14,13 @@ def check_for_preexist_dir_file(path, method):
 
     Args:
         path: path to directory
-        method: could be any of [ 'delete', 'reuse', 'rename', 'quit' ]
+        method: could be any of [ 'delete', 'reuse', 'rename', 'update', 'quit' ]
     Returns:
         None
     """
 
     try:
-        check_var_valid_value(method, ["delete", "reuse", "rename", "quit"])
+        check_var_valid_value(method, ["delete", "reuse", "rename", "update", "quit"])
     except ValueError:
         errmsg = dedent(
             f"""
@@ -48,6 +48,13 @@ def check_for_preexist_dir_file(path, method):
                 mv_vrfy(path, new_path)
             else:
                 rsync_vrfy(path, new_path)
+        elif method == "update":
+            log_info(
+                f"""
+                Specified directory or file already exists:
+                    {path}
+                Updating it in place"""
+            )
         else:
             raise FileExistsError(
                 dedent(
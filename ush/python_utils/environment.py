@@ -2,10 +2,32 @@
 
 import os
 import inspect
+import re
 import shlex
 from datetime import datetime, date
+from functools import lru_cache
 from types import ModuleType
 
+# Precompiled classifiers used by str_to_type. strptime only ever accepts
+# digits (and a space padding the day), so anything else can skip the date
+# parsing. Likewise int/float can only succeed on strings made of digits,
+# signs, separators, exponents and the letters of "infinity" and "nan".
+_DATE_CHARS_RE = re.compile(r"[\d ]+")
+_NUMBER_CHARS_RE = re.compile(r"[\d\s_+.eEinfatyINFATY-]+")
+_FLOAT_RE = re.compile(r"[+-]?(?:[0-9]+\.[0-9]*|\.[0-9]+|[0-9]+(?=[eE]))(?:[eE][+-]?[0-9]+)?")
+_DATE_FORMATS = {
+    8: "%Y%m%d",
+    10: "%Y%m%d%H",
+    12: "%Y%m%d%H%M",
+    14: "%Y%m%d%H%M%S",
+}
+_TRUE_STRINGS = frozenset(["true", "yes", "yeah"])
+_FALSE_STRINGS = frozenset(["false", "no", "nope"])
+_NONE_STRINGS = frozenset(["None", "null"])
+
+# Upper bound on the number of distinct strings remembered by str_to_type
+STR_TO_TYPE_CACHE_SIZE = 8192
+
 
 def str_to_date(s):
     """Get python datetime object from string.
@@ -17,15 +39,9 @@ def str_to_date(s):
     """
     v = None
     try:
-        l = len(s)
-        if l == 8:
-            v = datetime.strptime(s, "%Y%m%d")
-        elif l == 10:
-            v = datetime.strptime(s, "%Y%m%d%H")
-        elif l == 12:
-            v = datetime.strptime(s, "%Y%m%d%H%M")
-        elif l == 14:
-            v = datetime.strptime(s, "%Y%m%d%H%M%S")
+        fmt = _DATE_FORMATS.get(len(s))
+        if fmt is not None and _DATE_CHARS_RE.fullmatch(s):
+            v = datetime.strptime(s, fmt)
     except:
         v = None
     return v
@@ -59,34 +75,52 @@ def str_to_type(s, return_string=0):
         a float, int, boolean, datetime, or the string itself when all else fails
     """
     s = s.strip("\"'")
-    if return_string != 1:
-        if s.lower() in ["true", "yes", "yeah"]:
-            return True
-        if s.lower() in ["false", "no", "nope"]:
-            return False
-        if s in ["None", "null"]:
-            return None
-        v = str_to_date(s)
-        if v is not None:
-            if return_string == 2:
-                return s
-            return v
-        # int
+    if return_string == 1:
+        return s
+    return _classify_str(s, return_string)
+
+
+@lru_cache(maxsize=STR_TO_TYPE_CACHE_SIZE)
+def _classify_str(s, return_string):
+    """Memoized worker for str_to_type. Precompiled regexes rule out the
+    conversions that cannot succeed before any of them is attempted, so
+    ordinary strings never pay for strptime/int/float failures.
+
+    Args:
+        s: a string with quotes stripped
+        return_string: see str_to_type
+    Returns:
+        a float, int, boolean, datetime, or the string itself
+    """
+    lower = s.lower()
+    if lower in _TRUE_STRINGS:
+        return True
+    if lower in _FALSE_STRINGS:
+        return False
+    if s in _NONE_STRINGS:
+        return None
+    if not _NUMBER_CHARS_RE.fullmatch(s):
+        return s
+    v = str_to_date(s)
+    if v is not None:
+        if return_string == 2:
+            return s
+        return v
+    # int, skipped for strings that plainly are floats
+    if not _FLOAT_RE.fullmatch(s):
         try:
             v = int(s)
             # treat integers that start with 0 as string
             if len(s) > 1 and s[0] == "0":
                 return s
-            else:
-                return v
-        except:
-            pass
-        # float
-        try:
-            v = float(s)
             return v
-        except:
+        except ValueError:
             pass
+    # float
+    try:
+        return float(s)
+    except ValueError:
+        pass
     return s
 
 
@@ -1,8 +1,31 @@
 #!/usr/bin/env python3
 
+import glob
 import os
+import shlex
+import shutil
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
 from .print_msg import print_err_msg_exit
 
+# Options understood by the native implementations of each command; any
+# other option, or shell syntax, makes the *_vrfy wrappers fall back to the
+# shell.
+NATIVE_OPTS = {
+    "cp": {"r": "recursive", "R": "recursive", "f": "force", "p": "preserve"},
+    "mv": {"f": "force"},
+    "rm": {"r": "recursive", "R": "recursive", "f": "force"},
+    "ln": {"s": "symbolic", "f": "force", "n": "no_dereference", "r": "relative",
+           "-relative": "relative"},
+    "mkdir": {"p": "parents"},
+}
+SHELL_CHARS = set(";|&<>$`(){}\n")
+
+FsResult = namedtuple("FsResult", ["cmd", "args", "ok", "error", "seconds"])
+FsResult.__doc__ = """Outcome of a filesystem operation run by run_fs_ops"""
+
 
 def cmd_vrfy(cmd, *args):
     """Execute system command
@@ -21,8 +44,194 @@ def cmd_vrfy(cmd, *args):
     return ret
 
 
+def _split_args(cmd, args, literal=False):
+    """Splits the arguments of a *_vrfy call into options and operands.
+
+    An argument is split into words like the shell does when it is the only
+    argument or starts with an option; any other argument is a single operand,
+    so that paths containing spaces work.  With literal, no argument is split.
+    Operands with glob characters are expanded.
+
+    Returns:
+        (dict of options, list of operands), or None if the call needs a shell
+    """
+
+    args = [str(a) for a in args]
+    words = []
+    for arg in args:
+        if literal:
+            words.append(arg)
+        elif len(args) == 1 or arg.strip().startswith("-"):
+            if SHELL_CHARS & set(arg):
+                return None
+            try:
+                words.extend(shlex.split(arg))
+            except ValueError:
+                return None
+        else:
+            words.append(arg)
+
+    opts = {}
+    operands = []
+    known = NATIVE_OPTS[cmd]
+    for word in words:
+        if word.startswith("-") and not operands and word != "-":
+            letters = [word[1:]] if word.startswith("--") else list(word[1:])
+            for letter in letters:
+                if letter not in known:
+                    return None
+                opts[known[letter]] = True
+        elif glob.has_magic(word) and glob.glob(word):
+            operands.extend(sorted(glob.glob(word)))
+        else:
+            operands.append(word)
+    return opts, operands
+
+
+def _into_dir(src, dst, follow=True):
+    """Target path of src when dst is an existing directory (cp/mv/ln style)"""
+
+    if os.path.isdir(dst) and (follow or not os.path.islink(dst)):
+        return os.path.join(dst, os.path.basename(os.path.normpath(src)))
+    return dst
+
+
+def _remove(path):
+    """Removes a file, link, or directory tree"""
+
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    else:
+        os.remove(path)
+
+
+def native_cp(operands, recursive=False, preserve=False, force=False):
+    """Copies files (and, with recursive, directories) like cp"""
+
+    *srcs, dst = operands
+    if len(srcs) > 1 and not os.path.isdir(dst):
+        raise NotADirectoryError(f"Target '{dst}' is not a directory")
+    copy = shutil.copy2 if preserve else shutil.copy
+    for src in srcs:
+        target = _into_dir(src, dst)
+        if os.path.isdir(src):
+            if not recursive:
+                raise IsADirectoryError(f"-r not specified; omitting directory '{src}'")
+            shutil.copytree(src, target, symlinks=True, copy_function=copy,
+                            dirs_exist_ok=True)
+        else:
+            if force and os.path.lexists(target) and not os.access(target, os.W_OK):
+                os.remove(target)
+            copy(src, target)
+
+
+def native_mv(operands, force=False):  # pylint: disable=unused-argument
+    """Moves files or directories like mv, replacing existing files"""
+
+    *srcs, dst = operands
+    if len(srcs) > 1 and not os.path.isdir(dst):
+        raise NotADirectoryError(f"Target '{dst}' is not a directory")
+    for src in srcs:
+        shutil.move(src, _into_dir(src, dst))
+
+
+def native_rm(operands, recursive=False, force=False):
+    """Removes files (and, with recursive, directories) like rm"""
+
+    for path in operands:
+        if not os.path.lexists(path):
+            if force:
+                continue
+            raise FileNotFoundError(f"Cannot remove '{path}': no such file or directory")
+        if os.path.isdir(path) and not os.path.islink(path) and not recursive:
+            raise IsADirectoryError(f"Cannot remove '{path}': is a directory")
+        _remove(path)
+
+
+def native_ln(operands, symbolic=False, force=False, no_dereference=False,
+              relative=False):
+    """Creates symbolic or hard links like ln. Existing links are replaced
+    atomically by renaming a temporary link over them."""
+
+    if len(operands) == 1:
+        operands = operands + ["."]
+    *targets, dst = operands
+    if len(targets) > 1 and not os.path.isdir(dst):
+        raise NotADirectoryError(f"Target '{dst}' is not a directory")
+    for target in targets:
+        link = _into_dir(target, dst, follow=not no_dereference)
+        if os.path.lexists(link) and not force:
+            raise FileExistsError(f"Failed to create link '{link}': file exists")
+        if os.path.isdir(link) and not os.path.islink(link):
+            raise IsADirectoryError(f"Cannot overwrite directory '{link}'")
+        tmp = os.path.join(os.path.dirname(link) or ".",
+                           f".{os.path.basename(link)}.tmp{os.getpid()}")
+        if symbolic:
+            if relative:
+                target = os.path.relpath(os.path.realpath(target),
+                                         os.path.realpath(os.path.dirname(link) or "."))
+            os.symlink(target, tmp)
+        else:
+            os.link(target, tmp)
+        os.replace(tmp, link)
+
+
+def native_mkdir(operands, parents=False):
+    """Creates directories like mkdir"""
+
+    for path in operands:
+        if parents:
+            os.makedirs(path, exist_ok=True)
+        else:
+            os.mkdir(path)
+
+
+NATIVE_CMDS = {
+    "cp": native_cp,
+    "mv": native_mv,
+    "rm": native_rm,
+    "ln": native_ln,
+    "mkdir": native_mkdir,
+}
+
+
+def _run_native(cmd, args, literal=False):
+    """Runs a command natively if possible
+
+    Returns:
+        None on success, an error message on failure, or False if the
+        command needs the shell
+    """
+
+    split = _split_args(cmd, args, literal)
+    if split is None:
+        return False
+    opts, operands = split
+    if not operands or (cmd in ("cp", "mv") and len(operands) < 2):
+        return False
+    try:
+        NATIVE_CMDS[cmd](operands, **opts)
+    except (OSError, shutil.Error) as e:
+        return str(e)
+    return None
+
+
+def _vrfy(cmd, *args):
+    """Runs cp, mv, rm, ln, or mkdir natively, falling back to the shell for
+    options or syntax that the native versions do not handle. Exits with an
+    error message on failure, like cmd_vrfy."""
+
+    error = _run_native(cmd, args)
+    if error is False:
+        return cmd_vrfy(cmd, *args)
+    if error is not None:
+        cmd_str = cmd + " " + " ".join([str(a) for a in args])
+        print_err_msg_exit(f"System call '{cmd_str}' failed.\n{error}")
+    return 0
+
+
 def cp_vrfy(*args):
-    return cmd_vrfy("cp", *args)
+    return _vrfy("cp", *args)
 
 
 def rsync_vrfy(*args):
@@ -30,20 +239,86 @@ def rsync_vrfy(*args):
 
 
 def mv_vrfy(*args):
-    return cmd_vrfy("mv", *args)
+    return _vrfy("mv", *args)
 
 
 def rm_vrfy(*args):
-    return cmd_vrfy("rm", *args)
+    return _vrfy("rm", *args)
 
 
 def ln_vrfy(*args):
-    return cmd_vrfy("ln", *args)
+    return _vrfy("ln", *args)
 
 
 def mkdir_vrfy(*args):
-    return cmd_vrfy("mkdir", *args)
+    return _vrfy("mkdir", *args)
 
 
 def cd_vrfy(*args):
     return os.chdir(*args)
+
+
+def _op_paths(op):
+    """Absolute paths of the operands of an operation, used to find operations
+    that depend on each other"""
+
+    split = _split_args(op[0], op[1:], literal=True) if op[0] in NATIVE_CMDS else None
+    words = split[1] if split else [w for w in op[1:] if not str(w).startswith("-")]
+    return [os.path.abspath(str(w)) for w in words]
+
+
+def _overlaps(paths1, paths2):
+    for p1 in paths1:
+        for p2 in paths2:
+            if p1 == p2 or p1.startswith(p2 + os.sep) or p2.startswith(p1 + os.sep):
+                return True
+    return False
+
+
+def run_fs_ops(ops, max_workers=None):
+    """Runs a batch of filesystem operations, running those that do not touch
+    the same paths concurrently.
+
+    Each operation is a tuple of the command (cp, mv, rm, ln, mkdir, or any
+    other shell command) and its arguments, as they would be passed to the
+    corresponding *_vrfy function, e.g. ("ln", "-sf", target, link), except
+    that each argument is taken literally rather than split into words.  An
+    operation runs only after all earlier operations that touch the same path,
+    or a parent or child of it, have finished.
+
+    Args:
+        ops         (list): The operations
+        max_workers  (int): Number of threads; defaults to the
+                            ThreadPoolExecutor default
+    Returns:
+        list of FsResult, in the order of the operations
+    """
+
+    # Assign every operation to the first wave after those it depends on
+    paths = [_op_paths(op) for op in ops]
+    waves = []
+    for i in range(len(ops)):
+        wave = 0
+        for j in range(i):
+            if waves[j] >= wave and _overlaps(paths[i], paths[j]):
+                wave = waves[j] + 1
+        waves.append(wave)
+
+    def run(op):
+        start = time.perf_counter()
+        cmd, args = op[0], op[1:]
+        error = _run_native(cmd, args, literal=True) if cmd in NATIVE_CMDS else False
+        if error is False:
+            cmd_str = cmd + " " + " ".join(shlex.quote(str(a)) for a in args)
+            ret = os.system(cmd_str)
+            error = f"System call '{cmd_str}' failed." if ret != 0 else None
+        return FsResult(cmd, tuple(args), error is None, error,
+                        time.perf_counter() - start)
+
+    results = [None] * len(ops)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for wave in range(max(waves, default=-1) + 1):
+            idx = [i for i, w in enumerate(waves) if w == wave]
+            for i, result in zip(idx, executor.map(run, [ops[i] for i in idx])):
+                results[i] = result
+    return results
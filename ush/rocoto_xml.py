@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+
+"""
+Reads the tasks of a rocoto workflow XML (FV3LAM_wflow.xml) without calling
+rocoto: the cycles of each cycledef, and each task with its metatasks
+expanded, the cycles it runs for and the resources it requests. The result is
+cached until the file changes.
+
+Tasks are named TASKNAME_CYCLE, with the cycle as YYYYMMDDHHMM, as in the
+experiment dictionaries of the WE2E scripts:
+
+    python3 rocoto_xml.py -w FV3LAM_wflow.xml
+
+With --size, the size of each XML and an estimate of what reading it costs
+rocotorun are reported instead, e.g. to compare configurations:
+
+    python3 rocoto_xml.py --size -w expt1/FV3LAM_wflow.xml expt2/FV3LAM_wflow.xml
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from xml.etree import ElementTree as ET
+
+
+def rocoto_time(text):
+    """A time in a rocoto cycledef, as YYYYMMDDHH[MM[SS]]"""
+    fmt = {10: "%Y%m%d%H", 12: "%Y%m%d%H%M", 14: "%Y%m%d%H%M%S"}.get(len(text))
+    if fmt is None:
+        raise ValueError(f"Invalid rocoto time {text}")
+    return datetime.strptime(text, fmt)
+
+
+def rocoto_interval(text):
+    """An interval in a rocoto cycledef or walltime, as [[[DD:]HH:]MM:]SS"""
+    parts = [int(part) for part in reversed(text.strip().split(":"))]
+    if len(parts) > 4:
+        raise ValueError(f"Invalid rocoto interval {text}")
+    return timedelta(**dict(zip(["seconds", "minutes", "hours", "days"], parts)))
+
+
+def cycledef_cycles(text):
+    """Cycles (YYYYMMDDHHMM) of a rocoto cycledef of the form "start stop
+    interval"; cycledefs in crontab form are not supported and raise a
+    ValueError"""
+    try:
+        start, stop, interval = text.split()
+        cycle, stop, interval = rocoto_time(start), rocoto_time(stop), rocoto_interval(interval)
+    except ValueError as e:
+        raise ValueError(f"Unsupported cycledef {text}") from e
+    if interval <= timedelta(0):
+        raise ValueError(f"Unsupported cycledef {text}")
+    cycles = set()
+    while cycle <= stop:
+        cycles.add(cycle.strftime("%Y%m%d%H%M"))
+        cycle += interval
+    return cycles
+
+
+def task_resources(nodes=None, cores=None):
+    """Number of nodes and cores requested by a task, from the text of its
+    <nodes> (e.g. "4:ppn=12+1:ppn=2") or <cores> element; the number of
+    nodes is None for tasks that request cores"""
+    if nodes:
+        num_nodes = num_cores = 0
+        for spec in nodes.split("+"):
+            count, *attrs = spec.strip().split(":")
+            ppn = 1
+            for attr in attrs:
+                key, _, value = attr.partition("=")
+                if key == "ppn":
+                    ppn = int(value)
+            num_nodes += int(count)
+            num_cores += int(count) * ppn
+        return num_nodes, num_cores
+    return None, int(cores) if cores else None
+
+
+def expand_tasks(element, subs=None):
+    """The tasks in an element of a rocoto XML, expanding (nested) metatasks
+    and substituting their #var# values
+
+    Args:
+        element (Element): The <workflow> or a <metatask> element
+        subs       (dict): Values of the metatask variables in scope
+    Returns:
+        list of dicts with the "name", "cycledefs" (None if not set), "nodes",
+        "cores", "walltime" (in seconds) and number of "dependencies" (the
+        elements under its <dependency>) of each task
+    """
+    subs = subs or {}
+
+    def substitute(text):
+        if text is None:
+            return None
+        for var, value in subs.items():
+            text = text.replace(f"#{var}#", value)
+        return text
+
+    tasks = []
+    for child in element:
+        if child.tag == "task":
+            nodes, cores = task_resources(substitute(child.findtext("nodes")),
+                                          substitute(child.findtext("cores")))
+            walltime = substitute(child.findtext("walltime"))
+            dependency = child.find("dependency")
+            tasks.append({
+                "name": substitute(child.get("name")),
+                "cycledefs": substitute(child.get("cycledefs")),
+                "nodes": nodes,
+                "cores": cores,
+                "walltime": rocoto_interval(walltime).total_seconds() if walltime else None,
+                "dependencies": 0 if dependency is None else len(list(dependency.iter())) - 1,
+            })
+        elif child.tag == "metatask":
+            metavars = {var.get("name"): (var.text or "").split() for var in child.findall("var")}
+            num = min(len(values) for values in metavars.values()) if metavars else 0
+            for i in range(num):
+                tasks.extend(expand_tasks(child, {**subs, **{var: values[i] for var, values
+                                                             in metavars.items()}}))
+    return tasks
+
+
+# Per XML file: its modification time and size, and what was read from it
+_CACHE = {}
+
+
+def read_workflow(rocoto_xml):
+    """Reads the cycledefs and tasks of a rocoto XML
+
+    Args:
+        rocoto_xml (str): Path of the rocoto XML
+    Returns:
+        dict with the cycles of each cycledef group under "cycledefs", and the
+        "cycles", "nodes", "cores" and "walltime" of each task, by task name,
+        under "tasks"
+    """
+    stat = os.stat(rocoto_xml)
+    key = (stat.st_mtime_ns, stat.st_size)
+    cached = _CACHE.get(rocoto_xml)
+    if cached and cached[0] == key:
+        return cached[1]
+
+    root = ET.parse(rocoto_xml).getroot()
+    groups = {}
+    for cycledef in root.findall("cycledef"):
+        groups.setdefault(cycledef.get("group"), set()).update(cycledef_cycles(cycledef.text))
+    all_cycles = set().union(*groups.values())
+
+    tasks = {}
+    for task in expand_tasks(root):
+        # Tasks without a cycledefs attribute run for the cycles of all cycledefs
+        if task["cycledefs"] is None:
+            cycles = all_cycles
+        else:
+            cycles = set().union(*(groups.get(group.strip(), set())
+                                   for group in task["cycledefs"].split(",")))
+        tasks[task["name"]] = {
+            "cycles": frozenset(cycles),
+            "nodes": task["nodes"],
+            "cores": task["cores"],
+            "walltime": task["walltime"],
+        }
+
+    workflow = {"cycledefs": groups, "tasks": tasks}
+    _CACHE[rocoto_xml] = (key, workflow)
+    return workflow
+
+
+def expected_tasks(rocoto_xml):
+    """The full set of tasks of all cycles of a rocoto XML, named
+    TASKNAME_CYCLE"""
+    workflow = read_workflow(rocoto_xml)
+    if "expected" not in workflow:
+        workflow["expected"] = frozenset(f"{name}_{cycle}"
+                                         for name, task in workflow["tasks"].items()
+                                         for cycle in task["cycles"])
+    return workflow["expected"]
+
+
+def workflow_size(rocoto_xml):
+    """Measures a rocoto XML and estimates what reading it costs rocotorun
+
+    Each rocotorun reads the whole XML and expands its metatasks, then, for
+    each active cycle (at most cyclethrottle of them), looks up the state of
+    each task of the cycle and evaluates its dependencies.  That work is
+    counted as one evaluation per task and cycle plus one per element of its
+    dependency.  The time taken to parse the XML and expand its metatasks
+    here is measured as well, as a lower bound of rocotorun's own.
+
+    Args:
+        rocoto_xml (str): Path of the rocoto XML
+    Returns:
+        dict with the "bytes" of the XML, the number of "task_defs" and
+        "metatask_defs" in it, of "tasks" once metatasks are expanded, of
+        "cycles", of "jobs" (tasks over all their cycles), of "evaluations"
+        per rocotorun, and the "parse_seconds"
+    """
+    start = time.perf_counter()
+    root = ET.parse(rocoto_xml).getroot()
+    tasks = expand_tasks(root)
+    parse_seconds = time.perf_counter() - start
+
+    workflow = read_workflow(rocoto_xml)
+    all_cycles = set().union(*workflow["cycledefs"].values())
+    throttle = int(root.get("cyclethrottle") or 0) or len(all_cycles)
+    evaluations = 0
+    for task in tasks:
+        cycles = len(workflow["tasks"][task["name"]]["cycles"])
+        evaluations += min(cycles, throttle) * (1 + task["dependencies"])
+    return {
+        "bytes": os.path.getsize(rocoto_xml),
+        "task_defs": len(root.findall(".//task")),
+        "metatask_defs": len(root.findall(".//metatask")),
+        "tasks": len(tasks),
+        "cycles": len(all_cycles),
+        "jobs": len(expected_tasks(rocoto_xml)),
+        "evaluations": evaluations,
+        "parse_seconds": parse_seconds,
+    }
+
+
+def size_summary(size):
+    """One line summary of the measures of workflow_size()"""
+    return (f"{size['bytes']:,} bytes, {size['tasks']:,} tasks from {size['task_defs']} task "
+            f"and {size['metatask_defs']} metatask definitions, {size['jobs']:,} jobs "
+            f"over {size['cycles']} cycles, {size['evaluations']:,} dependency "
+            f"evaluations per rocotorun, parsed in {size['parse_seconds']:.2f} s")
+
+
+def parse_args(argv):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="List the tasks of rocoto workflow XMLs.")
+    parser.add_argument(
+        "-w", "--workflow",
+        dest="workflow",
+        nargs="+",
+        required=True,
+        help="Paths to the rocoto workflow XMLs.",
+    )
+    parser.add_argument(
+        "--size",
+        action="store_true",
+        help="Report the size of each XML and the cost of reading it instead.",
+    )
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    for xml_fp in args.workflow:
+        if args.size:
+            print(f"{xml_fp}: {size_summary(workflow_size(xml_fp))}")
+            continue
+        wflow = read_workflow(xml_fp)
+        for name, info in wflow["tasks"].items():
+            print(f"{name:40} {len(info['cycles']):6d} cycles  nodes={info['nodes']} "
+                  f"cores={info['cores']} walltime={info['walltime']}")
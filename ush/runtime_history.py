@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+
+"""
+Persistent history of the runtimes of the tasks of experiments, kept in a
+SQLite database shared by all runs. Each experiment is recorded from its
+rocoto database, together with its grid, grid size, forecast length and
+physics suite, the nodes and cores of each task, and, when the experiment was followed by the WE2E
+monitor, how long each job waited in the queue. The quantities its cost depends on (see
+calculate_cost.experiment_params()) are recorded as well, for the cost model of cost_model.py.
+
+The WE2E monitor_jobs.py and WE2E_summary.py scripts record their
+experiments when asked to, with their --history_db option or by setting
+SRW_RUNTIME_HISTORY_DB; any experiment can be recorded, and the history
+queried, from the command line:
+
+    python3 runtime_history.py record EXPTDIR [EXPTDIR ...]
+    python3 runtime_history.py query --task 'run_fcst*' --grid RRFS_CONUS_25km
+"""
+
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+from contextlib import closing
+from datetime import datetime, timezone
+from xml.etree.ElementTree import ParseError
+
+from jinja2.exceptions import UndefinedError
+
+from calculate_cost import experiment_params
+from python_utils import load_yaml_config
+from rocoto_xml import read_workflow
+
+DEFAULT_HISTORY_DB = os.environ.get(
+    "SRW_RUNTIME_HISTORY_DB",
+    os.path.join(os.path.expanduser("~"), ".srw_runtime_history.db"),
+)
+# The WE2E scripts keep no history unless given a database, or SRW_RUNTIME_HISTORY_DB is set
+WE2E_HISTORY_DB = os.environ.get("SRW_RUNTIME_HISTORY_DB", "")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS experiments (
+    id INTEGER PRIMARY KEY,
+    expt_dir TEXT NOT NULL,
+    run TEXT NOT NULL,
+    test TEXT,
+    grid TEXT,
+    suite TEXT,
+    grid_points INTEGER,
+    fcst_len_hrs REAL,
+    levels INTEGER,
+    dt_atmos REAL,
+    cycles INTEGER,
+    fcst_hrs REAL,
+    members INTEGER,
+    outputs_per_hr REAL,
+    fcst_mpi_tasks INTEGER,
+    fcst_write_tasks INTEGER,
+    fcst_threads INTEGER,
+    status TEXT,
+    walltime REAL,
+    recorded TEXT,
+    UNIQUE (expt_dir, run)
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    experiment INTEGER NOT NULL REFERENCES experiments (id),
+    task TEXT NOT NULL,
+    cycle TEXT NOT NULL,
+    nodes INTEGER,
+    cores INTEGER,
+    walltime REAL,
+    queue_wait REAL,
+    state TEXT,
+    tries INTEGER,
+    PRIMARY KEY (experiment, task, cycle)
+);
+CREATE INDEX IF NOT EXISTS tasks_by_name ON tasks (task);
+"""
+
+# Columns added to the experiments table after it was first created
+ADDED_COLUMNS = {"grid_points": "INTEGER", "fcst_len_hrs": "REAL", "levels": "INTEGER",
+                 "dt_atmos": "REAL", "cycles": "INTEGER", "fcst_hrs": "REAL",
+                 "members": "INTEGER", "outputs_per_hr": "REAL", "fcst_mpi_tasks": "INTEGER",
+                 "fcst_write_tasks": "INTEGER", "fcst_threads": "INTEGER"}
+
+# The quantities of calculate_cost.experiment_params() kept with each
+# experiment, besides its grid_points and suite (whether it is verified shows
+# in its jobs)
+PARAM_COLUMNS = ["levels", "dt_atmos", "cycles", "fcst_hrs", "members", "outputs_per_hr",
+                 "fcst_mpi_tasks", "fcst_write_tasks", "fcst_threads"]
+
+
+def percentile(values, pct):
+    """Percentile of a list of values, interpolating linearly between the
+    closest ranks; None for an empty list"""
+    values = sorted(values)
+    if not values:
+        return None
+    rank = (len(values) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+class RuntimeHistory:
+    """The runtime history database
+
+    Args:
+        db_path (str): Path of the SQLite database, created if needed
+    """
+
+    def __init__(self, db_path=DEFAULT_HISTORY_DB):
+        db_dir = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(db_dir, exist_ok=True)
+        # Several monitors may record experiments at the same time
+        self.connection = sqlite3.connect(db_path, timeout=60)
+        self.connection.executescript(SCHEMA)
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(experiments)")]
+        for column, column_type in ADDED_COLUMNS.items():
+            if column not in columns:
+                with self.connection:
+                    self.connection.execute(
+                        f"ALTER TABLE experiments ADD COLUMN {column} {column_type}")
+
+    def close(self):
+        """Closes the database"""
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def record(self, expt_dir, run, tasks, test=None, grid=None, suite=None, status=None,
+               walltime=None, grid_points=None, fcst_len_hrs=None, params=None):
+        """Records a run of an experiment, replacing what was recorded for
+        the same run before; a queue wait or walltime that is not known now
+        leaves the recorded one in place
+
+        Args:
+            expt_dir  (str): The experiment directory
+            run       (str): Identifies this run of the experiment
+            tasks    (list): Dictionaries with the "task", "cycle", "nodes",
+                             "cores", "walltime", "queue_wait", "state" and
+                             "tries" of each job
+            test      (str): Name of the test or experiment
+            grid      (str): Name of the grid
+            suite     (str): Name of the physics suite
+            status    (str): Status of the experiment
+            walltime (float): Time from the start of the first cycle to the
+                              end of the last, in seconds
+            grid_points  (int): Number of points of the grid (NX * NY)
+            fcst_len_hrs (float): Length of the longest forecast, in hours
+            params   (dict): The quantities the cost of the experiment depends
+                             on, see calculate_cost.experiment_params()
+        Returns:
+            int: Id of the experiment in the database
+        """
+        recorded = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
+        params = params or {}
+        param_values = [params.get(column) for column in PARAM_COLUMNS]
+        with self.connection:
+            self.connection.execute(
+                f"""INSERT INTO experiments
+                   (expt_dir, run, test, grid, suite, grid_points, fcst_len_hrs, status,
+                    walltime, recorded, {", ".join(PARAM_COLUMNS)})
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?{", ?" * len(PARAM_COLUMNS)})
+                   ON CONFLICT (expt_dir, run) DO UPDATE SET
+                   test = excluded.test, grid = excluded.grid, suite = excluded.suite,
+                   grid_points = excluded.grid_points, fcst_len_hrs = excluded.fcst_len_hrs,
+                   status = coalesce(excluded.status, status),
+                   walltime = coalesce(excluded.walltime, walltime),
+                   recorded = excluded.recorded,
+                   {", ".join(f"{c} = excluded.{c}" for c in PARAM_COLUMNS)}""",
+                (expt_dir, run, test, grid, suite, grid_points, fcst_len_hrs, status, walltime,
+                 recorded, *param_values),
+            )
+            expt_id = self.connection.execute(
+                "SELECT id FROM experiments WHERE expt_dir = ? AND run = ?", (expt_dir, run)
+            ).fetchone()[0]
+            self.connection.executemany(
+                """INSERT INTO tasks
+                   (experiment, task, cycle, nodes, cores, walltime, queue_wait, state, tries)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (experiment, task, cycle) DO UPDATE SET
+                   nodes = excluded.nodes, cores = excluded.cores,
+                   walltime = excluded.walltime, state = excluded.state,
+                   tries = excluded.tries,
+                   queue_wait = coalesce(excluded.queue_wait, queue_wait)""",
+                [(expt_id, t["task"], t["cycle"], t.get("nodes"), t.get("cores"),
+                  t.get("walltime"), t.get("queue_wait"), t.get("state"), t.get("tries"))
+                 for t in tasks],
+            )
+        return expt_id
+
+    def task_values(self, column="walltime", task=None, test=None, grid=None, suite=None,
+                    state="SUCCEEDED"):
+        """Recorded values of a column of the tasks table (walltime, queue_wait,
+        cores, ...) for the jobs matching the given filters; task and test
+        are glob patterns, e.g. "run_post_*"
+
+        Returns:
+            list of the values that are known
+        """
+        if column not in ["walltime", "queue_wait", "nodes", "cores", "tries"]:
+            raise ValueError(f"Invalid column {column}")
+        query = (f"SELECT t.{column} FROM tasks t JOIN experiments e ON t.experiment = e.id "
+                 f"WHERE t.{column} IS NOT NULL")
+        params = []
+        for condition, value in (("t.task GLOB ?", task), ("e.test GLOB ?", test),
+                                 ("e.grid = ?", grid), ("e.suite = ?", suite),
+                                 ("t.state = ?", state)):
+            if value is not None:
+                query += f" AND {condition}"
+                params.append(value)
+        with closing(self.connection.execute(query, params)) as cur:
+            return [row[0] for row in cur]
+
+    def task_percentiles(self, percentiles, column="walltime", **filters):
+        """Percentiles of the recorded values of a column of the tasks table;
+        see task_values() for the filters
+
+        Returns:
+            list with the value of each percentile, or None where nothing
+            matching was recorded
+        """
+        values = self.task_values(column, **filters)
+        return [percentile(values, pct) for pct in percentiles]
+
+    def task_runs(self, state="SUCCEEDED"):
+        """The jobs in the given state, with the size of their experiment
+
+        Returns:
+            list of (task, walltime, nodes, grid_points, fcst_len_hrs) tuples
+        """
+        with closing(self.connection.execute(
+                "SELECT t.task, t.walltime, t.nodes, e.grid_points, e.fcst_len_hrs "
+                "FROM tasks t JOIN experiments e ON t.experiment = e.id "
+                "WHERE t.walltime IS NOT NULL AND t.state = ?", (state,))) as cur:
+            return cur.fetchall()
+
+    def experiment_core_seconds(self, categories, status="COMPLETE"):
+        """Core-seconds (cores times walltime) used by the successful jobs of
+        each category of tasks in each recorded run, with the quantities its
+        cost depends on; only runs recorded with those quantities are given
+
+        Args:
+            categories (dict): Glob patterns of the task names of each
+                               category, e.g. {"post": ["run_post_*"]}
+            status      (str): Status of the runs
+        Returns:
+            list of (params, core_seconds) tuples: the quantities of
+            calculate_cost.experiment_params(), and the core-seconds of each
+            category, None where a job of the category has no cores recorded
+        """
+        runs = []
+        with closing(self.connection.execute(
+                f"SELECT id, grid_points, suite, {', '.join(PARAM_COLUMNS)} FROM experiments "
+                "WHERE status = ? AND levels IS NOT NULL AND grid_points IS NOT NULL",
+                (status,))) as cur:
+            for expt_id, grid_points, suite, *values in cur:
+                params = {"grid_points": grid_points, "suite": suite,
+                          **dict(zip(PARAM_COLUMNS, values))}
+                core_seconds = {}
+                for category, patterns in categories.items():
+                    glob_any = " OR ".join("task GLOB ?" for _ in patterns)
+                    total, unknown = self.connection.execute(
+                        "SELECT coalesce(sum(walltime * cores), 0), count(*) - count(cores) "
+                        f"FROM tasks WHERE experiment = ? AND state = 'SUCCEEDED' "
+                        f"AND walltime IS NOT NULL AND ({glob_any})",
+                        (expt_id, *patterns)).fetchone()
+                    core_seconds[category] = None if unknown else total
+                runs.append((params, core_seconds))
+        return runs
+
+    def experiment_walltimes(self, pct=50, status="COMPLETE"):
+        """A percentile of the walltimes of the recorded runs of each test
+
+        Returns:
+            dict: Walltime in seconds by test name
+        """
+        walltimes = {}
+        with closing(self.connection.execute(
+                "SELECT test, walltime FROM experiments "
+                "WHERE walltime IS NOT NULL AND status = ?", (status,))) as cur:
+            for test, walltime in cur:
+                walltimes.setdefault(test, []).append(walltime)
+        return {test: percentile(values, pct) for test, values in walltimes.items()}
+
+
+def _experiment_status(states):
+    """Status of an experiment from the states of its jobs, as in the WE2E
+    monitor"""
+    if "DEAD" in states:
+        return "DEAD"
+    if states and all(state == "SUCCEEDED" for state in states):
+        return "COMPLETE"
+    return "RUNNING"
+
+
+def record_experiment(history, expt_dir, test=None, status=None, queue_waits=None):
+    """Records the jobs of an experiment from its rocoto database
+
+    Args:
+        history (RuntimeHistory): The history database
+        expt_dir           (str): The experiment directory
+        test               (str): Name of the test; by default the name of the
+                                  experiment directory
+        status             (str): Status of the experiment; by default it is
+                                  derived from the states of its jobs
+        queue_waits       (dict): Seconds each job waited in the queue, by
+                                  TASKNAME_CYCLE
+    Returns:
+        int: Id of the experiment in the history, or None if no job has been
+             submitted yet
+    """
+    expt_dir = os.path.abspath(expt_dir)
+    cfg = load_yaml_config(os.path.join(expt_dir, "var_defns.yaml"))
+    workflow = cfg["workflow"]
+    wflow_xml = os.path.join(expt_dir, workflow.get("WFLOW_XML_FN", "FV3LAM_wflow.xml"))
+    rocoto_db = f"{os.path.splitext(wflow_xml)[0]}.db"
+
+    with closing(sqlite3.connect(f"file:{rocoto_db}?mode=ro", uri=True)) as db:
+        jobs = db.execute(
+            "SELECT jobid, taskname, cycle, cores, state, tries, duration FROM jobs ORDER BY id"
+        ).fetchall()
+        first_cycle, last_cycle, num_cycles, num_done = db.execute(
+            "SELECT min(activated), max(done), count(*), count(done) FROM cycles"
+        ).fetchone()
+        first_activated = db.execute(
+            "SELECT activated FROM cycles ORDER BY id LIMIT 1").fetchone()
+    if not jobs:
+        return None
+
+    try:
+        xml_tasks = read_workflow(wflow_xml)["tasks"]
+    except (OSError, ValueError, ParseError) as e:
+        logging.debug(f"Could not read the tasks of {wflow_xml}: {e}")
+        xml_tasks = {}
+
+    queue_waits = queue_waits or {}
+    tasks = []
+    for _, taskname, cycle, cores, state, tries, duration in jobs:
+        cycle = datetime.fromtimestamp(cycle, timezone.utc).strftime("%Y%m%d%H%M")
+        tasks.append({
+            "task": taskname,
+            "cycle": cycle,
+            "nodes": xml_tasks.get(taskname, {}).get("nodes"),
+            "cores": cores,
+            "walltime": duration,
+            "queue_wait": queue_waits.get(f"{taskname}_{cycle}"),
+            "state": state,
+            "tries": tries,
+        })
+
+    walltime = None
+    if num_cycles and num_done == num_cycles and first_cycle is not None:
+        walltime = last_cycle - first_cycle
+
+    grid_params = cfg.get("grid_params", {})
+    grid_points = None
+    if grid_params.get("NX") and grid_params.get("NY"):
+        grid_points = int(grid_params["NX"]) * int(grid_params["NY"])
+    fcst_len_hrs = workflow.get("LONG_FCST_LEN", workflow.get("FCST_LEN_HRS"))
+    try:
+        params = experiment_params(cfg)
+    except (KeyError, TypeError, ValueError, UndefinedError) as e:
+        logging.debug(f"Could not get the cost parameters of {expt_dir}: {e}")
+        params = None
+
+    # The time the first cycle was activated tells apart runs in the same
+    # directory; unlike job ids, it does not change when tasks are retried
+    if first_activated and first_activated[0] is not None:
+        run = str(first_activated[0])
+    else:
+        run = str(jobs[0][0])
+    return history.record(
+        expt_dir,
+        run=run,
+        tasks=tasks,
+        test=test or os.path.basename(expt_dir),
+        grid=workflow.get("PREDEF_GRID_NAME"),
+        suite=workflow.get("CCPP_PHYS_SUITE"),
+        status=status or _experiment_status([task["state"] for task in tasks]),
+        walltime=walltime,
+        grid_points=grid_points,
+        fcst_len_hrs=float(fcst_len_hrs) if fcst_len_hrs is not None else None,
+        params=params,
+    )
+
+
+def parse_args(argv):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Record and query the runtimes of tasks.")
+    parser.add_argument(
+        "--db",
+        default=DEFAULT_HISTORY_DB,
+        help="Path to the history database.",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record = subparsers.add_parser("record", help="Record experiments.")
+    record.add_argument("expt_dirs", nargs="+", help="Experiment directories.")
+
+    query = subparsers.add_parser("query", help="Print percentiles of task runtimes.")
+    query.add_argument("--column", default="walltime",
+                       choices=["walltime", "queue_wait", "nodes", "cores", "tries"],
+                       help="The quantity to summarize.")
+    query.add_argument("--task", help="Task name, or a glob pattern of task names.")
+    query.add_argument("--test", help="Test name, or a glob pattern of test names.")
+    query.add_argument("--grid", help="Grid name.")
+    query.add_argument("--suite", help="Physics suite name.")
+    query.add_argument("--percentiles", type=float, nargs="+", default=[50, 90, 100],
+                       help="Percentiles to print.")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    args = parse_args(sys.argv[1:])
+    with RuntimeHistory(args.db) as hist:
+        if args.command == "record":
+            for expt in args.expt_dirs:
+                if record_experiment(hist, expt) is None:
+                    logging.info(f"No jobs to record in {expt}")
+        else:
+            values = hist.task_values(args.column, task=args.task, test=args.test,
+                                      grid=args.grid, suite=args.suite)
+            print(f"{len(values)} jobs")
+            for pct in args.percentiles:
+                print(f"  p{pct:g}: {percentile(values, pct)}")
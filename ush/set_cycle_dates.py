@@ -32,3 +32,18 @@ def set_cycle_dates(date_start, date_end, incr_cycl_freq):
         all_cdates.append(cyc)
         cdate += freq_delta
     return all_cdates
+
+
+def all_cycle_dates(expt_config):
+    """All cycles of an experiment, given its configuration, as YYYYMMDDHH
+    strings. The first and last cycle dates may be datetime objects or
+    YYYYMMDDHH strings, as in the var_defns file."""
+
+    workflow = expt_config["workflow"]
+    dates = []
+    for key in ("DATE_FIRST_CYCL", "DATE_LAST_CYCL"):
+        date = workflow[key]
+        if not isinstance(date, datetime):
+            date = datetime.strptime(str(date), "%Y%m%d%H")
+        dates.append(date)
+    return set_cycle_dates(dates[0], dates[1], int(workflow["INCR_CYCL_FREQ"]))
@@ -2,23 +2,140 @@
 
 """
 Updates stochastic physics parameters in the namelist based on user configuration settings.
+
+The seeds of a single member can be set in its run directory, or the namelists
+of all members of one or more cycles can be written at once from a single parse
+of the base stochastic namelist.
 """
 
 import argparse
 import datetime as dt
+import itertools
 import os
+import shutil
 import sys
 from textwrap import dedent
 
-from uwtools.api.config import get_nml_config, realize
+from uwtools.api.config import get_nml_config
 
 from python_utils import (
     cfg_to_yaml_str,
-    import_vars,
     load_yaml_config,
     print_input_args,
     print_info_msg,
 )
+from nml_patch import NamelistPatcher, NmlPatchError, patch_nml_file
+from set_cycle_dates import all_cycle_dates
+
+# Directory in EXPTDIR holding the pregenerated namelists of all members,
+# and the largest number of them that is pregenerated
+ENS_STOCH_NML_DIRNAME = "ens_stoch_nml"
+MAX_PREGEN_ENS_STOCH_NMLS = 2000
+
+# Offsets added to the (cycle, member) seed base for each stochastic scheme
+SEED_OFFSETS = {
+    "iseed_sppt": 1,
+    "iseed_shum": 2,
+    "iseed_skeb": 3,
+    "iseed_lndp": 9,
+}
+
+
+def ens_stoch_seed_settings(cdates, ensmem_nums, global_cfg):
+    """Computes the namelist settings holding the stochastic seeds of every
+    combination of cycle and ensemble member.  The settings are assembled once,
+    and only the seed values are computed for each (cycle, member) pair.
+
+    Args:
+        cdates       (list): Cycles, as datetime objects or YYYYMMDDHH strings
+        ensmem_nums  (list): Ensemble member numbers
+        global_cfg   (dict): The "global" section of the experiment configuration
+    Returns:
+        dict mapping each (YYYYMMDDHH, member number) pair to its settings
+    """
+
+    cdate_strs = [
+        c if isinstance(c, str) else c.strftime("%Y%m%d%H") for c in cdates
+    ]
+    pairs = list(itertools.product(cdate_strs, ensmem_nums))
+    bases = [int(cdate) * 1000 + int(mem) * 10 for cdate, mem in pairs]
+
+    # Offsets of every seed in the namelist, by group and variable
+    offsets = {"nam_stochy": {}, "nam_sppperts": {}}
+    for flag, var in (("DO_SPPT", "iseed_sppt"), ("DO_SHUM", "iseed_shum"),
+                      ("DO_SKEB", "iseed_skeb")):
+        if global_cfg[flag]:
+            offsets["nam_stochy"][var] = SEED_OFFSETS[var]
+    if global_cfg["DO_SPP"]:
+        offsets["nam_sppperts"]["iseed_spp"] = list(global_cfg["ISEED_SPP"])
+    if global_cfg["DO_LSM_SPP"]:
+        offsets["nam_sfcperts"] = {"iseed_lndp": [SEED_OFFSETS["iseed_lndp"]]}
+
+    all_settings = {}
+    for pair, base in zip(pairs, bases):
+        all_settings[pair] = {
+            group: {
+                var: [base + o for o in off] if isinstance(off, list) else base + off
+                for var, off in group_offsets.items()
+            }
+            for group, group_offsets in offsets.items()
+        }
+    return all_settings
+
+
+def ens_stoch_nml_fn(fv3_nml_fn, cdate, ensmem_num):
+    """Name of the pregenerated namelist of a member, as looked for by the
+    forecast task"""
+
+    return f"{fv3_nml_fn}.{cdate}.mem{int(ensmem_num):03d}"
+
+
+def write_ens_stoch_nmls(cdates, expt_config, outdir, base_nml_fp=None):
+    """Writes the namelists of all members for the given cycles, parsing the
+    base stochastic namelist only once. Only the seed lines differ between
+    the namelists, unless they cannot be patched in place.
+
+    Args:
+        cdates       (list): Cycles, as datetime objects or YYYYMMDDHH strings
+        expt_config  (dict): The experiment configuration
+        outdir        (str): Directory for the namelists
+        base_nml_fp   (str): Base namelist; defaults to FV3_NML_STOCH_FP
+    Returns:
+        list of paths of the namelists written
+    """
+
+    global_cfg = expt_config["global"]
+    fv3_nml_fn = expt_config["workflow"]["FV3_NML_FN"]
+    if base_nml_fp is None:
+        base_nml_fp = expt_config["workflow"]["FV3_NML_STOCH_FP"]
+
+    ensmem_nums = range(1, int(global_cfg["NUM_ENS_MEMBERS"]) + 1)
+    all_settings = ens_stoch_seed_settings(cdates, ensmem_nums, global_cfg)
+
+    # Namelists of an earlier generation (other cycles or members) may no
+    # longer be valid
+    shutil.rmtree(outdir, ignore_errors=True)
+    os.makedirs(outdir)
+    patcher = NamelistPatcher.from_file(base_nml_fp)
+    nml = None
+    paths = []
+    for (cdate, mem), settings in all_settings.items():
+        path = os.path.join(outdir, ens_stoch_nml_fn(fv3_nml_fn, cdate, mem))
+        paths.append(path)
+        if nml is None:
+            try:
+                text = patcher.patch(settings)
+            except NmlPatchError:
+                nml = get_nml_config(base_nml_fp)
+            else:
+                with open(path, "w", encoding="utf-8") as nml_file:
+                    nml_file.write(text)
+                continue
+        # Every member sets the same keys, so the previous member's values
+        # are simply overwritten
+        nml.update_values(settings)
+        nml.dump(path)
+    return paths
 
 
 def set_fv3nml_ens_stoch_seeds(cdate, expt_config):
@@ -45,10 +162,6 @@ def set_fv3nml_ens_stoch_seeds(cdate, expt_config):
     fv3_nml_fn = expt_config["workflow"]["FV3_NML_FN"]
     verbose = expt_config["workflow"]["VERBOSE"]
 
-    # set variables important to this function from the experiment definition
-    import_vars(dictionary=expt_config["global"])
-    # pylint: disable=undefined-variable
-
     #
     # -----------------------------------------------------------------------
     #
@@ -61,39 +174,9 @@ def set_fv3nml_ens_stoch_seeds(cdate, expt_config):
 
     ensmem_num = int(os.environ["ENSMEM_INDX"])
 
-    cdate_i = int(cdate.strftime("%Y%m%d%H"))
-
-    settings = {}
-    nam_stochy_dict = {}
-
-    if DO_SPPT:
-        iseed_sppt = cdate_i * 1000 + ensmem_num * 10 + 1
-        nam_stochy_dict.update({"iseed_sppt": iseed_sppt})
-
-    if DO_SHUM:
-        iseed_shum = cdate_i * 1000 + ensmem_num * 10 + 2
-        nam_stochy_dict.update({"iseed_shum": iseed_shum})
-
-    if DO_SKEB:
-        iseed_skeb = cdate_i * 1000 + ensmem_num * 10 + 3
-        nam_stochy_dict.update({"iseed_skeb": iseed_skeb})
-
-    settings["nam_stochy"] = nam_stochy_dict
-
-    if DO_SPP:
-        num_iseed_spp = len(ISEED_SPP)
-        iseed_spp = [None] * num_iseed_spp
-        for i in range(num_iseed_spp):
-            iseed_spp[i] = cdate_i * 1000 + ensmem_num * 10 + ISEED_SPP[i]
-
-        settings["nam_sppperts"] = {"iseed_spp": iseed_spp}
-    else:
-        settings["nam_sppperts"] = {}
-
-    if DO_LSM_SPP:
-        iseed_lsm_spp = cdate_i * 1000 + ensmem_num * 10 + 9
-
-        settings["nam_sfcperts"] = {"iseed_lndp": [iseed_lsm_spp]}
+    settings = ens_stoch_seed_settings([cdate], [ensmem_num], expt_config["global"])[
+        (cdate.strftime("%Y%m%d%H"), ensmem_num)
+    ]
 
     print_info_msg(
         dedent(
@@ -107,13 +190,7 @@ def set_fv3nml_ens_stoch_seeds(cdate, expt_config):
         ),
         verbose=verbose,
     )
-    realize(
-        input_config=fv3_nml_ensmem_fp,
-        input_format="nml",
-        output_file=fv3_nml_ensmem_fp,
-        output_format="nml",
-        update_config=get_nml_config(settings),
-        )
+    patch_nml_file(fv3_nml_ensmem_fp, settings)
 
 def parse_args(argv):
     """Parse command line arguments"""
@@ -124,7 +201,7 @@ def parse_args(argv):
     parser.add_argument(
         "-c", "--cdate",
         dest="cdate",
-        required=True,
+        required=False,
         type=lambda d: dt.datetime.strptime(d, '%Y%m%d%H'),
         help="Date.",
     )
@@ -137,10 +214,24 @@ def parse_args(argv):
         help="Path to var_defns file.",
     )
 
-    return parser.parse_args(argv)
+    parser.add_argument(
+        "-o", "--outdir",
+        dest="outdir",
+        help="Write the namelists of all ensemble members to this directory, "
+        "for the given cycle or, without --cdate, for all cycles.",
+    )
+
+    parsed = parser.parse_args(argv)
+    if not parsed.cdate and not parsed.outdir:
+        parser.error("--cdate is required unless --outdir is given")
+    return parsed
 
 
 if __name__ == "__main__":
     args = parse_args(sys.argv[1:])
     cfg = load_yaml_config(args.path_to_defns)
-    set_fv3nml_ens_stoch_seeds(args.cdate, cfg)
+    if args.outdir:
+        cycles = [args.cdate] if args.cdate else all_cycle_dates(cfg)
+        write_ens_stoch_nmls(cycles, cfg, args.outdir)
+    else:
+        set_fv3nml_ens_stoch_seeds(args.cdate, cfg)
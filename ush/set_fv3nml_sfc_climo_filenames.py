@@ -10,7 +10,7 @@ import re
 import sys
 from textwrap import dedent
 
-from uwtools.api.config import get_nml_config, get_yaml_config, realize
+from uwtools.api.config import get_yaml_config
 
 from python_utils import (
     cfg_to_yaml_str,
@@ -20,6 +20,7 @@ from python_utils import (
     load_yaml_config,
     print_info_msg,
 )
+from nml_patch import patch_nml_file
 
 VERBOSE = os.environ.get("VERBOSE", "true")
 
@@ -100,13 +101,7 @@ def set_fv3nml_sfc_climo_filenames(config, debug=False):
         verbose=debug,
     )
 
-    realize(
-        input_config=FV3_NML_FP,
-        input_format="nml",
-        output_file=FV3_NML_FP,
-        output_format="nml",
-        update_config=get_nml_config(settings),
-        )
+    patch_nml_file(FV3_NML_FP, settings)
 
 def parse_args(argv):
     """Parse command line arguments"""
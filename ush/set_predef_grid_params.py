@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 
 import os
+from copy import deepcopy
+from functools import lru_cache
 from textwrap import dedent
 
 from python_utils import (
@@ -9,6 +11,20 @@ from python_utils import (
 )
 
 
+@lru_cache(maxsize=None)
+def load_predef_grids(USHdir):
+    """Loads predef_grid_params.yaml once per process
+
+    Args:
+        USHdir:      path to the SRW ush directory
+    Returns:
+        Dictionary of the parameters of each predefined grid, by grid name;
+        it is shared, so callers must not modify it
+    """
+
+    return load_config_file(os.path.join(os.path.abspath(USHdir), "predef_grid_params.yaml"))
+
+
 def set_predef_grid_params(USHdir, grid_name, quilting):
     """Sets grid parameters for the specified predefined grid
 
@@ -20,9 +36,8 @@ def set_predef_grid_params(USHdir, grid_name, quilting):
         Dictionary of grid parameters
     """
 
-    params_dict = load_config_file(os.path.join(USHdir, "predef_grid_params.yaml"))
     try:
-        params_dict = params_dict[grid_name]
+        params_dict = deepcopy(load_predef_grids(USHdir)[grid_name])
     except KeyError:
         errmsg = dedent(
             f"""
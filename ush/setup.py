@@ -44,6 +44,8 @@ from set_predef_grid_params import set_predef_grid_params
 from set_gridparams_ESGgrid import set_gridparams_ESGgrid
 from set_gridparams_GFDLgrid import set_gridparams_GFDLgrid
 from link_fix import link_fix
+from check_param_vals import check_param_vals
+from task_sizing import apply_task_sizing
 
 def load_config_for_setup(ushdir, default_config, user_config):
     """Load in the default, machine, and user configuration files into
@@ -52,7 +54,8 @@ def load_config_for_setup(ushdir, default_config, user_config):
     Args:
       ushdir             (str): Path to the ush directory for SRW
       default_config     (str): Path to the default config YAML
-      user_config        (str): Path to the user-provided config YAML
+      user_config   (str|dict): Path to the user-provided config YAML, or
+                                the already-loaded user config dictionary
 
     Returns:
       Python dict of configuration settings from YAML files.
@@ -66,7 +69,12 @@ def load_config_for_setup(ushdir, default_config, user_config):
 
     # Load the user config file, then ensure all user-specified
     # variables correspond to a default value.
-    if not os.path.exists(user_config):
+    if isinstance(user_config, dict):
+        cfg_u = copy.deepcopy(user_config)
+        user_config = "(user config dictionary)"
+        logging.debug(f"Using the following values from the user config dictionary:\n")
+        logging.debug(cfg_u)
+    elif not os.path.exists(user_config):
         raise FileNotFoundError(
             f"""
             User config file not found:
@@ -74,18 +82,19 @@ def load_config_for_setup(ushdir, default_config, user_config):
             """
         )
 
-    try:
-        cfg_u = load_config_file(user_config)
-        logging.debug(f"Read in the following values from YAML config file {user_config}:\n")
-        logging.debug(cfg_u)
-    except:
-        errmsg = dedent(
-            f"""\n
-            Could not load YAML config file:  {user_config}
-            Reference the above traceback for more information.
-            """
-        )
-        raise Exception(errmsg)
+    else:
+        try:
+            cfg_u = load_config_file(user_config)
+            logging.debug(f"Read in the following values from YAML config file {user_config}:\n")
+            logging.debug(cfg_u)
+        except:
+            errmsg = dedent(
+                f"""\n
+                Could not load YAML config file:  {user_config}
+                Reference the above traceback for more information.
+                """
+            )
+            raise Exception(errmsg)
 
     # Make sure the keys in user config match those in the default
     # config.
@@ -355,7 +364,9 @@ def setup(USHdir, user_config_fn="config.yaml", debug: bool = False):
     Args:
       USHdir          (str): The full path of the ush/ directory where
                              this script is located
-      user_config_fn  (str): The name of a user-provided config YAML
+      user_config_fn  (str|dict): The name of a user-provided config YAML
+                             in USHdir, a full path to one, or the user
+                             config dictionary itself
       debug          (bool): Enable extra output for debugging
 
     Returns:
@@ -375,7 +386,11 @@ def setup(USHdir, user_config_fn="config.yaml", debug: bool = False):
     # Create a dictionary of config options from defaults, machine, and
     # user config files.
     default_config_fp = os.path.join(USHdir, "config_defaults.yaml")
-    user_config_fp = os.path.join(USHdir, user_config_fn)
+    if isinstance(user_config_fn, dict):
+        user_config_fp = user_config_fn
+        user_config_fn = "(user config dictionary)"
+    else:
+        user_config_fp = os.path.join(USHdir, user_config_fn)
     expt_config = load_config_for_setup(USHdir, default_config_fp, user_config_fp)
 
     # Set up some paths relative to the SRW clone
@@ -874,6 +889,35 @@ def setup(USHdir, user_config_fn="config.yaml", debug: bool = False):
     # Add a grid parameter section to the experiment config
     expt_config["grid_params"] = grid_params
 
+    #
+    # -----------------------------------------------------------------------
+    #
+    # Size the walltimes of the tasks from their measured runtimes, if a
+    # sizing file written by task_sizing.py is given.  Settings in the rocoto
+    # section of the user config are kept.
+    #
+    # -----------------------------------------------------------------------
+    #
+    task_sizing_fp = workflow_config.get("TASK_SIZING_FP")
+    if task_sizing_fp:
+        if not os.path.exists(task_sizing_fp):
+            raise FileNotFoundError(
+                f"\nTASK_SIZING_FP = {task_sizing_fp} does not exist\n"
+            )
+        if isinstance(user_config_fp, dict):
+            user_rocoto = user_config_fp.get("rocoto", {})
+        else:
+            user_rocoto = load_config_file(user_config_fp).get("rocoto", {})
+        longest_fcst = max(fcst_len_cycl) if fcst_len_hrs == -1 else fcst_len_hrs
+        sized = apply_task_sizing(
+            rocoto_config["tasks"],
+            load_config_file(task_sizing_fp) or {},
+            grid_params["NX"] * grid_params["NY"],
+            longest_fcst,
+            protected=(user_rocoto or {}).get("tasks"),
+        )
+        logging.info(f"Sized the walltimes of {len(sized)} tasks from {task_sizing_fp}")
+
     # Check to make sure that mandatory forecast variables are set.
     vlist = [
         "DT_ATMOS",
@@ -1132,6 +1176,15 @@ def setup(USHdir, user_config_fn="config.yaml", debug: bool = False):
                 that this remainder is zero."""
             )
 
+    # Each post task processes a batch of at least one forecast hour
+    post_fhr_batch_size = post_config.get("POST_FHR_BATCH_SIZE")
+    if not isinstance(post_fhr_batch_size, int) or post_fhr_batch_size < 1:
+        raise ValueError(
+            f"""
+            POST_FHR_BATCH_SIZE must be an integer greater than or equal to 1:
+              POST_FHR_BATCH_SIZE = \"{post_fhr_batch_size}\""""
+        )
+
     # Make sure the post output domain is set
     predef_grid_name = workflow_config.get("PREDEF_GRID_NAME")
     post_output_domain_name = post_config.get("POST_OUTPUT_DOMAIN_NAME")
@@ -1518,31 +1571,9 @@ def setup(USHdir, user_config_fn="config.yaml", debug: bool = False):
     # -----------------------------------------------------------------------
     #
 
-    # loop through the flattened expt_config and check validity of params
-    cfg_v = load_config_file(os.path.join(USHdir, "valid_param_vals.yaml"))
-    for k, v in flatten_dict(expt_config).items():
-        if v is None or v == "":
-            continue
-        vkey = "valid_vals_" + k
-        if (vkey in cfg_v):
-            if (type(v) == list):
-                if not(all(ele in cfg_v[vkey] for ele in v)):
-                    raise Exception(
-                        dedent(f"""
-                        The variable
-                            {k} = {v}
-                        in the user's configuration has at least one invalid value.  Possible values are:
-                            {k} = {cfg_v[vkey]}"""
-                    ))
-            else:
-                if not (v in cfg_v[vkey]):
-                    raise Exception(
-                        dedent(f"""
-                        The variable
-                            {k} = {v}
-                        in the user's configuration does not have a valid value.  Possible values are:
-                            {k} = {cfg_v[vkey]}"""
-                    ))
+    # check all params of the flattened expt_config at once, reporting every
+    # invalid value
+    check_param_vals(expt_config, os.path.join(USHdir, "valid_param_vals.yaml"))
 
     return expt_config
 
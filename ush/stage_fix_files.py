@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+
+"""
+Native staging of fixed files into an experiment directory. All copy and link
+operations of a group are resolved up front (including glob patterns) and then
+executed with os/shutil calls in a thread pool instead of one shell command per
+file. Copies are made as reflinks or hardlinks where the filesystem allows it,
+and fall back to a regular copy otherwise.
+"""
+
+import errno
+import glob
+import logging
+import os
+import shutil
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+# ioctl request number for cloning a file on Linux (btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+StageOp = namedtuple("StageOp", ["src", "dst", "mode"])
+StageOp.__doc__ = """A single staging operation; mode is "copy" or "link" """
+
+
+def resolve_ops(pairs, mode="copy"):
+    """Expands (source, target) pairs into individual staging operations.
+
+    A source containing glob characters is expanded, and each match is staged
+    into the target, which must then be a directory.  Otherwise the target is
+    the full path of the staged file, unless it is an existing directory.
+
+    Args:
+        pairs (list): (source, target) tuples
+        mode   (str): "copy" or "link"
+    Returns:
+        list of StageOp
+    """
+
+    ops = []
+    for src, dst in pairs:
+        if glob.has_magic(src):
+            matches = sorted(glob.glob(src))
+            if not matches:
+                raise FileNotFoundError(f"No files match the pattern {src}")
+            ops.extend(
+                StageOp(match, os.path.join(dst, os.path.basename(match)), mode)
+                for match in matches
+            )
+        elif os.path.isdir(dst):
+            ops.append(StageOp(src, os.path.join(dst, os.path.basename(src)), mode))
+        else:
+            ops.append(StageOp(src, dst, mode))
+    return ops
+
+
+def _reflink(src, dst):
+    """Clones src to dst with the FICLONE ioctl; returns False if unsupported"""
+
+    if fcntl is None:
+        return False
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            cloned = False
+        else:
+            cloned = True
+    if not cloned:
+        os.remove(dst)
+        return False
+    shutil.copymode(src, dst)
+    return True
+
+
+def place_file(src, dst, mode="copy", hardlink=True):
+    """Places a single file, replacing any existing file at the target
+
+    Args:
+        src       (str): Source file
+        dst       (str): Target path
+        mode      (str): "link" for a symbolic link, "copy" otherwise
+        hardlink (bool): Whether a copy may be made as a hardlink
+    Returns:
+        str: The method used; one of "symlink", "reflink", "hardlink", "copy"
+    """
+
+    if os.path.lexists(dst):
+        if os.path.isdir(dst) and not os.path.islink(dst):
+            shutil.rmtree(dst)
+        else:
+            os.remove(dst)
+
+    if mode == "link":
+        os.symlink(src, dst)
+        return "symlink"
+
+    if _reflink(src, dst):
+        return "reflink"
+    if hardlink and os.stat(src).st_dev == os.stat(os.path.dirname(dst) or ".").st_dev:
+        try:
+            os.link(src, dst)
+            return "hardlink"
+        except OSError as e:
+            # Hardlinks to files owned by others may be forbidden
+            if e.errno not in (errno.EPERM, errno.EACCES, errno.EMLINK, errno.EXDEV):
+                raise
+    shutil.copy(src, dst)
+    return "copy"
+
+
+def stage_files(ops, group="", max_workers=None, hardlink=True, store=None):
+    """Executes staging operations in a thread pool
+
+    Args:
+        ops          (list): StageOp operations, e.g. from resolve_ops
+        group         (str): Name of the group of files, for reporting
+        max_workers   (int): Number of threads; defaults to the
+                             ThreadPoolExecutor default
+        hardlink     (bool): Whether copies may be made as hardlinks
+        store     (FixStore): If given, copies are materialized from this
+                             content-addressed store
+    Returns:
+        dict with the number of files, bytes, seconds, a count of the methods
+        used, and the hashes of the files taken from the store
+    """
+
+    start = time.perf_counter()
+    for target_dir in {os.path.dirname(op.dst) for op in ops}:
+        if target_dir:
+            os.makedirs(target_dir, exist_ok=True)
+
+    def run(op):
+        digest = None
+        if store is not None and op.mode == "copy":
+            method, digest = store.materialize(op.src, op.dst)
+        else:
+            method = place_file(op.src, op.dst, op.mode, hardlink)
+        size = 0 if method == "symlink" else os.stat(op.src).st_size
+        return method, size, digest
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(run, ops))
+
+    stats = {
+        "files": len(results),
+        "bytes": sum(size for _, size, _ in results),
+        "seconds": time.perf_counter() - start,
+        "methods": dict(Counter(method for method, _, _ in results)),
+        "digests": sorted({digest for _, _, digest in results if digest}),
+    }
+    logging.info(
+        f"Staged {stats['files']} {group + ' ' if group else ''}files "
+        f"({stats['bytes'] / 2**20:.1f} MiB) in {stats['seconds']:.2f} s "
+        f"[{', '.join(f'{m}: {n}' for m, n in sorted(stats['methods'].items()))}]"
+    )
+    return stats
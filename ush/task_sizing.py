@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+
+"""
+Sizes the walltimes, and where needed the number of nodes, of workflow tasks
+from their measured runtimes instead of the static values in parm/wflow.
+
+For each task defined in parm/wflow/*.yaml, the successful jobs in the
+runtime history (see runtime_history.py) are fitted with a linear model of
+their runtime in either nothing (a constant), the number of grid points, or
+the number of grid points times the forecast length, whichever fits best.
+The models are written to a sizing file laid out like the rocoto "tasks"
+section:
+
+    python3 task_sizing.py -o task_sizing.yaml [--record EXPTDIR ...]
+
+Setting TASK_SIZING_FP to that file in the workflow section of an
+experiment's configuration makes setup() evaluate the models for the grid and
+forecast length of the experiment and merge the resulting walltimes into its
+rocoto section. Values set in the rocoto section of the user configuration
+are kept.
+"""
+
+import argparse
+import glob
+import logging
+import math
+import os
+import re
+import sys
+from textwrap import dedent
+
+from python_utils import cfg_to_yaml_str, load_config_file
+from runtime_history import DEFAULT_HISTORY_DB, RuntimeHistory, record_experiment
+
+# Candidate models, from the simplest: the quantity the runtime is assumed to
+# grow linearly with, as a function of the number of grid points and the
+# forecast length in hours
+FEATURES = {
+    "constant": lambda grid_points, fcst_len_hrs: 0,
+    "grid_points": lambda grid_points, fcst_len_hrs: grid_points,
+    "grid_points_x_fcst_hrs": lambda grid_points, fcst_len_hrs: grid_points * fcst_len_hrs,
+}
+# A more complex model must fit this much better to be chosen
+MIN_FIT_IMPROVEMENT = 0.1
+MIN_SAMPLES = 3
+
+# The walltime requested is the predicted runtime times WALLTIME_FACTOR plus
+# WALLTIME_PAD, rounded up to WALLTIME_ROUND and between MIN_WALLTIME and
+# MAX_WALLTIME (all in seconds). A task that would need more than MAX_WALLTIME
+# is given more nodes, if its number of nodes is not derived from other
+# settings.
+WALLTIME_FACTOR = 1.5
+WALLTIME_PAD = 300
+WALLTIME_ROUND = 300
+MIN_WALLTIME = 600
+MAX_WALLTIME = 8 * 3600
+
+
+def fit_linear(xs, ys):
+    """Least-squares fit of ys = base + per_unit * xs
+
+    Returns:
+        tuple: base, per_unit and the root-mean-square residual
+    """
+    n = len(xs)
+    mean_x, mean_y = sum(xs) / n, sum(ys) / n
+    var_x = sum((x - mean_x) ** 2 for x in xs)
+    per_unit = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / var_x if var_x else 0
+    base = mean_y - per_unit * mean_x
+    rms = math.sqrt(sum((base + per_unit * x - y) ** 2 for x, y in zip(xs, ys)) / n)
+    return base, per_unit, rms
+
+
+def fit_task(samples, min_samples=MIN_SAMPLES):
+    """Fits the runtime model of a task
+
+    Args:
+        samples (list): (walltime, grid_points, fcst_len_hrs) of each job
+        min_samples (int): Fewest jobs a model is fitted to
+    Returns:
+        dict: The "feature", "base", "per_unit", number of "samples" and
+              longest measured runtime ("max_runtime") of the model, or None
+              if there are too few jobs
+    """
+    best = None
+    for feature, func in FEATURES.items():
+        points = [(func(grid_points, fcst_len_hrs), walltime)
+                  for walltime, grid_points, fcst_len_hrs in samples
+                  if feature == "constant" or (grid_points and fcst_len_hrs is not None)]
+        if len(points) < min_samples:
+            continue
+        xs, ys = zip(*points)
+        if feature != "constant" and len(set(xs)) < 2:
+            continue
+        base, per_unit, rms = fit_linear(xs, ys)
+        if per_unit < 0:
+            continue
+        if best is None or rms < best["rms"] * (1 - MIN_FIT_IMPROVEMENT):
+            best = {"feature": feature, "base": base, "per_unit": per_unit, "rms": rms,
+                    "samples": len(points), "max_runtime": max(ys)}
+    if best is None:
+        return None
+    best.pop("rms")
+    return best
+
+
+def task_templates(wflow_dir):
+    """The tasks defined in the workflow YAML files of a directory
+
+    Returns:
+        list of (path, pattern, nnodes): the keys leading to the task in the
+        rocoto "tasks" section, a regular expression matching the names of
+        its expanded jobs, and its number of nodes if it is a plain number
+    """
+    templates = []
+
+    def walk(section, path):
+        for key, value in section.items():
+            if not isinstance(value, dict):
+                continue
+            if key.startswith("task_"):
+                pattern = "".join(".+" if i % 2 else re.escape(part)
+                                  for i, part in enumerate(key[5:].split("#")))
+                nnodes = value.get("nnodes")
+                templates.append((path + (key,), re.compile(pattern),
+                                  nnodes if isinstance(nnodes, int) else None))
+            elif key.startswith("metatask_"):
+                walk(value, path + (key,))
+
+    for wflow_file in sorted(glob.glob(os.path.join(wflow_dir, "*.yaml"))):
+        cfg = load_config_file(wflow_file)
+        # The rocoto section of the default workflow holds the cycledefs and
+        # entities, not tasks
+        if isinstance(cfg, dict) and "rocoto" not in cfg:
+            walk(cfg, ())
+    # Tasks with the most specific names (the longest without their #var#s,
+    # then the fewest #var#s) are matched first
+    templates.sort(key=lambda template: (-len(re.sub(r"#[^#]*#", "", template[0][-1])),
+                                         template[0][-1].count("#")))
+    return templates
+
+
+def fit_sizing(history, wflow_dir, min_samples=MIN_SAMPLES):
+    """Fits the runtime models of the tasks of the workflow YAML files from
+    the jobs in a runtime history
+
+    Returns:
+        dict: The sizing settings, laid out like the rocoto "tasks" section
+    """
+    templates = task_templates(wflow_dir)
+    samples = {}
+    nodes = {}
+    for task, walltime, task_nodes, grid_points, fcst_len_hrs in history.task_runs():
+        for path, pattern, _ in templates:
+            if pattern.fullmatch(task):
+                samples.setdefault(path, []).append((walltime, grid_points, fcst_len_hrs))
+                nodes.setdefault(path, set()).add(task_nodes)
+                break
+
+    sizing = {}
+    for path, _, nnodes in templates:
+        model = fit_task(samples.get(path, []), min_samples)
+        if model is None:
+            continue
+        # Only tasks whose measured jobs all ran on their default number of
+        # nodes can be scaled to more nodes
+        if nnodes is not None and nodes[path] == {nnodes}:
+            model["nodes"] = nnodes
+        section = sizing
+        for key in path:
+            section = section.setdefault(key, {})
+        section["sizing"] = model
+    return sizing
+
+
+def format_walltime(seconds):
+    """A walltime in seconds as HH:MM:SS"""
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def size_task(model, grid_points, fcst_len_hrs):
+    """The walltime, and the number of nodes (None if unchanged), of a task
+    for an experiment
+
+    Args:
+        model         (dict): The runtime model of the task, see fit_task()
+        grid_points    (int): Number of points of the experiment's grid
+        fcst_len_hrs (float): Length of the experiment's longest forecast
+    Returns:
+        tuple: walltime as HH:MM:SS, and number of nodes or None
+    """
+    runtime = model["base"] + model["per_unit"] * FEATURES[model["feature"]](
+        grid_points, fcst_len_hrs)
+    runtime = max(runtime, 0)
+    nodes = None
+    walltime = runtime * WALLTIME_FACTOR + WALLTIME_PAD
+    if walltime > MAX_WALLTIME and model.get("nodes"):
+        nodes = math.ceil(model["nodes"] * walltime / MAX_WALLTIME)
+        walltime = runtime * model["nodes"] / nodes * WALLTIME_FACTOR + WALLTIME_PAD
+    walltime = math.ceil(walltime / WALLTIME_ROUND) * WALLTIME_ROUND
+    walltime = min(max(walltime, MIN_WALLTIME), MAX_WALLTIME)
+    return format_walltime(walltime), nodes
+
+
+def apply_task_sizing(rocoto_tasks, sizing, grid_points, fcst_len_hrs, protected=None):
+    """Sets the walltimes (and numbers of nodes) of the tasks of an
+    experiment from a sizing file
+
+    Args:
+        rocoto_tasks  (dict): The rocoto "tasks" section, updated in place
+        sizing        (dict): The sizing settings, see fit_sizing()
+        grid_points    (int): Number of points of the experiment's grid
+        fcst_len_hrs (float): Length of the experiment's longest forecast
+        protected     (dict): Settings of the "tasks" section that are kept,
+                              e.g. those of the user configuration
+    Returns:
+        list of the names of the tasks that were sized
+    """
+    protected = protected if isinstance(protected, dict) else {}
+    sized = []
+    for key, settings in sizing.items():
+        task = rocoto_tasks.get(key)
+        if not isinstance(task, dict) or not isinstance(settings, dict):
+            continue
+        kept = protected.get(key) if isinstance(protected.get(key), dict) else {}
+        if "sizing" in settings:
+            walltime, nodes = size_task(settings["sizing"], grid_points, fcst_len_hrs)
+            if "walltime" not in kept:
+                task["walltime"] = walltime
+            if nodes and "nnodes" not in kept:
+                task["nnodes"] = nodes
+            sized.append(key)
+        else:
+            sized.extend(apply_task_sizing(task, settings, grid_points, fcst_len_hrs, kept))
+    return sized
+
+
+def parse_args(argv):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(
+        description="Fit the runtimes of workflow tasks and write a sizing file."
+    )
+    parser.add_argument(
+        "--db",
+        default=DEFAULT_HISTORY_DB,
+        help="Path to the runtime history database.",
+    )
+    parser.add_argument(
+        "--record",
+        nargs="+",
+        default=[],
+        metavar="EXPTDIR",
+        help="Experiment directories to record in the history first.",
+    )
+    parser.add_argument(
+        "--min-samples",
+        dest="min_samples",
+        type=int,
+        default=MIN_SAMPLES,
+        help="Fewest jobs of a task needed to size it.",
+    )
+    parser.add_argument(
+        "-o", "--output",
+        required=True,
+        help="The sizing file to write.",
+    )
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    args = parse_args(sys.argv[1:])
+    parm_wflow = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                              "parm", "wflow")
+    with RuntimeHistory(args.db) as hist:
+        for expt in args.record:
+            record_experiment(hist, expt)
+        sizing_cfg = fit_sizing(hist, parm_wflow, args.min_samples)
+    with open(args.output, "w", encoding="utf-8") as f:
+        f.write(dedent(
+            f"""\
+            # Runtime models of workflow tasks, fitted from {args.db}
+            # by task_sizing.py; set TASK_SIZING_FP to this file to use them.
+            """))
+        f.write(cfg_to_yaml_str(sizing_cfg))
+    logging.info(f"Wrote {args.output}")
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+
+"""
+Compiled Jinja templates for the files of the forecast run directories. Each
+template is compiled once and the bytecode is cached in the experiment
+directory, so that the forecast tasks of all cycles and members render from
+the compiled form instead of parsing the template from parm/ every time.
+Rendering matches uwtools render: undefined variables are errors, the
+path_join and env filters are available, and the output ends with a newline.
+
+Files that depend only on the experiment configuration and the cycle can be
+rendered for all cycles when the experiment is generated:
+
+    python3 template_store.py --path-to-defns var_defns.yaml
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import sys
+import threading
+from datetime import datetime
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, StrictUndefined
+
+from python_utils import load_yaml_config
+from set_cycle_dates import all_cycle_dates
+
+TEMPLATE_CACHE_DIRNAME = ".template_cache"
+PRERENDER_DIRNAME = "prerendered"
+MAX_PRERENDER_CYCLES = 2000
+
+
+class TemplateStore:
+    """Compiles templates once and renders them from the compiled form
+
+    Args:
+        cache_dir (str): Directory for the bytecode cache shared between
+                         processes; without it, templates are only cached in
+                         memory
+    """
+
+    def __init__(self, cache_dir=None):
+        self.bytecode_cache = None
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+        self._envs = {}
+        self._lock = threading.Lock()
+
+    def _env(self, template_dir):
+        """The Jinja environment loading templates from a directory"""
+
+        with self._lock:
+            if template_dir not in self._envs:
+                env = Environment(
+                    loader=FileSystemLoader(template_dir),
+                    undefined=StrictUndefined,
+                    bytecode_cache=self.bytecode_cache,
+                )
+                env.filters["path_join"] = lambda args: os.path.join(*args)
+                env.filters["env"] = lambda var: os.environ[var]
+                self._envs[template_dir] = env
+            return self._envs[template_dir]
+
+    def get_template(self, template_fp):
+        """The compiled template; it is recompiled only if the file changed"""
+
+        template_fp = os.path.abspath(template_fp)
+        env = self._env(os.path.dirname(template_fp))
+        return env.get_template(os.path.basename(template_fp))
+
+    def render(self, template_fp, values, output_file=None):
+        """Renders a template
+
+        Args:
+            template_fp  (str): The template file
+            values      (dict): Values of the template variables
+            output_file  (str): If given, the rendered text is written there
+        Returns:
+            str: The rendered text
+        """
+
+        text = self.get_template(template_fp).render(values) + "\n"
+        if output_file:
+            with open(output_file, "w", encoding="utf-8") as f:
+                f.write(text)
+        return text
+
+
+_STORES = {}
+
+
+def get_store(exptdir=None):
+    """The template store of an experiment, with its bytecode cache in the
+    experiment directory"""
+
+    cache_dir = os.path.join(exptdir, TEMPLATE_CACHE_DIRNAME) if exptdir else None
+    if cache_dir not in _STORES:
+        _STORES[cache_dir] = TemplateStore(cache_dir)
+    return _STORES[cache_dir]
+
+
+def render_template(template_fp, output_file, values, exptdir=None):
+    """Renders a template file to an output file like uwtools render does,
+    from the compiled template of the experiment's template store
+
+    Args:
+        template_fp  (str): The template file
+        output_file  (str): The file to create
+        values      (dict): Values of the template variables
+        exptdir      (str): The experiment directory holding the bytecode cache
+    """
+
+    get_store(exptdir).render(template_fp, values, output_file)
+
+
+def prerendered_fp(exptdir, fn, cdate=None):
+    """Path of a file rendered when the experiment was generated, either for a
+    cycle (YYYYMMDDHH) or for all cycles"""
+
+    parts = [exptdir, PRERENDER_DIRNAME] + ([cdate] if cdate else []) + [fn]
+    return os.path.join(*parts)
+
+
+def prerender_cycle_files(expt_config, cycles):
+    """Renders the run directory files that depend only on the experiment
+    configuration and the cycle: the diag_table of each cycle (if the grid
+    resolution is already known) and the ufs.configure file.  The forecast
+    tasks copy these files instead of rendering them.
+
+    Args:
+        expt_config (dict): The experiment configuration
+        cycles      (list): Cycles as YYYYMMDDHH strings
+    Returns:
+        list of the files written
+    """
+
+    workflow = expt_config["workflow"]
+    exptdir = workflow["EXPTDIR"]
+    store = get_store(exptdir)
+    paths = []
+
+    # Files of an earlier generation may no longer be valid
+    shutil.rmtree(os.path.join(exptdir, PRERENDER_DIRNAME), ignore_errors=True)
+    os.makedirs(os.path.join(exptdir, PRERENDER_DIRNAME))
+
+    # Without pregenerated grid files, CRES is only known once the grid is made
+    if not workflow.get("RES_IN_FIXLAM_FILENAMES") or len(cycles) > MAX_PRERENDER_CYCLES:
+        cycles = []
+    for cdate in cycles:
+        path = prerendered_fp(exptdir, workflow["DIAG_TABLE_FN"], cdate)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        store.render(
+            workflow["DIAG_TABLE_TMPL_FP"],
+            {"starttime": datetime.strptime(cdate, "%Y%m%d%H"), "cres": workflow["CRES"]},
+            path,
+        )
+        paths.append(path)
+
+    path = prerendered_fp(exptdir, workflow["UFS_CONFIG_FN"])
+    store.render(
+        workflow["UFS_CONFIG_TMPL_FP"],
+        {
+            "dt_atmos": expt_config["task_run_fcst"]["DT_ATMOS"],
+            "print_esmf": expt_config["task_run_fcst"]["PRINT_ESMF"],
+            "cpl_aqm": expt_config["cpl_aqm_parm"]["CPL_AQM"],
+        },
+        path,
+    )
+    paths.append(path)
+    logging.info(f"Rendered {len(paths)} run directory files ahead of the forecasts")
+    return paths
+
+
+def parse_args(argv):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(
+        description="Render the run directory files of all cycles of an experiment."
+    )
+    parser.add_argument(
+        "-p", "--path-to-defns",
+        dest="path_to_defns",
+        required=True,
+        help="Path to var_defns file.",
+    )
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    args = parse_args(sys.argv[1:])
+    cfg = load_yaml_config(args.path_to_defns)
+    prerender_cycle_files(cfg, all_cycle_dates(cfg))
@@ -9,13 +9,12 @@ import os
 import sys
 from textwrap import dedent
 
-from uwtools.api.config import get_nml_config, realize
-
 from python_utils import (
     print_input_args,
     print_info_msg,
     cfg_to_yaml_str,
 )
+from nml_patch import patch_nml_file
 
 VERBOSE = os.environ.get("VERBOSE", "true")
 
@@ -72,13 +71,7 @@ def update_input_nml(namelist, restart, aqm_na_13km):
     )
 
     # Update the experiment's FV3 INPUT.NML file
-    realize(
-        input_config=namelist,
-        input_format="nml",
-        output_file=namelist,
-        output_format="nml",
-        update_config=get_nml_config(settings),
-        )
+    patch_nml_file(namelist, settings)
 
 def parse_args(argv):
     """Parse command line arguments"""
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+"""
+Record of the artifacts staged in an experiment directory by
+generate_FV3LAM_wflow, together with a hash of the inputs each of them was
+produced from. When an experiment is regenerated with
+PREEXISTING_DIR_METHOD = "update", a staging step is skipped if its inputs
+hash to the same value as last time and all of its outputs still exist.
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import os
+import sys
+
+from python_utils import cfg_to_yaml_str, load_config_file
+
+MANIFEST_FN = "wflow_manifest.yaml"
+
+# Files larger than this are fingerprinted by size and modification time
+# rather than by content, so that checking staged fix files stays cheap.
+CONTENT_HASH_MAX_BYTES = 1 << 20
+
+
+def file_signature(path):
+    """Returns a string that changes whenever the given file does
+
+    Args:
+        path (str): Path to a file or directory
+    Returns:
+        str: Content hash for small files, size and modification time for
+             large files, and "missing" if the path does not exist
+    """
+
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return "missing"
+    if not os.path.isfile(path) or stat.st_size > CONTENT_HASH_MAX_BYTES:
+        return f"{stat.st_size}:{stat.st_mtime_ns}"
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def inputs_hash(input_files=(), settings=None, outputs=()):
+    """Hashes the input files, settings and output paths of a staging step
+
+    Args:
+        input_files (list): Paths (or glob patterns) of files read by the step
+        settings    (dict): Any other values the outputs depend on
+        outputs     (list): Paths of the files or directories the step creates
+    Returns:
+        str: Hex digest identifying the inputs
+    """
+
+    sha = hashlib.sha256()
+    sha.update(
+        json.dumps([settings, list(outputs)], sort_keys=True, default=str).encode()
+    )
+    for pattern in input_files:
+        paths = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        for path in paths:
+            sha.update(f"{path}={file_signature(path)}\n".encode())
+    return sha.hexdigest()
+
+
+class StagingManifest:
+    """Manifest of the staging steps performed in an experiment directory
+
+    Args:
+        exptdir  (str): The experiment directory
+        update  (bool): Whether steps that are up to date may be skipped; if
+                        False every step is reported as out of date, but the
+                        manifest is still written for later updates
+    """
+
+    def __init__(self, exptdir, update=False):
+        self.path = os.path.join(exptdir, MANIFEST_FN)
+        self.update = update
+        self.steps = {}
+        if update and os.path.exists(self.path):
+            self.steps = load_config_file(self.path).get("steps") or {}
+        self.skipped = []
+
+    def is_current(self, name, input_files=(), settings=None, outputs=()):
+        """Whether a step can be skipped because it was already performed with
+        the same inputs and all of its outputs still exist"""
+
+        if not self.update:
+            return False
+        step = self.steps.get(name)
+        if not step or step.get("inputs") != inputs_hash(input_files, settings, outputs):
+            return False
+        if not all(os.path.lexists(out) for out in outputs):
+            return False
+        self.skipped.append(name)
+        logging.debug(f"Staging step {name} is up to date; skipping")
+        return True
+
+    def record(self, name, input_files=(), settings=None, outputs=()):
+        """Records a completed step and rewrites the manifest file"""
+
+        self.steps[name] = {
+            "inputs": inputs_hash(input_files, settings, outputs),
+            "outputs": list(outputs),
+        }
+        self.write()
+
+    def write(self):
+        """Writes the manifest to the experiment directory"""
+
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(cfg_to_yaml_str({"steps": self.steps}))
+
+
+def stale_steps(exptdir):
+    """Lists the recorded steps whose outputs have gone missing
+
+    Args:
+        exptdir (str): The experiment directory
+    Returns:
+        list: Names of steps with at least one missing output
+    """
+
+    manifest = StagingManifest(exptdir, update=True)
+    return [
+        name
+        for name, step in manifest.steps.items()
+        if not all(os.path.lexists(out) for out in step.get("outputs", []))
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Report the staging steps recorded for an experiment directory."
+    )
+    parser.add_argument("exptdir", help="Experiment directory")
+    args = parser.parse_args()
+
+    steps = StagingManifest(args.exptdir, update=True).steps
+    missing = stale_steps(args.exptdir)
+    for step_name, step_vals in steps.items():
+        status = "missing outputs" if step_name in missing else "ok"
+        print(f"{step_name:30s} {step_vals['inputs'][:12]}  {status}")
+    sys.exit(1 if missing else 0)